@@ -1,10 +1,10 @@
+import re
 from logging.config import fileConfig
 
-from sqlalchemy import engine_from_config
-from sqlalchemy import pool
+from sqlalchemy import engine_from_config, pool
 
-from poppy.db.models import Base
 from alembic import context
+from poppy.db.models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -19,6 +19,26 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 target_metadata = Base.metadata
 
+
+EVENTS_PARTITION_PATTERN = re.compile(r"events_(y\d{4}m\d{2}|default)")
+# Created at runtime by `poppy index meta KEY`, unlike `ix_events_meta` itself
+META_INDEX_PATTERN = re.compile(r"ix_events_meta_\w+")
+
+
+def include_name(name: str | None, type_: str, parent_names: dict[str, str | None]) -> bool:
+    """Leave the partitions of `events` and the indexes on meta keys out of autogenerate.
+
+    They are managed by `poppy.services.partitions` and `poppy.services.meta_filters`.
+    """
+    if type_ == "table":
+        return name is None or not EVENTS_PARTITION_PATTERN.fullmatch(name)
+    if type_ == "index":
+        return not EVENTS_PARTITION_PATTERN.fullmatch(parent_names["table_name"]) and not (
+            name is not None and META_INDEX_PATTERN.fullmatch(name)
+        )
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -41,6 +61,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -64,7 +85,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_name=include_name
         )
 
         with context.begin_transaction():
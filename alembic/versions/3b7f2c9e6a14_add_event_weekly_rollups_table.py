@@ -0,0 +1,155 @@
+"""add event weekly rollups table
+
+Revision ID: 3b7f2c9e6a14
+Revises: 9d42d4b1ca21
+Create Date: 2026-10-18 11:02:17.284930
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3b7f2c9e6a14"
+down_revision: str | Sequence[str] | None = "9d42d4b1ca21"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# Functions and triggers maintaining the rollups, as of this revision
+ROLLUPS_DDL = (
+    """
+CREATE OR REPLACE FUNCTION jsonb_sum_counts(a jsonb, b jsonb) RETURNS jsonb
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}')
+    FROM (
+        SELECT key, sum(value::bigint) AS total
+        FROM (SELECT * FROM jsonb_each_text(a) UNION ALL SELECT * FROM jsonb_each_text(b)) AS counts
+        GROUP BY key
+        HAVING sum(value::bigint) <> 0
+    ) AS sums
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_apply(changed events[], sign integer) RETURNS void
+LANGUAGE sql AS $$
+    WITH changed_events AS (
+        SELECT date_trunc('week', created_at, 'UTC') AS week_start, kind, completed_at, tags FROM unnest(changed)
+    ),
+    counts AS (
+        SELECT week_start, kind, count(*) AS event_count, count(completed_at) AS completed_count
+        FROM changed_events
+        GROUP BY week_start, kind
+    ),
+    tag_counts AS (
+        SELECT week_start, kind, jsonb_object_agg(tag, sign * tag_count) AS tag_counts
+        FROM (
+            SELECT week_start, kind, tag, count(*) AS tag_count
+            FROM changed_events, unnest(tags) AS tag
+            GROUP BY week_start, kind, tag
+        ) AS per_tag
+        GROUP BY week_start, kind
+    )
+    INSERT INTO event_weekly_rollups AS rollup (week_start, kind, event_count, completed_count, tag_counts)
+    SELECT week_start, kind, sign * event_count, sign * completed_count, COALESCE(tag_counts, '{}')
+    FROM counts LEFT JOIN tag_counts USING (week_start, kind)
+    -- Concurrent statements lock the rollups in the same order, so they cannot deadlock
+    ORDER BY week_start, kind
+    ON CONFLICT (week_start, kind) DO UPDATE SET
+        event_count = rollup.event_count + excluded.event_count,
+        completed_count = rollup.completed_count + excluded.completed_count,
+        tag_counts = jsonb_sum_counts(rollup.tag_counts, excluded.tag_counts)
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT new_row::events FROM new_rows AS new_row), 1);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT old_row::events FROM old_rows AS old_row), -1);
+    ELSE
+        -- Only the updates which change what the rollups count, e.g. not the edits of the text
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT old_row::events FROM old_rows AS old_row JOIN new_rows AS new_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), -1);
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT new_row::events FROM new_rows AS new_row JOIN old_rows AS old_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), 1);
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_insert AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_update AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_delete AFTER DELETE ON events
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table("event_weekly_rollups",
+    sa.Column("week_start", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("kind", sa.String(length=32), nullable=False),
+    sa.Column("event_count", sa.BigInteger(), nullable=False),
+    sa.Column("completed_count", sa.BigInteger(), nullable=False),
+    sa.Column("tag_counts", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.PrimaryKeyConstraint("week_start", "kind")
+    )
+    for statement in ROLLUPS_DDL:
+        op.execute(statement)
+    # Backfill the rollups of the existing events, the triggers keep them up to date from now on
+    op.execute("LOCK TABLE events IN SHARE MODE")
+    op.execute("""
+        WITH weekly_events AS (
+            SELECT date_trunc('week', created_at, 'UTC') AS week_start, kind, completed_at, tags FROM events
+        ),
+        counts AS (
+            SELECT week_start, kind, count(*) AS event_count, count(completed_at) AS completed_count
+            FROM weekly_events
+            GROUP BY week_start, kind
+        ),
+        tag_counts AS (
+            SELECT week_start, kind, jsonb_object_agg(tag, tag_count) AS tag_counts
+            FROM (
+                SELECT week_start, kind, tag, count(*) AS tag_count
+                FROM weekly_events, unnest(tags) AS tag
+                GROUP BY week_start, kind, tag
+            ) AS per_tag
+            GROUP BY week_start, kind
+        )
+        INSERT INTO event_weekly_rollups (week_start, kind, event_count, completed_count, tag_counts)
+        SELECT week_start, kind, event_count, completed_count, COALESCE(tag_counts, '{}')
+        FROM counts LEFT JOIN tag_counts USING (week_start, kind)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER event_weekly_rollups_delete ON events")
+    op.execute("DROP TRIGGER event_weekly_rollups_update ON events")
+    op.execute("DROP TRIGGER event_weekly_rollups_insert ON events")
+    op.execute("DROP FUNCTION event_weekly_rollups_trigger()")
+    op.execute("DROP FUNCTION event_weekly_rollups_apply(events[], integer)")
+    op.execute("DROP FUNCTION jsonb_sum_counts(jsonb, jsonb)")
+    op.drop_table("event_weekly_rollups")
@@ -0,0 +1,214 @@
+"""partition events by month of created_at
+
+Revision ID: 6e1d0a8f3c52
+Revises: 3b7f2c9e6a14
+Create Date: 2026-10-18 13:26:40.118702
+
+"""
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6e1d0a8f3c52"
+down_revision: str | Sequence[str] | None = "3b7f2c9e6a14"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+EVENT_COLUMNS = "id, created_at, kind, text, why, source, tags, meta, due_at, completed_at"
+MONTHS_AHEAD = 3
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english'::regconfig, text), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, COALESCE(why, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, events_tags_to_text(tags)), 'C')"
+)
+INDEXES = ('ix_events_kind', 'ix_events_source', 'ix_events_created_at_id', 'ix_events_pending_actions',
+           'ix_events_tags', 'ix_events_meta', 'ix_events_search_vector')
+# The rollup functions and triggers of 3b7f2c9e6a14, bound to the row type of the table being replaced
+ROLLUPS_DDL = (
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_apply(changed events[], sign integer) RETURNS void
+LANGUAGE sql AS $$
+    WITH changed_events AS (
+        SELECT date_trunc('week', created_at, 'UTC') AS week_start, kind, completed_at, tags FROM unnest(changed)
+    ),
+    counts AS (
+        SELECT week_start, kind, count(*) AS event_count, count(completed_at) AS completed_count
+        FROM changed_events
+        GROUP BY week_start, kind
+    ),
+    tag_counts AS (
+        SELECT week_start, kind, jsonb_object_agg(tag, sign * tag_count) AS tag_counts
+        FROM (
+            SELECT week_start, kind, tag, count(*) AS tag_count
+            FROM changed_events, unnest(tags) AS tag
+            GROUP BY week_start, kind, tag
+        ) AS per_tag
+        GROUP BY week_start, kind
+    )
+    INSERT INTO event_weekly_rollups AS rollup (week_start, kind, event_count, completed_count, tag_counts)
+    SELECT week_start, kind, sign * event_count, sign * completed_count, COALESCE(tag_counts, '{}')
+    FROM counts LEFT JOIN tag_counts USING (week_start, kind)
+    -- Concurrent statements lock the rollups in the same order, so they cannot deadlock
+    ORDER BY week_start, kind
+    ON CONFLICT (week_start, kind) DO UPDATE SET
+        event_count = rollup.event_count + excluded.event_count,
+        completed_count = rollup.completed_count + excluded.completed_count,
+        tag_counts = jsonb_sum_counts(rollup.tag_counts, excluded.tag_counts)
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT new_row::events FROM new_rows AS new_row), 1);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT old_row::events FROM old_rows AS old_row), -1);
+    ELSE
+        -- Only the updates which change what the rollups count, e.g. not the edits of the text
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT old_row::events FROM old_rows AS old_row JOIN new_rows AS new_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), -1);
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT new_row::events FROM new_rows AS new_row JOIN old_rows AS old_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), 1);
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_insert AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_update AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_delete AFTER DELETE ON events
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+)
+
+
+def drop_rollup_triggers() -> None:
+    """Drop the triggers maintaining `event_weekly_rollups`, which are attached to the table being replaced."""
+    op.execute("DROP TRIGGER event_weekly_rollups_delete ON events")
+    op.execute("DROP TRIGGER event_weekly_rollups_update ON events")
+    op.execute("DROP TRIGGER event_weekly_rollups_insert ON events")
+    op.execute("DROP FUNCTION event_weekly_rollups_trigger()")
+    op.execute("DROP FUNCTION event_weekly_rollups_apply(events[], integer)")
+
+
+def create_events_table(name: str, primary_key: tuple[str, ...], **kwargs: Any) -> None:
+    """Create the `events` table as `name`, `kwargs` being the table options such as `postgresql_partition_by`."""
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('events_id_seq'::regclass)"), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('why', sa.Text(), nullable=True),
+    sa.Column('source', sa.String(length=64), nullable=True),
+    sa.Column('tags', postgresql.ARRAY(sa.String(length=64)), nullable=False),
+    sa.Column('meta', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('due_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR_EXPRESSION, persisted=True), nullable=False),
+    sa.PrimaryKeyConstraint(*primary_key, name='events_pkey'),
+    **kwargs,
+    )
+
+
+def create_indexes() -> None:
+    """Create the indexes of `events`, on a partitioned table they are also created on every partition."""
+    op.create_index('ix_events_kind', 'events', ['kind'], unique=False)
+    op.create_index('ix_events_source', 'events', ['source'], unique=False)
+    op.create_index('ix_events_created_at_id', 'events', ['created_at', 'id'], unique=False)
+    op.create_index('ix_events_pending_actions', 'events', ['created_at', 'id'], unique=False, postgresql_where=sa.text("kind = 'action' AND due_at IS NOT NULL AND completed_at IS NULL"))
+    op.create_index('ix_events_tags', 'events', ['tags'], unique=False, postgresql_using='gin')
+    op.create_index('ix_events_meta', 'events', ['meta'], unique=False, postgresql_using='gin', postgresql_ops={'meta': 'jsonb_path_ops'})
+    op.create_index('ix_events_search_vector', 'events', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    """Return the start of the UTC month of `moment`, moved by `months` months."""
+    moment = moment.astimezone(UTC)
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=UTC)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    drop_rollup_triggers()
+    op.rename_table('events', 'events_unpartitioned')
+    for index in INDEXES:
+        op.drop_index(index, table_name='events_unpartitioned')
+    op.drop_constraint('events_pkey', 'events_unpartitioned', type_='primary')
+    # The partition key must be part of the primary key
+    create_events_table('events', ('id', 'created_at'), postgresql_partition_by='RANGE (created_at)')
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+    # One partition per month, from the oldest event to a few months ahead
+    now = datetime.now(UTC)
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM events_unpartitioned")).scalar() or now
+    month, last = month_start(oldest), month_start(now, MONTHS_AHEAD)
+    partitions = []
+    while month <= last:
+        name = f"events_y{month.year:04d}m{month.month:02d}"
+        op.execute(
+            f"CREATE TABLE {name} PARTITION OF events "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')"
+        )
+        partitions.append(name)
+        month = month_start(month, 1)
+    # The columns are a constant of this migration, not user input
+    op.execute(f"INSERT INTO events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events_unpartitioned")  # noqa: S608
+    op.drop_table('events_unpartitioned')
+
+    # Built once the events are copied, the index of each partition is named after the one of `events`
+    create_indexes()
+    for name in [*partitions, 'events_default']:
+        indexes = op.get_bind().execute(sa.text(
+            "SELECT child.relname, parent.relname FROM pg_index AS i "
+            "JOIN pg_class AS child ON child.oid = i.indexrelid "
+            "JOIN pg_inherits AS inh ON inh.inhrelid = child.oid "
+            "JOIN pg_class AS parent ON parent.oid = inh.inhparent "
+            "WHERE i.indrelid = CAST(:name AS regclass) AND parent.relname LIKE 'ix_events_%'"
+        ), {"name": name}).all()
+        for index_name, parent_index_name in indexes:
+            op.execute(f'ALTER INDEX "{index_name}" RENAME TO "{parent_index_name.replace("ix_events_", f"ix_{name}_", 1)}"')
+
+    for statement in ROLLUPS_DDL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_rollup_triggers()
+    op.rename_table('events', 'events_partitioned')
+    for index in INDEXES:
+        op.drop_index(index, table_name='events_partitioned')
+    op.drop_constraint('events_pkey', 'events_partitioned', type_='primary')
+    create_events_table('events', ('id',))
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute(f"INSERT INTO events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events_partitioned")  # noqa: S608
+    # Also drops the partitions, the detached ones are left in their archive schema
+    op.drop_table('events_partitioned')
+    create_indexes()
+    for statement in ROLLUPS_DDL:
+        op.execute(statement)
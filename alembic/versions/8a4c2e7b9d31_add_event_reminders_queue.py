@@ -0,0 +1,104 @@
+"""add event reminders queue
+
+Revision ID: 8a4c2e7b9d31
+Revises: 6e1d0a8f3c52
+Create Date: 2026-10-18 15:08:52.640213
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8a4c2e7b9d31"
+down_revision: str | Sequence[str] | None = "6e1d0a8f3c52"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# Function and triggers scheduling the reminders, as of this revision
+REMINDERS_DDL = (
+    """
+CREATE OR REPLACE FUNCTION event_reminders_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO event_reminders (event_id, event_created_at, remind_at)
+        SELECT id, created_at, due_at FROM new_rows
+        WHERE due_at >= now() AND completed_at IS NULL
+        ON CONFLICT (event_id) DO NOTHING;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM event_reminders AS reminder USING old_rows AS old_row WHERE reminder.event_id = old_row.id;
+    ELSE
+        -- Completed events and events without a due date are not reminded anymore
+        DELETE FROM event_reminders AS reminder USING new_rows AS new_row
+        WHERE reminder.event_id = new_row.id AND (new_row.due_at IS NULL OR new_row.completed_at IS NOT NULL);
+        -- A new due date schedules a new reminder, even if the previous one was fired
+        INSERT INTO event_reminders AS reminder (event_id, event_created_at, remind_at)
+        SELECT new_row.id, new_row.created_at, new_row.due_at
+        FROM new_rows AS new_row JOIN old_rows AS old_row USING (id)
+        WHERE new_row.due_at IS NOT NULL AND new_row.completed_at IS NULL
+            AND (new_row.due_at IS DISTINCT FROM old_row.due_at OR old_row.completed_at IS NOT NULL)
+        ON CONFLICT (event_id) DO UPDATE SET
+            event_created_at = excluded.event_created_at,
+            remind_at = excluded.remind_at,
+            attempts = 0,
+            last_error = NULL,
+            failed_at = NULL;
+        -- Follow the events moved to another partition
+        UPDATE event_reminders AS reminder SET event_created_at = new_row.created_at
+        FROM new_rows AS new_row
+        WHERE reminder.event_id = new_row.id AND reminder.event_created_at <> new_row.created_at;
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+    """
+CREATE TRIGGER event_reminders_insert AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+    """
+CREATE TRIGGER event_reminders_update AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+    """
+CREATE TRIGGER event_reminders_delete AFTER DELETE ON events
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('event_reminders',
+    sa.Column('event_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('event_created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('remind_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.create_index('ix_event_reminders_remind_at', 'event_reminders', ['remind_at'], unique=False, postgresql_where=sa.text('failed_at IS NULL'))
+    for statement in REMINDERS_DDL:
+        op.execute(statement)
+    # Schedule the reminders of the pending events which are not due yet
+    op.execute(
+        "INSERT INTO event_reminders (event_id, event_created_at, remind_at) "
+        "SELECT id, created_at, due_at FROM events WHERE due_at >= now() AND completed_at IS NULL"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER event_reminders_delete ON events")
+    op.execute("DROP TRIGGER event_reminders_update ON events")
+    op.execute("DROP TRIGGER event_reminders_insert ON events")
+    op.execute("DROP FUNCTION event_reminders_trigger()")
+    op.drop_index('ix_event_reminders_remind_at', table_name='event_reminders', postgresql_where=sa.text('failed_at IS NULL'))
+    op.drop_table('event_reminders')
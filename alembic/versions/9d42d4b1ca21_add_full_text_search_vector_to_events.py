@@ -0,0 +1,48 @@
+"""add full text search vector to events
+
+Revision ID: 9d42d4b1ca21
+Revises: efe44cfafae8
+Create Date: 2026-10-18 09:12:41.503318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d42d4b1ca21'
+down_revision: Union[str, Sequence[str], None] = 'efe44cfafae8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # `array_to_string` is only STABLE, while generated columns can only use IMMUTABLE functions
+    op.execute(
+        "CREATE OR REPLACE FUNCTION events_tags_to_text(tags varchar[]) RETURNS text "
+        "LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT array_to_string(tags, ' ') $$"
+    )
+    # Rewrites the table to compute the vector of the existing events
+    op.add_column('events', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english'::regconfig, text), 'A') || "
+            "setweight(to_tsvector('english'::regconfig, COALESCE(why, '')), 'B') || "
+            "setweight(to_tsvector('english'::regconfig, events_tags_to_text(tags)), 'C')",
+            persisted=True,
+        ),
+        nullable=False,
+    ))
+    op.create_index('ix_events_search_vector', 'events', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_search_vector', table_name='events', postgresql_using='gin')
+    op.drop_column('events', 'search_vector')
+    op.execute("DROP FUNCTION events_tags_to_text(varchar[])")
@@ -0,0 +1,162 @@
+"""Micro-benchmarks of the functions of `poppy.services.event_handlers`, on the events already in the DB.
+
+Load the events first with `benchmarks/synthetic.py`. The parameters of the benchmarks (the week, the ids,
+the tags) are picked from the loaded events, so that every run on the same dataset does the same work.
+Each function is called `--warmup` times, then timed `--repeat` times, each time in a new session. The
+writes run in a savepoint which is rolled back after each call: the DB is left untouched.
+
+The results are written as JSON to `--output`, and compared to `--baseline` if given, see `results.py`.
+The exit status is 1 if a benchmark regressed by more than `--threshold`.
+
+Usage: DATABASE_URL=postgresql+psycopg://... python benchmarks/bench_event_handlers.py [--repeat 50]
+    [--only list_week] [--output benchmarks/runs/event_handlers.json] [--baseline baseline.json]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from results import (
+    DEFAULT_THRESHOLD,
+    Metrics,
+    compare,
+    environment,
+    latency_metrics,
+    write_results,
+)
+from sqlalchemy import Connection, create_engine, func, select
+from sqlalchemy.orm import Session
+from synthetic import HOT_TAGS, tag_names
+
+from poppy.core.events import EventCreate, EventKind, TagMatch
+from poppy.core.settings import get_database_url
+from poppy.db.models import Event
+from poppy.services import event_handlers
+from poppy.services.utils import encode_cursor, week_bounds
+
+BATCH = 100
+DEFAULT_OUTPUT = Path(__file__).parent / "runs" / "event_handlers.json"
+
+Benchmark = Callable[[Session], Any]
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """The parameters of the benchmarks, picked from the loaded events."""
+
+    newest: datetime
+    middle: tuple[datetime, int]
+    event_id: int
+    pending_ids: list[int]
+    ids: list[int]
+
+    @classmethod
+    def pick(cls, session: Session) -> Dataset:
+        """Pick the parameters in `session`, deterministically."""
+        newest, count = session.execute(select(func.max(Event.created_at), func.count())).one()
+        if not count:
+            sys.exit("No events, load them first with benchmarks/synthetic.py")
+        ids = list(session.scalars(select(Event.id).order_by(Event.id).offset(count // 2).limit(BATCH)))
+        middle = session.execute(select(Event.created_at, Event.id).where(Event.id == ids[0])).one()
+        pending_ids = list(
+            session.scalars(
+                select(Event.id).where(Event.kind == EventKind.action.value, Event.completed_at.is_(None)).order_by(Event.id.desc()).limit(BATCH)
+            )
+        )
+        return cls(newest=newest, middle=tuple(middle), event_id=ids[0], pending_ids=pending_ids, ids=ids)
+
+
+def read_benchmarks(data: Dataset) -> dict[str, Benchmark]:
+    """Return the benchmarks of the functions which only read."""
+    week = data.newest.date()
+    rare_tags = tag_names()[-3:]
+    return {
+        "get_event_by_id": lambda s: event_handlers.get_event_by_id(s, data.event_id),
+        "list_events_between[1 day]": lambda s: event_handlers.list_events_between(s, data.newest - timedelta(days=1), data.newest),
+        "list_events_by_tags[hot, 100]": lambda s: event_handlers.list_events_by_tags(s, [HOT_TAGS[0]], limit=BATCH),
+        "list_events_by_tags[any rare]": lambda s: event_handlers.list_events_by_tags(s, rare_tags, match=TagMatch.any, limit=BATCH),
+        "list_events_page[first]": event_handlers.list_events_page,
+        "list_events_page[deep]": lambda s: event_handlers.list_events_page(s, encode_cursor(*data.middle)),
+        "list_events_page[tag]": lambda s: event_handlers.list_events_page(s, tag=HOT_TAGS[1]),
+        "list_events_page[meta]": lambda s: event_handlers.list_events_page(s, meta=["meta.priority>=4"]),
+        "list_event_rows_page[deep]": lambda s: event_handlers.list_event_rows_page(s, encode_cursor(*data.middle)),
+        "get_events_version[week]": lambda s: event_handlers.get_events_version(
+            s, event_handlers.events_between_stmt(*week_bounds(week))
+        ),
+        "list_week": lambda s: event_handlers.list_week(s, week),
+        "list_week[tag]": lambda s: event_handlers.list_week(s, week, tags=[HOT_TAGS[0]]),
+        "list_week_cached": lambda s: event_handlers.list_week_cached(s, week),
+        "list_todo": event_handlers.list_todo,
+        "list_todo[all]": lambda s: event_handlers.list_todo(s, pending_only=False),
+        "list_todo_split_by_current_week": event_handlers.list_todo_split_by_current_week,
+    }
+
+
+def write_benchmarks(data: Dataset) -> dict[str, Benchmark]:
+    """Return the benchmarks of the functions which write, they are rolled back after each call."""
+    payload = EventCreate(kind=EventKind.note, text="benchmark event", tags=[HOT_TAGS[0]], meta={"priority": 3})
+    return {
+        "create_event": lambda s: event_handlers.create_event(s, payload),
+        f"create_events_bulk[{BATCH}]": lambda s: event_handlers.create_events_bulk(s, [payload] * BATCH),
+        "mark_event_completed": lambda s: event_handlers.mark_event_completed(s, data.pending_ids[0]),
+        f"complete_events[{BATCH}]": lambda s: event_handlers.complete_events(s, data.pending_ids),
+        f"update_events[{BATCH}]": lambda s: event_handlers.update_events(
+            s, data.ids, add_tags=["benchmark"], meta={"benchmarked": True}
+        ),
+    }
+
+
+def measure(connection: Connection, benchmark: Benchmark, *, warmup: int, repeat: int) -> Metrics:
+    """Time `benchmark` with a new session per call, rolling back what it writes."""
+    timings = []
+    for run in range(warmup + repeat):
+        savepoint = connection.begin_nested()
+        # Its commits only release a savepoint inside the one of the run
+        with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+            started = time.perf_counter()
+            benchmark(session)
+            elapsed = time.perf_counter() - started
+        savepoint.rollback()
+        if run >= warmup:
+            timings.append(elapsed * 1000)
+    return latency_metrics(timings)
+
+
+def main() -> None:
+    """Run the benchmarks, print their latencies and write them as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", action="append", default=[], help="Run the benchmarks starting with this name")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=None, help="Results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    engine = create_engine(get_database_url())
+    results: dict[str, Metrics] = {}
+    with engine.connect() as connection, connection.begin() as transaction:
+        with Session(bind=connection) as session:
+            data = Dataset.pick(session)
+        benchmarks = {**read_benchmarks(data), **write_benchmarks(data)}
+        for name, benchmark in benchmarks.items():
+            if args.only and not name.startswith(tuple(args.only)):
+                continue
+            results[name] = metrics = measure(connection, benchmark, warmup=args.warmup, repeat=args.repeat)
+            print(f"{name:<32} p50 {metrics['p50_ms']:>8.3f} ms  p95 {metrics['p95_ms']:>8.3f} ms  p99 {metrics['p99_ms']:>8.3f} ms")
+        transaction.rollback()
+
+    write_results(args.output, "event_handlers", environment(engine, {"repeat": args.repeat, "warmup": args.warmup}), results)
+    print(f"Results written to {args.output}")
+    if args.baseline is not None and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare the two ways of sending a large list of events as JSON.
+
+- orm: load `Event` objects, validate them into `EventRead` (`from_attributes`), serialize them to Python and
+  dump them with `json.dumps`, which is what FastAPI does with a `response_model`.
+- rows: select the `EventRead` columns as plain rows and serialize them straight to JSON bytes with
+  `pydantic_core.to_json`, which is what the event routes do.
+
+The events are inserted in a transaction which is rolled back at the end, the DB is left untouched.
+
+Usage: DATABASE_URL=postgresql+psycopg://... python benchmarks/bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from collections.abc import Callable
+from datetime import timedelta
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventRead
+from poppy.core.settings import get_database_url
+from poppy.db.models import Event
+from poppy.services.event_handlers import as_event_rows
+from poppy.services.utils import utcnow
+
+EVENT_READ_LIST = TypeAdapter(list[EventRead])
+
+
+def orm_path(session: Session) -> bytes:
+    """Send the events the way FastAPI sends a `response_model`."""
+    events = session.execute(select(Event).order_by(Event.created_at, Event.id)).scalars().all()
+    content = EVENT_READ_LIST.dump_python(EVENT_READ_LIST.validate_python(events, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def rows_path(session: Session) -> bytes:
+    """Send the events the way the event routes do."""
+    rows = session.execute(as_event_rows(select(Event).order_by(Event.created_at, Event.id)))
+    return to_json([row._asdict() for row in rows])
+
+
+def measure(session: Session, path: Callable[[Session], bytes], repeat: int) -> float:
+    """Return the median time of `path` in ms, with an empty identity map on each run."""
+    timings = []
+    for _ in range(repeat):
+        session.expunge_all()
+        started = time.perf_counter()
+        path(session)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    """Insert the events, check that both paths agree and print their median timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(get_database_url())
+    with engine.connect() as connection, connection.begin() as transaction:
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        now = utcnow()
+        session.execute(insert(Event), [
+            {
+                "created_at": now - timedelta(seconds=i),
+                "kind": "note",
+                "text": f"benchmark event {i}",
+                "tags": ["bench", "json"],
+                "meta": {"i": i, "url": "https://example.com"},
+            }
+            for i in range(args.rows)
+        ])
+        # Both paths must send the same JSON
+        assert json.loads(orm_path(session)) == json.loads(rows_path(session))
+
+        results = {name: measure(session, path, args.repeat) for name, path in (("orm", orm_path), ("rows", rows_path))}
+        transaction.rollback()
+
+    for name, ms in results.items():
+        print(f"{name:>5}: {ms:8.1f} ms for {args.rows} events")
+    print(f"speedup: {results['orm'] / results['rows']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Compare the sizes and the encoding times of the wire formats of a large list of events.
+
+- orm json: the `EventRead` JSON of a `response_model`, the baseline (see bench_serialization.py).
+- json: the `EventRead` columns as rows, straight to JSON bytes, what the event routes send by default.
+- msgpack: the same rows as MessagePack, for `Accept: application/msgpack`.
+- +gzip / +zstd: compressed as `CompressionMiddleware` does for `Accept-Encoding: gzip` or `zstd`.
+
+Each timing covers the load of the events and their encoding, the median of `--repeat` runs. The formats
+whose optional package (msgpack, zstandard) is missing are skipped.
+
+The events are inserted in a transaction which is rolled back at the end, the DB is left untouched.
+
+Usage: DATABASE_URL=postgresql+psycopg://... python benchmarks/bench_wire_formats.py [--rows 10000] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+import zlib
+from collections.abc import Callable
+from datetime import timedelta
+
+from bench_serialization import orm_path
+from pydantic_core import to_json
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from poppy.api.encoding import GZIP_LEVEL, ZSTD_LEVEL, optional_module, to_msgpack
+from poppy.core.settings import get_database_url
+from poppy.db.models import Event
+from poppy.services.event_handlers import as_event_rows
+from poppy.services.utils import utcnow
+
+Path = Callable[[Session], bytes]
+
+
+def gzip(body: bytes) -> bytes:
+    """Compress `body` like the gzip coding of the API."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def load_rows(session: Session) -> list[dict]:
+    """Load the events the way the event routes do."""
+    return [row._asdict() for row in session.execute(as_event_rows(select(Event).order_by(Event.created_at, Event.id)))]
+
+
+def paths() -> dict[str, Path]:
+    """Return the wire formats to compare, by name, those of the missing packages left out."""
+    formats: dict[str, Callable[[list[dict]], bytes]] = {"json": to_json}
+    if optional_module("msgpack") is not None:
+        formats["msgpack"] = to_msgpack
+    codings: dict[str, Callable[[bytes], bytes]] = {"": bytes, "+gzip": gzip}
+    zstandard = optional_module("zstandard")
+    if zstandard is not None:
+        codings["+zstd"] = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+
+    def path(encode: Callable[[list[dict]], bytes], compress: Callable[[bytes], bytes]) -> Path:
+        return lambda session: compress(encode(load_rows(session)))
+
+    return {"orm json": orm_path} | {
+        f"{name}{suffix}": path(encode, compress) for name, encode in formats.items() for suffix, compress in codings.items()
+    }
+
+
+def measure(session: Session, path: Path, repeat: int) -> tuple[float, int]:
+    """Return the median time of `path` in ms, with an empty identity map on each run, and the size of its body."""
+    timings = []
+    for _ in range(repeat):
+        session.expunge_all()
+        started = time.perf_counter()
+        body = path(session)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(body)
+
+
+def main() -> None:
+    """Insert the events and print the median timing and the size of each wire format."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(get_database_url())
+    with engine.connect() as connection, connection.begin() as transaction:
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        now = utcnow()
+        session.execute(insert(Event), [
+            {
+                "created_at": now - timedelta(seconds=i),
+                "kind": "note",
+                "text": f"benchmark event {i}",
+                "tags": ["bench", "json"],
+                "meta": {"i": i, "url": "https://example.com"},
+                "due_at": now + timedelta(days=i % 30) if i % 3 == 0 else None,
+            }
+            for i in range(args.rows)
+        ])
+        results = {name: measure(session, path, args.repeat) for name, path in paths().items()}
+        transaction.rollback()
+
+    baseline_ms, baseline_size = results["orm json"]
+    print(f"{'format':>14} {'ms':>8} {'bytes':>11} {'time':>6} {'size':>6}")
+    for name, (ms, size) in results.items():
+        print(f"{name:>14} {ms:8.1f} {size:11,} {ms / baseline_ms:6.2f} {size / baseline_size:6.2f}")
+    print(f"{args.rows} events, time and size relative to orm json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Drive HTTP load against the API and report the throughput and latency percentiles of each endpoint.
+
+A local uvicorn serving `poppy.api.app:app` on DATABASE_URL is started for the run, unless `--url` points
+to a running API. Each endpoint is then loaded in turn for `--duration` seconds by `--concurrency` clients,
+each sending its requests one after the other on its own keep-alive connection (closed-loop load). The
+clients speak HTTP/1.1 on asyncio streams directly, so that the driver costs little next to the server.
+
+Load the events first with `benchmarks/synthetic.py`. The `create` endpoint writes events, it only runs
+when asked for with `--endpoint create`. The results are written as JSON to `--output`, and compared to
+`--baseline` if given, see `results.py`. The exit status is 1 if an endpoint regressed by more than
+`--threshold`.
+
+Usage: DATABASE_URL=postgresql+psycopg://... python benchmarks/load_test.py [--duration 10] [--concurrency 16]
+    [--workers 1] [--endpoint week --endpoint page] [--url http://127.0.0.1:8000] [--baseline baseline.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from results import (
+    DEFAULT_THRESHOLD,
+    Metrics,
+    compare,
+    environment,
+    latency_metrics,
+    write_results,
+)
+from sqlalchemy import create_engine
+from synthetic import HOT_TAGS
+
+from poppy.core.settings import get_database_url
+
+DEFAULT_OUTPUT = Path(__file__).parent / "runs" / "load_test.json"
+SERVER_START_TIMEOUT_S = 30
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A request sent over and over during the load of an endpoint."""
+
+    method: str
+    target: str
+    body: bytes | None = None
+
+
+ENDPOINTS = {
+    "week": Endpoint("GET", "/event/week"),
+    "page": Endpoint("GET", "/event?limit=50"),
+    "page_tag": Endpoint("GET", f"/event?limit=50&tag={HOT_TAGS[0]}"),
+    "page_meta": Endpoint("GET", "/event?limit=50&where=meta.priority%3E%3D4"),
+    "tagged": Endpoint("GET", f"/event/tagged?tag={HOT_TAGS[1]}&limit=50"),
+    "tags": Endpoint("GET", "/tags"),
+    "stats_weeks": Endpoint("GET", "/stats/weeks"),
+    "create": Endpoint("POST", "/event", json.dumps({"kind": "note", "text": "load test", "tags": [HOT_TAGS[0]]}).encode()),
+}
+READ_ENDPOINTS = [name for name, endpoint in ENDPOINTS.items() if endpoint.method == "GET"]
+
+
+@dataclass
+class Samples:
+    """The latencies of the successful requests to an endpoint, and the number of failed ones."""
+
+    latencies_ms: list[float] = field(default_factory=list)
+    errors: int = 0
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    """Read one response, return its status code. Handles both `Content-Length` and chunked bodies."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.lower().split(": ", 1) for line in header_lines if line)
+    if headers.get("transfer-encoding") == "chunked":
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b"\r\n")
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    return int(status_line.split(" ", 2)[1])
+
+
+async def client(host: str, port: int, endpoint: Endpoint, deadline: float, samples: Samples) -> None:
+    """Send `endpoint` on one connection until `deadline`, recording the latency of each response."""
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"{endpoint.method} {endpoint.target} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n"
+    if endpoint.body is not None:
+        request += f"Content-Type: application/json\r\nContent-Length: {len(endpoint.body)}\r\n"
+    payload = (request + "\r\n").encode() + (endpoint.body or b"")
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(payload)
+            status = await read_response(reader)
+            if status >= 400:  # noqa: PLR2004
+                samples.errors += 1
+            else:
+                samples.latencies_ms.append((time.perf_counter() - started) * 1000)
+    finally:
+        writer.close()
+
+
+async def load(host: str, port: int, endpoint: Endpoint, *, duration: float, concurrency: int) -> Metrics:
+    """Load `endpoint` with `concurrency` clients for `duration` seconds, return its throughput and latencies."""
+    samples = Samples()
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(host, port, endpoint, deadline, samples) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if not samples.latencies_ms:
+        return {"throughput": 0.0, "errors": samples.errors}
+    return {
+        "throughput": len(samples.latencies_ms) / elapsed,
+        "errors": samples.errors,
+        **latency_metrics(samples.latencies_ms),
+    }
+
+
+def free_port() -> int:
+    """Return a TCP port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(workers: int) -> Iterator[str]:
+    """Serve the API with uvicorn on a free port while in the block, yield its URL."""
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "poppy.api.app:app", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--no-access-log", "--log-level", "warning",
+    ], env={**os.environ, "DATABASE_URL": get_database_url()})
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    sys.exit("The API did not start, see its output above")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    """Load each endpoint in turn, print their throughput and latencies and write them as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="Processes of the local uvicorn")
+    parser.add_argument("--endpoint", action="append", choices=list(ENDPOINTS), default=[], help="Defaults to the reads")
+    parser.add_argument("--url", default=None, help="URL of a running API, instead of starting one")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=None, help="Results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    with local_server(args.workers) if args.url is None else nullcontext(args.url) as url:
+        parts = urlsplit(url)
+        host, port = parts.hostname or "127.0.0.1", parts.port or 80
+        results: dict[str, Metrics] = {}
+        for name in args.endpoint or READ_ENDPOINTS:
+            results[name] = metrics = asyncio.run(
+                load(host, port, ENDPOINTS[name], duration=args.duration, concurrency=args.concurrency)
+            )
+            print(
+                f"{name:<12} {metrics['throughput']:>9.1f} req/s  p50 {metrics.get('p50_ms', 0):>8.2f} ms  "
+                f"p95 {metrics.get('p95_ms', 0):>8.2f} ms  p99 {metrics.get('p99_ms', 0):>8.2f} ms  "
+                f"{metrics['errors']:.0f} errors"
+            )
+
+    parameters = {"duration": args.duration, "concurrency": args.concurrency, "workers": args.workers, "url": args.url}
+    write_results(args.output, "load_test", environment(create_engine(get_database_url()), parameters), results)
+    print(f"Results written to {args.output}")
+    if args.baseline is not None and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Store the results of the benchmarks as JSON, and compare a run against a baseline run.
+
+A results file holds the environment of the run (git commit, Python, PostgreSQL, parameters) and, per
+benchmark, its metrics, e.g. `{"p50_ms": 1.2, "p95_ms": 3.4, "throughput": 812.0}`. The percentiles, the
+mean and the throughput are compared: lower is better for the `_ms` metrics, higher for the throughput.
+Save a run on the main branch as the baseline, then run the branch with `--baseline that.json`: the
+metrics which got worse by more than `--threshold` are reported as regressions.
+"""
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import subprocess
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Engine, text
+
+# Relative change of a metric above which it is reported as a regression
+DEFAULT_THRESHOLD = 0.10
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput")
+
+Metrics = dict[str, float]
+
+
+def latency_metrics(samples_ms: Sequence[float]) -> Metrics:
+    """Summarize latencies in milliseconds with their percentiles."""
+    ordered = sorted(samples_ms)
+    # `quantiles` needs two samples, the percentiles of a single one are itself
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+    return {
+        "min_ms": ordered[0],
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+        "max_ms": ordered[-1],
+        "mean_ms": statistics.fmean(ordered),
+    }
+
+
+def git_commit() -> str | None:
+    """Return the commit of the working tree, if it is a git checkout."""
+    process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False)  # noqa: S607
+    return process.stdout.strip() or None
+
+
+def environment(engine: Engine, parameters: dict[str, Any]) -> dict[str, Any]:
+    """Describe where and how the benchmarks ran, so that runs on different setups are not compared blindly."""
+    with engine.connect() as connection:
+        server_version = connection.execute(text("SHOW server_version")).scalar_one()
+        events = connection.execute(text("SELECT count(*) FROM events")).scalar_one()
+    return {
+        "created_at": datetime.now(UTC).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "postgresql": server_version,
+        "events": events,
+        "parameters": parameters,
+    }
+
+
+def write_results(path: Path, suite: str, env: dict[str, Any], results: dict[str, Metrics]) -> None:
+    """Write the `results` of the benchmarks of `suite` to `path`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"suite": suite, **env, "results": results}, indent=2) + "\n", encoding="utf-8")
+
+
+def compare(current: dict[str, Metrics], baseline_path: Path, threshold: float = DEFAULT_THRESHOLD) -> int:
+    """Print how `current` changed from the results in `baseline_path`, return the number of regressions."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\nCompared to {baseline_path} ({baseline.get('git_commit')}, {baseline.get('events')} events):")
+    regressions = 0
+    for name, metrics in current.items():
+        for metric, value in metrics.items():
+            before = baseline["results"].get(name, {}).get(metric)
+            if not before or metric not in COMPARED_METRICS:
+                continue
+            change = value / before - 1
+            worse = change > threshold if metric.endswith("_ms") else change < -threshold
+            regressions += worse
+            print(f"  {name:<32} {metric:<11} {before:>10.3f} -> {value:>10.3f} {change:>+7.1%}{'  REGRESSION' if worse else ''}")
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return regressions
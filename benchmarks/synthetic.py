@@ -0,0 +1,204 @@
+"""Generate and load a reproducible synthetic dataset of events, for the benchmarks.
+
+The events are drawn from a seeded `random.Random`, the same seed and `--now` always give the same
+events in the same order:
+
+- kinds: mostly notes and actions, fewer ideas, meetings, decisions and papers (`KIND_WEIGHTS`).
+- tags: 0 to 4 per event out of `TAG_COUNT`, following a Zipf law: a few tags are on most events, the
+  long tail on a handful, which is what the GIN index on tags has to deal with.
+- meta: keys depending on the kind, e.g. `priority` on actions or `venue.city` on meetings, so that the
+  meta filters and their expression indexes have something to select.
+- created_at: spread over the `--days` before `--now`, due_at on meetings and some actions.
+
+The events are written with the `COPY` path of `poppy import`, in batches, into the partitions of their
+months (created first). Actions older than a week are then mostly completed, and `events` is analyzed.
+
+Usage: DATABASE_URL=postgresql+psycopg://... python benchmarks/synthetic.py [--events 1000000] [--seed 42]
+    [--days 365] [--now 2026-01-01T00:00:00+00:00] [--truncate]
+
+It writes to DATABASE_URL, point it to a database dedicated to the benchmarks.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import time
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventImport, EventKind
+from poppy.core.settings import get_database_url
+from poppy.services.importer import copy_events
+from poppy.services.partitions import create_partition, month_start
+from poppy.services.utils import chunked, utcnow
+
+DEFAULT_SEED = 42
+DEFAULT_EVENTS = 1_000_000
+DEFAULT_DAYS = 365
+BATCH_SIZE = 50_000
+
+KIND_WEIGHTS = {
+    EventKind.note: 35,
+    EventKind.action: 25,
+    EventKind.idea: 12,
+    EventKind.meeting: 12,
+    EventKind.decision: 8,
+    EventKind.paper: 8,
+}
+TAG_COUNT = 200
+# Exponent of the Zipf law of the tags, the most common tag is on about a third of the events
+TAG_SKEW = 1.1
+HOT_TAGS = ("work", "home", "health", "reading", "travel", "finance", "family", "project-x")
+CITIES = ("Lisbon", "Berlin", "Paris", "London", "Madrid", "Vienna", "Warsaw", "Prague")
+SOURCES = ("cli", "api", "import", None)
+WORDS = (
+    "review", "draft", "budget", "call", "plan", "sync", "notes", "paper", "idea", "follow", "up", "ship",
+    "fix", "deploy", "read", "write", "design", "meeting", "lunch", "trip", "invoice", "report", "roadmap",
+    "hiring", "interview", "refactor", "index", "query", "cache", "benchmark",
+)
+# Shares of the events with a `why`, of the notes and ideas with meta, of the actions with a due date and
+# of the actions older than a week which are completed
+WHY_SHARE = 0.2
+NOTE_META_SHARE = 0.1
+DUE_ACTION_SHARE = 0.3
+COMPLETED_SHARE = 0.7
+
+
+def tag_names() -> list[str]:
+    """Return the tag vocabulary, most common first."""
+    return [*HOT_TAGS, *(f"topic-{i:03d}" for i in range(TAG_COUNT - len(HOT_TAGS)))]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """Draw a sentence of `words` words."""
+    return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def meta_for(rng: random.Random, kind: EventKind, created_at: datetime) -> dict[str, Any]:
+    """Draw the meta of an event of `kind`, with the keys such events have in real use."""
+    if kind == EventKind.action:
+        return {"priority": rng.randint(1, 5), "effort": rng.choice(("s", "m", "l"))}
+    if kind == EventKind.meeting:
+        return {"venue": {"city": rng.choice(CITIES)}, "attendees": rng.randint(2, 12)}
+    if kind == EventKind.paper:
+        return {"doi": f"10.{rng.randint(1000, 9999)}/{rng.randint(10**5, 10**6)}", "year": created_at.year - rng.randint(0, 30)}
+    if kind == EventKind.decision:
+        return {"reversible": rng.choice((True, False))}
+    # Notes and ideas seldom have meta
+    return {"mood": rng.choice(("good", "meh", "bad"))} if rng.random() < NOTE_META_SHARE else {}
+
+
+def generate_events(
+    count: int, *, seed: int = DEFAULT_SEED, now: datetime | None = None, days: int = DEFAULT_DAYS
+) -> Iterator[EventImport]:
+    """Yield `count` events drawn from `seed`, created over the `days` days before `now`, oldest first."""
+    rng = random.Random(seed)  # noqa: S311
+    now = now or utcnow()
+    start = now - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+    kinds, kind_weights = list(KIND_WEIGHTS), list(KIND_WEIGHTS.values())
+    tags = tag_names()
+    tag_weights = list(itertools.accumulate(1 / rank**TAG_SKEW for rank in range(1, len(tags) + 1)))
+    for i in range(count):
+        created_at = start + step * i
+        kind = rng.choices(kinds, kind_weights)[0]
+        due_at = None
+        if kind == EventKind.meeting or (kind == EventKind.action and rng.random() < DUE_ACTION_SHARE):
+            due_at = created_at + timedelta(hours=rng.randint(1, 24 * 14))
+        yield EventImport(
+            created_at=created_at,
+            kind=kind,
+            text=sentence(rng, rng.randint(3, 12)),
+            why=sentence(rng, rng.randint(3, 8)) if rng.random() < WHY_SHARE else None,
+            source=rng.choice(SOURCES),
+            # Drawn with replacement, duplicates are dropped
+            tags=list(dict.fromkeys(rng.choices(tags, cum_weights=tag_weights, k=rng.randint(0, 4)))),
+            meta=meta_for(rng, kind, created_at),
+            due_at=due_at,
+        )
+
+
+def load_events(
+    session: Session,
+    count: int,
+    *,
+    seed: int = DEFAULT_SEED,
+    now: datetime | None = None,
+    days: int = DEFAULT_DAYS,
+    batch_size: int = BATCH_SIZE,
+    on_batch: Callable[[int], None] | None = None,
+) -> int:
+    """Write the events of `generate_events` with `COPY`, committing each batch, and return their number.
+
+    `on_batch` is called with the number of events written so far after each batch.
+    """
+    now = now or utcnow()
+    month = month_start(now - timedelta(days=days))
+    while month <= now:
+        create_partition(session, month)
+        month = month_start(month, 1)
+    session.commit()
+
+    written = 0
+    for batch in chunked(generate_events(count, seed=seed, now=now, days=days), batch_size):
+        written += copy_events(session, batch)
+        if on_batch is not None:
+            on_batch(written)
+
+    # Deterministic, unlike a random sample
+    session.execute(
+        text(
+            "UPDATE events SET completed_at = created_at + interval '1 day' "
+            "WHERE kind = 'action' AND created_at < :week_ago AND id % 100 < :completed_percent"
+        ),
+        {"week_ago": now - timedelta(days=7), "completed_percent": int(COMPLETED_SHARE * 100)},
+    )
+    session.commit()
+    session.execute(text("ANALYZE events"))
+    session.commit()
+    return written
+
+
+def truncate_events(session: Session) -> None:
+    """Delete every event, with their statistics and reminders, and restart their ids."""
+    session.execute(text("TRUNCATE events, event_weekly_rollups RESTART IDENTITY CASCADE"))
+    session.commit()
+
+
+def main() -> None:
+    """Load the synthetic events into DATABASE_URL and print the load rate."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=DEFAULT_EVENTS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--now", type=datetime.fromisoformat, default=None, help="End of the range, defaults to now")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--truncate", action="store_true", help="Delete the existing events first")
+    args = parser.parse_args()
+    now = args.now.astimezone(UTC) if args.now else None
+
+    engine = create_engine(get_database_url())
+    with Session(engine) as session:
+        if args.truncate:
+            truncate_events(session)
+        started = time.perf_counter()
+        written = load_events(
+            session,
+            args.events,
+            seed=args.seed,
+            now=now,
+            days=args.days,
+            batch_size=args.batch_size,
+            on_batch=lambda written: print(f"{written:>10} events", end="\r", flush=True),
+        )
+        elapsed = time.perf_counter() - started
+    print(f"Loaded {written} events in {elapsed:.1f} s ({written / elapsed:,.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
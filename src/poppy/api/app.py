@@ -1,30 +1,77 @@
 """Skeleton setup required for the fastAPI app."""
+import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from sqlalchemy.exc import SQLAlchemyError
 
+import poppy.db.session as db_session_module
+from poppy.api.encoding import CompressionMiddleware
 from poppy.api.routes.events import router as events_router
-from poppy.db.session import DATABASE_URL, ENGINE, init_db_engine_and_sessionmaker
+from poppy.api.routes.metrics import router as metrics_router
+from poppy.api.routes.stats import router as stats_router
+from poppy.api.tracing import TracingMiddleware
+from poppy.core.settings import get_settings
+from poppy.services.change_feed import EventFeed
+from poppy.services.partitions import create_partitions_ahead
+from poppy.services.write_buffer import WriteBuffer
+
+logger = logging.getLogger(__name__)
+
+
+async def ensure_partitions() -> None:
+    """Create the partitions of `events` of the coming months, so that new events never land in the default one."""
+    months_ahead = get_settings().partition_months_ahead
+    if not months_ahead:
+        return
+    async with db_session_module.async_session_scope() as session:
+        try:
+            created = await session.run_sync(create_partitions_ahead, months_ahead)
+        except SQLAlchemyError:
+            # E.g. the DB role cannot create tables: the API still works, `poppy partitions create` can catch up
+            logger.exception("Could not create the partitions of the next %d months", months_ahead)
+            return
+    if created:
+        logger.info("Created the partitions %s", ", ".join(created))
 
 
 @asynccontextmanager
-async def lifespan(app: FastAPI) -> AsyncGenerator[None, None, None]:  # noqa: ARG001
-    """Similar to typer callback, this sets up and tears down the DB engine."""
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None, None]:
+    """Similar to typer callback, this sets up and tears down the async DB engine used by the routes."""
     # In async context manager, the part before yield is run before entering
     # the with block, and the part after yield is run after exiting the with block.
-    init_db_engine_and_sessionmaker(DATABASE_URL)
+    # The engine is looked up on the module, so an engine set up beforehand (e.g. by the tests) is kept
+    if db_session_module.ASYNC_ENGINE is None:
+        db_session_module.init_async_db_engine_and_sessionmaker()
+    await ensure_partitions()
+    # Shared by the clients of `GET /event/stream`, it only connects when the first one subscribes
+    app.state.event_feed = EventFeed(db_session_module.ASYNC_ENGINE.url)
+    settings = get_settings()
+    # Group commit of `POST /event`, off by default
+    app.state.write_buffer = (
+        WriteBuffer.from_settings(settings, db_session_module.async_session_scope) if settings.write_buffer_enabled else None
+    )
     yield
-    if ENGINE is not None:
-        ENGINE.dispose()
+    # Before the engine is disposed, the buffered events are still written
+    if app.state.write_buffer is not None:
+        await app.state.write_buffer.close()
+    await app.state.event_feed.close()
+    if db_session_module.ASYNC_ENGINE is not None:
+        await db_session_module.ASYNC_ENGINE.dispose()
 
 
 # FastAPI will do the equivalent of calling `with lifespan(app):` when using every endpoint
 app = FastAPI(title="PopPy API", lifespan=lifespan)
 app.include_router(events_router)
+app.include_router(metrics_router)
+app.include_router(stats_router)
+app.add_middleware(CompressionMiddleware)
+# Added last, hence outermost: the traces include the compression
+app.add_middleware(TracingMiddleware)
 
 
 @app.get("/")
-def read_root() -> dict[str, str]:
+async def read_root() -> dict[str, str]:
     """Meant to be hit to check if the API is alive."""
     return {"Poppy": "Your Popeye-powered secretary"}
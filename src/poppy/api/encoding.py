@@ -0,0 +1,285 @@
+"""Content negotiation of the API: MessagePack or JSON bodies, compressed with zstd or gzip.
+
+- `Accept: application/msgpack` selects MessagePack for the event lists, see `negotiated_response`. The
+  datetimes are sent as MessagePack timestamps (extension type -1) instead of ISO strings, e.g. decode them
+  with `msgpack.unpackb(body, timestamp=3)`. JSON stays the default, also for `*/*`.
+- `Accept-Encoding: zstd` or `gzip` compresses the responses of at least `COMPRESSION_MIN_SIZE` bytes, see
+  `CompressionMiddleware`. Streamed responses, e.g. exports, are compressed chunk by chunk as they are sent.
+
+MessagePack and zstd need the optional `msgpack` and `zstandard` packages (the `msgpack` and `zstd` extras).
+Without them they are simply not offered, the clients get JSON or gzip instead.
+"""
+from __future__ import annotations
+
+import functools
+import importlib
+import zlib
+from enum import StrEnum
+from types import ModuleType
+from typing import Any
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from poppy.core.settings import get_settings
+from poppy.core.tracing import span
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# The responses which are worth compressing, the others are small (e.g. empty) or already compressed (Parquet)
+COMPRESSIBLE_MEDIA_TYPES = frozenset({
+    "application/json", MSGPACK_MEDIA_TYPE, "application/x-ndjson", "text/csv", "text/plain"
+})
+# Fast levels: an API response is compressed once and sent once, unlike a file downloaded many times
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+class WireFormat(StrEnum):
+    """Formats of the bodies of the event lists."""
+
+    json = "application/json"
+    msgpack = MSGPACK_MEDIA_TYPE
+
+
+class ContentCoding(StrEnum):
+    """Compressions of the responses, in order of preference."""
+
+    zstd = "zstd"
+    gzip = "gzip"
+    identity = "identity"
+
+
+@functools.cache
+def optional_module(name: str) -> ModuleType | None:
+    """Import the optional dependency `name` once, return None if it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def parse_quality_values(header: str) -> dict[str, float]:
+    """Parse an `Accept` like header, e.g. `application/msgpack, */*;q=0.5`, into the quality of each value."""
+    qualities: dict[str, float] = {}
+    for item in header.split(","):
+        value, *parameters = (part.strip() for part in item.split(";"))
+        if not value:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, raw_quality = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(raw_quality)
+                except ValueError:
+                    quality = 0.0
+        qualities[value.lower()] = quality
+    return qualities
+
+
+def _quality(qualities: dict[str, float], *candidates: str) -> float:
+    # The first candidate listed by the client wins, from the most to the least specific
+    return next((qualities[candidate] for candidate in candidates if candidate in qualities), 0.0)
+
+
+def negotiate_format(accept: str | None) -> WireFormat:
+    """Choose the format of a body from the `Accept` header: MessagePack if the client prefers it, JSON otherwise."""
+    if not accept or optional_module("msgpack") is None:
+        return WireFormat.json
+    qualities = parse_quality_values(accept)
+    msgpack_quality = _quality(qualities, MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/*", "*/*")
+    json_quality = _quality(qualities, WireFormat.json.value, "application/*", "*/*")
+    return WireFormat.msgpack if msgpack_quality > json_quality else WireFormat.json
+
+
+def available_codings() -> list[ContentCoding]:
+    """Return the compressions this server can send, in order of preference."""
+    codings = [ContentCoding.gzip]
+    if optional_module("zstandard") is not None:
+        codings.insert(0, ContentCoding.zstd)
+    return codings
+
+
+def negotiate_coding(accept_encoding: str | None) -> ContentCoding:
+    """Choose the compression of a response from the `Accept-Encoding` header, the best one the client accepts."""
+    if not accept_encoding:
+        return ContentCoding.identity
+    qualities = parse_quality_values(accept_encoding)
+    best, best_quality = ContentCoding.identity, 0.0
+    for coding in available_codings():
+        quality = _quality(qualities, coding.value, "*")
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _pack_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    msg = f"Cannot serialize {type(value).__name__} to MessagePack"
+    raise TypeError(msg)
+
+
+def to_msgpack(content: Any) -> bytes:
+    """Serialize `content` (dicts, lists, pydantic models) to MessagePack, with the datetimes as timestamps."""
+    msgpack = optional_module("msgpack")
+    if msgpack is None:
+        msg = "MessagePack requires msgpack, install poppy with the `msgpack` extra."
+        raise RuntimeError(msg)
+    return msgpack.packb(content, default=_pack_default, datetime=True)
+
+
+def representation_etag(etag: str, wire_format: WireFormat) -> str:
+    """Tag the `etag` of a content with `wire_format`, so that each format of the content has a validator of its own.
+
+    JSON keeps `etag` as is, e.g. `W/"abc"` becomes `W/"abc-msgpack"` for MessagePack.
+    """
+    if wire_format == WireFormat.json:
+        return etag
+    opaque = etag.removesuffix('"')
+    return f'{opaque}-{wire_format.name}"'
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    """Answer 304 with the `headers` of the response it stands for, varying with `Accept` like `negotiated_response`."""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.append("Vary", "Accept")
+    return response
+
+
+def negotiated_response(
+    request: Request, content: Any, status_code: int = status.HTTP_200_OK, headers: dict[str, str] | None = None
+) -> Response:
+    """Send `content` as MessagePack if the client prefers it, as JSON otherwise, without a `response_model`."""
+    wire_format = negotiate_format(request.headers.get("accept"))
+    with span("serialize"):
+        body = to_msgpack(content) if wire_format == WireFormat.msgpack else to_json(content)
+    response = Response(body, status_code=status_code, headers=headers, media_type=wire_format.value)
+    response.headers.append("Vary", "Accept")
+    return response
+
+
+class _Compressor:
+    """Compresses a body in one go, or as a stream of chunks which can each be decompressed as they arrive."""
+
+    def __init__(self, coding: ContentCoding) -> None:
+        self.coding = coding
+        if coding == ContentCoding.zstd:
+            zstandard = optional_module("zstandard")
+            self._zstd = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._stream = self._zstd.compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # 16 + MAX_WBITS: gzip header and trailer around the deflate stream
+            self._stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, body: bytes) -> bytes:
+        """Compress a whole body."""
+        return self._zstd.compress(body) if self.coding == ContentCoding.zstd else self.chunk(body, last=True)
+
+    def chunk(self, data: bytes, *, last: bool) -> bytes:
+        """Compress the next chunk of a stream, flushed so that the client can decompress it right away."""
+        compressed = self._stream.compress(data)
+        return compressed + (self._stream.flush() if last else self._stream.flush(self._flush_mode))
+
+
+class CompressionMiddleware:
+    """Compress the responses with the coding negotiated by `negotiate_coding`, while `COMPRESSION_ENABLED` is on.
+
+    Only the compressible media types are compressed (`COMPRESSIBLE_MEDIA_TYPES`), whole bodies from
+    `COMPRESSION_MIN_SIZE` bytes, streamed bodies whatever their size. Server-Sent Events are never
+    compressed, their messages must reach the clients as soon as they are sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:  # noqa: D107
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:  # noqa: D102
+        settings = get_settings()
+        if scope["type"] != "http" or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_coding(Headers(scope=scope).get("accept-encoding"))
+        if coding == ContentCoding.identity:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, coding, settings.compression_min_size))
+
+
+class _CompressingSend:
+    """The `send` of a response, compressing its body once its start and first body message are known."""
+
+    def __init__(self, send: Send, coding: ContentCoding, min_size: int) -> None:
+        self.send = send
+        self.coding = coding
+        self.min_size = min_size
+        self.start: Message | None = None
+        self.compressor: _Compressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+        elif message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            if message["status"] == status.HTTP_304_NOT_MODIFIED:
+                # Carries the Vary and ETag of the compressed response it stands for, without a body to compress
+                self._set_validators(MutableHeaders(scope=message))
+                self.passthrough = True
+            else:
+                media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+                self.passthrough = "content-encoding" in headers or media_type not in COMPRESSIBLE_MEDIA_TYPES
+            if self.passthrough:
+                await self.send(message)
+        elif message["type"] == "http.response.body":
+            await self._send_body(message)
+        else:
+            await self.send(message)
+
+    async def _send_body(self, message: Message) -> None:
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+        if self.compressor is not None:
+            await self.send({"type": "http.response.body", "body": self.compressor.chunk(body, last=not more_body), "more_body": more_body})
+            return
+
+        assert self.start is not None
+        headers = MutableHeaders(scope=self.start)
+        if not more_body:
+            if len(body) < self.min_size:
+                # Still negotiated: the same URL may be compressed for this client once it grows
+                headers.add_vary_header("Accept-Encoding")
+                await self.send(self.start)
+                await self.send(message)
+                return
+            with span("compress"):
+                body = _Compressor(self.coding).compress(body)
+            self._set_headers(headers)
+            headers["Content-Length"] = str(len(body))
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        # Streamed: the length is unknown until the end, the chunks go out as they are compressed
+        self.compressor = _Compressor(self.coding)
+        self._set_headers(headers)
+        del headers["Content-Length"]
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": self.compressor.chunk(body, last=False), "more_body": True})
+
+    def _set_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.coding.value
+        self._set_validators(headers)
+
+    @staticmethod
+    def _set_validators(headers: MutableHeaders) -> None:
+        headers.add_vary_header("Accept-Encoding")
+        # A strong ETag must change with the bytes of the body, the weak ones only describe the content
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
@@ -1,24 +1,296 @@
 """Routes for creating and modifying events in the Poppy API."""
-from datetime import date
-from typing import Annotated
+from collections.abc import AsyncIterator
+from datetime import UTC, date, datetime
+from email.utils import format_datetime
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from poppy.core.events import EventCreate, EventRead
-from poppy.db.session import get_db_connection
-from poppy.services.event_handlers import create_event, list_week
+from poppy.api.encoding import (
+    WireFormat,
+    negotiate_format,
+    negotiated_response,
+    not_modified_response,
+    representation_etag,
+)
+from poppy.core.changes import EventChange
+from poppy.core.events import (
+    EventBulkUpdate,
+    EventCompletion,
+    EventCreate,
+    EventKind,
+    EventPage,
+    EventRead,
+    EventSearchHit,
+    TagMatch,
+)
+from poppy.core.formats import EXPORT_MEDIA_TYPES, ExportFormat
+from poppy.core.tracing import span
+from poppy.db.session import get_async_db_connection
+from poppy.services.async_event_handlers import (
+    complete_events,
+    create_event,
+    create_events_bulk,
+    get_events_version,
+    list_event_rows_by_tags,
+    list_event_rows_page,
+    list_week_cached,
+    update_events,
+)
+from poppy.services.change_feed import EventFeed, Subscription
+from poppy.services.event_handlers import (
+    DEFAULT_PAGE_SIZE,
+    EventsVersion,
+    events_between_stmt,
+    events_page_stmt,
+)
+from poppy.services.exporter import export_events_async
+from poppy.services.search import DEFAULT_SEARCH_LIMIT, search_events_async
+from poppy.services.utils import week_bounds
+from poppy.services.write_buffer import WriteBuffer
 
 router = APIRouter(prefix="/event", tags=["events"])
 
+# Upper bound on the number of events accepted by a single bulk request
+MAX_BULK_EVENTS = 10_000
+# Upper bound on the number of events returned in a single page
+MAX_PAGE_SIZE = 1_000
+# Upper bound on the number of results of a single search, ranking and highlighting grow with it
+MAX_SEARCH_LIMIT = 100
+# Seconds between two comments sent on an idle stream, so that proxies do not close it
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+def dump_event_rows(rows: list[Row[Any]]) -> list[dict[str, Any]]:
+    """Turn rows of the `EventRead` columns into dicts, which serialize to the same JSON as `EventRead`."""
+    return [row._asdict() for row in rows]
+
+
+def version_headers(version: EventsVersion, wire_format: WireFormat = WireFormat.json) -> dict[str, str]:
+    """Build the `ETag` and `Last-Modified` headers of a list sent as `wire_format`, revalidated on every use."""
+    headers = {"ETag": representation_etag(version.etag, wire_format), "Cache-Control": "no-cache"}
+    if version.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(version.last_modified.astimezone(UTC), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Tell whether the client already has the representation tagged `etag`, with the weak comparison of `If-None-Match`.
+
+    `If-Modified-Since` is ignored: `Last-Modified` only reflects creations and completions, not every update.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etags = {etag.strip().removeprefix("W/") for etag in if_none_match.split(",")}
+    return "*" in etags or etag.removeprefix("W/") in etags
+
+
+def format_sse(change: EventChange) -> bytes:
+    """Format `change` as a Server-Sent Event named after the kind of change, with the event as JSON data."""
+    return b"event: " + change.change.encode() + b"\ndata: " + change.event.model_dump_json().encode() + b"\n\n"
+
+
+async def sse_messages(
+    feed: EventFeed, subscription: Subscription, heartbeat: float = SSE_HEARTBEAT_SECONDS
+) -> AsyncIterator[bytes]:
+    """Stream the changes of `subscription` as Server-Sent Events, until it or the client closes."""
+    try:
+        async for change in subscription.changes(heartbeat):
+            yield b": keep-alive\n\n" if change is None else format_sse(change)
+    finally:
+        feed.unsubscribe(subscription)
+
 
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_event_via_fastapi(payload: EventCreate, session: Annotated[Session, Depends(get_db_connection)]) -> EventRead:
-    """Thin wrapper around `create_event` for FastAPI."""
-    return create_event(session, payload)
+async def create_event_via_fastapi(
+    request: Request, payload: EventCreate, session: Annotated[AsyncSession, Depends(get_async_db_connection)]
+) -> EventRead:
+    """Thin wrapper around `create_event` for FastAPI, or around the write buffer of the app when it is enabled."""
+    write_buffer: WriteBuffer | None = request.app.state.write_buffer
+    if write_buffer is not None:
+        return EventRead.model_validate(await write_buffer.submit(payload))
+    return await create_event(session, payload)
+
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=list[EventRead])
+async def create_events_bulk_via_fastapi(
+    request: Request,
+    payloads: Annotated[list[EventCreate], Body(max_length=MAX_BULK_EVENTS)],
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+) -> Response:
+    """Thin wrapper around `create_events_bulk` for FastAPI. The whole batch is validated before any insert."""
+    rows = await create_events_bulk(session, payloads)
+    return negotiated_response(request, dump_event_rows(rows), status.HTTP_201_CREATED)
+
+
+@router.post("/complete", response_model=list[EventRead])
+async def complete_events_via_fastapi(
+    request: Request, payload: EventCompletion, session: Annotated[AsyncSession, Depends(get_async_db_connection)]
+) -> Response:
+    """Thin wrapper around `complete_events` for FastAPI. Returns the events it completed, missing and already
+    completed ones are left out.
+    """
+    rows = await complete_events(session, payload.ids, payload.completed_at)
+    return negotiated_response(request, dump_event_rows(rows))
+
+
+@router.patch("/bulk", response_model=list[EventRead])
+async def update_events_via_fastapi(
+    request: Request, payload: EventBulkUpdate, session: Annotated[AsyncSession, Depends(get_async_db_connection)]
+) -> Response:
+    """Thin wrapper around `update_events` for FastAPI. Returns the updated events, missing ones are left out."""
+    rows = await update_events(
+        session,
+        payload.ids,
+        add_tags=payload.add_tags,
+        remove_tags=payload.remove_tags,
+        meta=payload.meta,
+        unset_meta=payload.unset_meta,
+    )
+    return negotiated_response(request, dump_event_rows(rows))
+
+
+@router.get("", response_model=EventPage)
+async def list_events_page_via_fastapi(
+    *,
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    where: Annotated[
+        list[str] | None, Query(description="Meta filters like `meta.priority>=2`, repeat to require several")
+    ] = None,
+) -> Response:
+    """Thin wrapper around `list_event_rows_page` for FastAPI, answering 304 if the client has the current page."""
+    filters = {
+        "limit": limit,
+        "start": start,
+        "end": end,
+        "kind": kind,
+        "source": source,
+        "tag": tag,
+        "meta": where or (),
+    }
+    try:
+        version = await get_events_version(session, events_page_stmt(cursor, **filters))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    headers = version_headers(version, negotiate_format(request.headers.get("accept")))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    with span("load"):
+        rows, next_cursor = await list_event_rows_page(session, cursor, **filters)
+    return negotiated_response(request, {"items": dump_event_rows(rows), "next_cursor": next_cursor}, headers=headers)
+
+
+@router.get("/week", response_model=list[EventRead])
+async def get_events_in_week(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    anchor: date | None = None,
+) -> Response:
+    """Thin wrapper around `list_week_cached` for FastAPI, answering 304 if the client has the current week.
+
+    Polling dashboards only cost one aggregate query while the week does not change, and one read from the
+    cache, validated by the same version, when it changed in another process.
+    """
+    version = await get_events_version(session, events_between_stmt(*week_bounds(anchor)))
+    headers = version_headers(version, negotiate_format(request.headers.get("accept")))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    with span("load"):
+        events = await list_week_cached(session, anchor=anchor, version=version)
+    return negotiated_response(request, events, headers=headers)
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_event_changes(
+    request: Request,
+    kind: EventKind | None = None,
+    tag: Annotated[list[str] | None, Query(description="Repeat to require several tags")] = None,
+) -> StreamingResponse:
+    """Stream the events created, completed or updated from now on as Server-Sent Events, instead of polling `/event/week`.
+
+    Each message is named after the `EventChangeKind` and carries the event as JSON. All the clients share
+    the one connection of the change feed, see `poppy.services.change_feed`.
+    """
+    feed: EventFeed = request.app.state.event_feed
+    try:
+        subscription = await feed.subscribe(kind, tag or ())
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The change feed is unavailable") from e
+    return StreamingResponse(
+        sse_messages(feed, subscription),
+        media_type="text/event-stream",
+        # Tells nginx not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tagged", response_model=list[EventRead])
+async def list_events_by_tags_via_fastapi(
+    *,
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    tag: Annotated[list[str], Query(min_length=1, description="Repeat for several tags")],
+    match: TagMatch = TagMatch.all,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+) -> Response:
+    """Thin wrapper around `list_event_rows_by_tags` for FastAPI: the oldest events with all, or any, of the tags."""
+    rows = await list_event_rows_by_tags(session, tag, match=match, limit=limit)
+    return negotiated_response(request, dump_event_rows(rows))
+
+
+@router.get("/search", response_model=list[EventSearchHit])
+async def search_events_via_fastapi(
+    *,
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    q: Annotated[str, Query(min_length=1, description='Words to search, `"phrase"`, `or` and `-word` are supported')],
+    kind: EventKind | None = None,
+    tag: Annotated[list[str] | None, Query(description="Repeat to require several tags")] = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_SEARCH_LIMIT)] = DEFAULT_SEARCH_LIMIT,
+) -> Response:
+    """Thin wrapper around `search_events` for FastAPI. Matched words are wrapped in `<b>` tags in the headlines."""
+    hits = await search_events_async(session, q, kind=kind, tags=tag, start=start, end=end, limit=limit)
+    return negotiated_response(request, hits)
 
 
-@router.get("/week")
-def get_events_in_week(session: Annotated[Session, Depends(get_db_connection)], anchor: date | None = None) -> list[EventRead]:
-    """Thin wrapper around `list_week` for FastAPI."""
-    return list_week(session, anchor=anchor)
+@router.get("/export")
+async def export_events_via_fastapi(
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    fmt: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.ndjson,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> StreamingResponse:
+    """Stream the events created in `[start, end)` with `export_events_async`, without loading them all in memory."""
+    try:
+        chunks = export_events_async(session, fmt, start, end)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e)) from e
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="events.{fmt}"'},
+    )
@@ -0,0 +1,16 @@
+"""Route exposing operational metrics of the Poppy API in the Prometheus text format."""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from poppy.db.metrics import render_prometheus
+from poppy.db.session import engine_pools
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Expose the connection pool metrics of the DB engines: size, checkouts, wait time, overflow and timeouts."""
+    return PlainTextResponse(render_prometheus(engine_pools()), media_type=PROMETHEUS_CONTENT_TYPE)
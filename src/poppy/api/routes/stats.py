@@ -0,0 +1,51 @@
+"""Routes exposing statistics of the events, aggregated by the DB."""
+from datetime import datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from poppy.core.events import EventKind
+from poppy.core.stats import EventStats, StatsPeriod, TagCount, WeeklyRollup
+from poppy.db.session import get_async_db_connection
+from poppy.services.rollups import list_weekly_rollups_async
+from poppy.services.stats import count_tags_async, get_event_stats_async
+
+router = APIRouter(tags=["stats"])
+
+# Upper bound on the number of tags counted by a single request
+MAX_TAGS_LIMIT = 1_000
+
+
+@router.get("/stats")
+async def get_stats(
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    period: StatsPeriod = StatsPeriod.week,
+) -> EventStats:
+    """Thin wrapper around `get_event_stats` for FastAPI: events per period and kind, and action progress."""
+    return await get_event_stats_async(session, start, end, period=period)
+
+
+@router.get("/stats/weeks")
+async def get_weekly_rollups(
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+) -> list[WeeklyRollup]:
+    """Thin wrapper around `list_weekly_rollups` for FastAPI: counts and tag histograms per week and kind."""
+    return await list_weekly_rollups_async(session, start, end, kind=kind)
+
+
+@router.get("/tags")
+async def get_tag_counts(
+    session: Annotated[AsyncSession, Depends(get_async_db_connection)],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_TAGS_LIMIT)] = 100,
+) -> list[TagCount]:
+    """Thin wrapper around `count_tags` for FastAPI: number of events per tag, most used tags first."""
+    return await count_tags_async(session, start, end, kind=kind, limit=limit)
@@ -0,0 +1,58 @@
+"""Middleware tracing each request of the Poppy API, see `poppy.core.tracing`."""
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from poppy.core.settings import get_settings
+from poppy.core.tracing import export_trace, record_span, server_timing, tracing
+
+# Upper bound of the `X-Request-Start` values in seconds, milliseconds and microseconds since the epoch, and
+# the factor converting them to nanoseconds. Values above are in nanoseconds.
+REQUEST_START_UNITS = ((1e11, 1e9), (1e14, 1e6), (1e17, 1e3))
+
+
+def parse_request_start(value: str) -> int | None:
+    """Parse an `X-Request-Start` header, e.g. `t=1700000000.123` (nginx) or `1700000000123` (Heroku), to nanoseconds.
+
+    Proxies write seconds, milliseconds or microseconds since the epoch, told apart by their magnitude.
+    Returns None if the header cannot be parsed.
+    """
+    try:
+        timestamp = float(value.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    for upper_bound, to_ns in REQUEST_START_UNITS:
+        if timestamp < upper_bound:
+            return int(timestamp * to_ns)
+    return int(timestamp)
+
+
+class TracingMiddleware:
+    """Trace each HTTP request while the `TRACING_ENABLED` setting is on.
+
+    The totals of the spans are sent in the `Server-Timing` header, which browsers show in their developer
+    tools. Pure ASGI rather than `BaseHTTPMiddleware`, so that streamed responses are not buffered.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:  # noqa: D107
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:  # noqa: D102
+        settings = get_settings()
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        with tracing(f"{scope['method']} {scope['path']}", **{"http.method": scope["method"], "http.target": scope["path"]}) as trace:
+            request_start = Headers(scope=scope).get("x-request-start")
+            queued_since_ns = parse_request_start(request_start) if request_start else None
+            if queued_since_ns is not None and queued_since_ns < trace.start_ns:
+                record_span("queue", queued_since_ns, trace.start_ns)
+
+            async def send_with_server_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    trace.attributes["http.status_code"] = message["status"]
+                    MutableHeaders(scope=message).append("Server-Timing", server_timing(trace))
+                await send(message)
+
+            await self.app(scope, receive, send_with_server_timing)
+        export_trace(trace, settings.trace_file)
@@ -1,25 +1,65 @@
-"""Run app from command line interface."""
+"""Run app from command line interface.
+
+Only the standard library, typer and `poppy.core.formats` are imported at module level: SQLAlchemy, pydantic,
+rich and the services are imported by the commands which use them, so that `poppy --help` and shell completion
+start instantly, and so that the DB is only configured when a command needs it.
+"""
 from __future__ import annotations
 
 import json
-from datetime import datetime
+import sys
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from io import TextIOWrapper
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 import typer
-from pydantic import ValidationError
-from rich.console import Console
-from rich.table import Table
-
-from poppy.core.events import EventCreate
-from poppy.db.session import (
-    DATABASE_URL,
-    init_db_engine_and_sessionmaker,
-    session_scope,
+
+from poppy.core.formats import (
+    DEFAULT_EXPORT_CHUNK_SIZE,
+    DEFAULT_IMPORT_BATCH_SIZE,
+    ExportFormat,
+    ImportFormat,
 )
-from poppy.services.event_handlers import create_event, list_todo, list_week
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from rich.console import Console
+    from sqlalchemy.orm import Session
+
+    from poppy.core.tracing import Trace
+    from poppy.services.importer import ImportReport
 
 app = typer.Typer(help="poppy (POP): your Popeye-powered secretary")
-console = Console()
+rollup_app = typer.Typer(help="Maintain the weekly rollups the statistics are read from")
+app.add_typer(rollup_app, name="rollup")
+partitions_app = typer.Typer(help="Maintain the monthly partitions of the events table")
+app.add_typer(partitions_app, name="partitions")
+index_app = typer.Typer(help="Create the indexes which speed up the meta filters")
+app.add_typer(index_app, name="index")
 DEFAULT_TAGS = typer.Option([], "--tags", help="Repeat --tags for multiple values (e.g. --tags foo --tags bar)")
+DEFAULT_TAG_FILTER = typer.Option([], "--tag", help="Only events with this tag, repeat to require several")
+DEFAULT_META_FILTER = typer.Option(
+    [], "--where", help="Only events meeting this meta filter, e.g. 'meta.priority>=2', repeat to require several"
+)
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    *,
+    profile: bool = typer.Option(False, "--profile", help="Print where the time of the command went, e.g. its statements"),  # noqa: FBT003
+) -> None:
+    """Options of every command, e.g. `poppy --profile week`."""
+    if profile:
+        from poppy.core.tracing import tracing
+
+        # Closed in reverse order: the trace ends, then it is reported
+        trace = tracing(f"poppy {ctx.invoked_subcommand}", **{"cli.command": ctx.invoked_subcommand})
+        ctx.call_on_close(lambda: report_profile(ctx.obj))
+        ctx.obj = ctx.with_resource(trace)
 
 
 @app.command()
@@ -35,6 +75,11 @@ def add(
     completed_at: datetime | None = typer.Option(None, "--completed-at", help="Completion date for the event in ISO format"),
 ) -> None:
     """Add an event (action/decision/idea/paper/note/meeting)."""
+    from pydantic import ValidationError
+
+    from poppy.core.events import EventCreate
+    from poppy.services.event_handlers import create_event
+
     meta_obj = {}
     if meta:
         meta_obj = json.loads(meta)
@@ -54,16 +99,21 @@ def add(
         typer.echo(str(e))
         raise typer.Exit(code=2) from e
 
-    with session_scope() as connected_session:
+    with db_session() as connected_session:
         ev = create_event(connected_session, payload)
         typer.echo(f"Saved #{ev.id} [{ev.kind}] {ev.text}")
 
 
 @app.command()
-def week() -> None:
+def week(tags: list[str] | None = DEFAULT_TAG_FILTER, where: list[str] | None = DEFAULT_META_FILTER) -> None:
     """Show this week's events (UTC week)."""
-    with session_scope() as connected_session:
-        events = list_week(connected_session)
+    from poppy.services.event_handlers import list_week
+
+    meta = check_meta_filters(where)
+    if meta:
+        require_postgresql("Filtering with --where")
+    with db_session() as connected_session:
+        events = list_week(connected_session, tags=tags or (), meta=meta)
     for ev in events:
         ts = ev.created_at.isoformat(timespec="minutes")
         if ev.why:
@@ -74,11 +124,22 @@ def week() -> None:
 
 @app.command()
 def todo(
-    *, show_pending_only: bool = typer.Option(False, "--pending-only/--all", help="Show only pending items or all items")  # noqa: FBT003
+    *,
+    show_pending_only: bool = typer.Option(False, "--pending-only/--all", help="Show only pending items or all items"),  # noqa: FBT003
+    tags: list[str] | None = DEFAULT_TAG_FILTER,
+    where: list[str] | None = DEFAULT_META_FILTER,
 ) -> None:
     """List all pending todo items (actions)."""
-    with session_scope() as connected_session:
-        events = list_todo(connected_session, pending_only=show_pending_only)
+    from rich.table import Table
+
+    from poppy.services.event_handlers import list_todo
+
+    meta = check_meta_filters(where)
+    if meta:
+        require_postgresql("Filtering with --where")
+    with db_session() as connected_session:
+        events = list_todo(connected_session, pending_only=show_pending_only, tags=tags or (), meta=meta)
+    console = get_console()
 
     if not events:
         console.print("No todo items found", style="bold magenta")
@@ -95,8 +156,396 @@ def todo(
     console.print(table)
 
 
-@app.callback()
-def main() -> None:
-    """Initialize the DB engine and sessionmaker for CLI commands. Runs for every command."""
-    # runs for every command
-    init_db_engine_and_sessionmaker(DATABASE_URL)
+@app.command()
+def done(
+    ids: list[int] = typer.Argument(..., help="IDs of the events to mark as completed"),
+    completed_at: datetime | None = typer.Option(None, "--at", help="Completion date in ISO format, defaults to now"),
+) -> None:
+    """Mark events as completed, all of them in one statement."""
+    from poppy.services.event_handlers import complete_events
+
+    with db_session() as connected_session:
+        rows = complete_events(connected_session, ids, completed_at)
+    for row in rows:
+        typer.echo(f"Completed #{row.id} [{row.kind}] {row.text}")
+    skipped = sorted(set(ids) - {row.id for row in rows})
+    if skipped:
+        typer.echo(f"Not found or already completed: {', '.join(f'#{event_id}' for event_id in skipped)}", err=True)
+
+
+@app.command()
+def search(
+    query: str = typer.Argument(..., help='Words to search, "phrases", `or` and -word are supported'),
+    *,
+    kind: str | None = typer.Option(None, "--kind", help="Available kinds: action, decision, idea, paper, note, meeting"),
+    tags: list[str] | None = DEFAULT_TAGS,
+    start: datetime | None = typer.Option(None, "--start", help="Only events created on or after this ISO date"),
+    end: datetime | None = typer.Option(None, "--end", help="Only events created before this ISO date"),
+    limit: int = typer.Option(20, "--limit", min=1, max=100),
+) -> None:
+    """Search events by their text, why and tags, best matches first."""
+    from poppy.core.events import EventKind
+    from poppy.services.search import search_events
+
+    try:
+        event_kind = EventKind(kind) if kind is not None else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--kind") from e
+    # Bold matches, `typer.echo` strips the styles when the output is not a terminal
+    highlight = tuple(typer.style("\0", bold=True).split("\0"))
+    with db_session() as connected_session:
+        hits = search_events(
+            connected_session, query, kind=event_kind, tags=tags, start=start, end=end, limit=limit, highlight=highlight
+        )
+    if not hits:
+        typer.echo("No matching events")
+    for hit in hits:
+        typer.echo(f"#{hit.id}  {hit.created_at.isoformat(timespec='minutes')}  [{hit.kind}]  {hit.headline}")
+
+
+@app.command()
+def stats(
+    *,
+    period: str = typer.Option("week", "--period", help="Count events per: day, week, month or year (UTC)"),
+    start: datetime | None = typer.Option(None, "--start", help="Only events created on or after this ISO date"),
+    end: datetime | None = typer.Option(None, "--end", help="Only events created before this ISO date"),
+) -> None:
+    """Show the number of events per period and kind, and the progress of actions."""
+    from datetime import timedelta
+
+    from rich.table import Table
+
+    from poppy.core.events import EventKind
+    from poppy.core.stats import StatsPeriod
+    from poppy.services.stats import get_event_stats
+
+    try:
+        stats_period = StatsPeriod(period)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--period") from e
+    with db_session() as connected_session:
+        event_stats = get_event_stats(connected_session, start, end, period=stats_period)
+
+    console = get_console()
+    counts: dict[datetime, dict[str, int]] = {}
+    for count in event_stats.counts:
+        counts.setdefault(count.period_start, {})[count.kind] = count.count
+    table = Table(title=f"Events per {stats_period}", title_style="bold blue", border_style="cyan", header_style="bold magenta")
+    table.add_column(stats_period.capitalize(), style="dim")
+    for kind in EventKind:
+        table.add_column(kind.capitalize(), justify="right")
+    table.add_column("Total", justify="right", style="bold")
+    for period_start, per_kind in counts.items():
+        table.add_row(
+            period_start.date().isoformat(), *(str(per_kind.get(kind, 0)) for kind in EventKind), str(sum(per_kind.values()))
+        )
+    console.print(table)
+
+    actions = event_stats.actions
+    rate = f"{actions.completion_rate:.0%}" if actions.completion_rate is not None else "-"
+    average = (
+        str(timedelta(seconds=round(actions.avg_seconds_to_complete))) if actions.avg_seconds_to_complete is not None else "-"
+    )
+    console.print(
+        f"Actions: {actions.total} total, {actions.completed} completed ({rate}), {actions.pending} pending, "
+        f"{actions.overdue} overdue, {average} to complete on average",
+        highlight=False,
+    )
+
+
+@rollup_app.command("rebuild")
+def rollup_rebuild(
+    start: datetime | None = typer.Option(None, "--start", help="Rebuild from the week of this ISO date"),
+    end: datetime | None = typer.Option(None, "--end", help="Rebuild until the end of the week of this ISO date"),
+) -> None:
+    """Recompute the weekly rollups from the events, e.g. after a backfill. All of them by default."""
+    from poppy.services.rollups import rebuild_weekly_rollups
+
+    require_postgresql("poppy rollup rebuild")
+    with db_session() as connected_session:
+        rebuilt = rebuild_weekly_rollups(connected_session, start, end)
+    typer.echo(f"Rebuilt {rebuilt} weekly rollups")
+
+
+@partitions_app.command("list")
+def partitions_list() -> None:
+    """Show the partitions of the events table, oldest month first."""
+    from rich.table import Table
+
+    from poppy.services.partitions import list_partitions
+
+    require_postgresql("poppy partitions list")
+    with db_session() as connected_session:
+        partitions = list_partitions(connected_session)
+    table = Table(title="Partitions of events", title_style="bold blue", border_style="cyan", header_style="bold magenta")
+    table.add_column("Partition")
+    table.add_column("From", style="dim")
+    table.add_column("To", style="dim")
+    table.add_column("Rows (estimate)", justify="right")
+    for partition in partitions:
+        table.add_row(
+            partition.name,
+            partition.start.date().isoformat() if partition.start else "-",
+            partition.end.date().isoformat() if partition.end else "-",
+            str(partition.estimated_rows) if partition.estimated_rows is not None else "?",
+        )
+    get_console().print(table)
+
+
+@partitions_app.command("create")
+def partitions_create(
+    months_ahead: int = typer.Option(3, "--months-ahead", min=0, help="Also create the partitions of the next months"),
+) -> None:
+    """Create the partitions of the current and next months, moving their events out of the default partition."""
+    from poppy.services.partitions import create_partitions_ahead
+
+    require_postgresql("poppy partitions create")
+    with db_session() as connected_session:
+        created = create_partitions_ahead(connected_session, months_ahead)
+    typer.echo(f"Created {', '.join(created)}" if created else "All the partitions already exist")
+
+
+@partitions_app.command("detach")
+def partitions_detach(
+    *,
+    before: datetime = typer.Option(..., "--before", help="Detach the months ending on or before this ISO date (UTC)"),
+    drop: bool = typer.Option(False, "--drop", help="Drop the detached partitions instead of archiving them"),  # noqa: FBT003
+) -> None:
+    """Detach old partitions into the events_archive schema, or drop them. Statistics still count their events."""
+    from poppy.services.partitions import detach_partitions
+
+    require_postgresql("poppy partitions detach")
+    if before.tzinfo is None:
+        before = before.replace(tzinfo=UTC)
+    with db_session() as connected_session:
+        detached = detach_partitions(connected_session, before, drop=drop)
+    action = "Dropped" if drop else "Archived"
+    typer.echo(f"{action} {', '.join(detached)}" if detached else "No partition ends before this date")
+
+
+@index_app.command("meta")
+def index_meta(
+    key: str = typer.Argument(..., help="Key of meta, dotted for nested objects, e.g. priority or venue.city"),
+) -> None:
+    """Index the values of a key of meta, for the --where filters comparing it with >, >=, < or <=.
+
+    Each partition is indexed concurrently, the events can still be written meanwhile.
+    """
+    from poppy.services.meta_filters import create_meta_index, meta_index_name
+
+    try:
+        name = meta_index_name(key)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="KEY") from e
+    require_postgresql("poppy index meta")
+    with db_session() as connected_session:
+        created = create_meta_index(connected_session, key)
+    typer.echo(f"Created {name}" if created else f"{name} already exists")
+
+
+@app.command()
+def worker(
+    *,
+    notify: list[str] = typer.Option(
+        ["stdout"], "--notify", help="Where to send reminders: stdout, file:PATH or webhook:URL. Repeat for several"
+    ),
+    concurrency: int = typer.Option(1, "--concurrency", min=1, help="Worker threads, each claims its own batches"),
+    batch_size: int = typer.Option(100, "--batch-size", min=1, help="Reminders claimed per transaction"),
+    poll_interval: float = typer.Option(1.0, "--poll-interval", min=0.05, help="Seconds between checks for due reminders"),
+    once: bool = typer.Option(False, "--once", help="Fire the reminders due now and exit, e.g. from cron"),  # noqa: FBT003
+) -> None:
+    """Fire reminders for pending events when their due date comes. Run several workers to share the load."""
+    import threading
+
+    import poppy.db.session as db_session_module
+    from poppy.services.notifiers import notifier_from_spec
+    from poppy.services.reminders import ReminderReport, drain_due_reminders, run_worker
+
+    try:
+        notifiers = [notifier_from_spec(spec) for spec in notify]
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--notify") from e
+    # Each batch opens its own session
+    require_postgresql("poppy worker")
+    if once:
+        report = drain_due_reminders(db_session_module.session_scope, notifiers, batch_size=batch_size)
+        typer.echo(f"Fired {report.fired} reminders, {report.retried} to retry, {report.failed} failed", err=True)
+        return
+
+    stop = threading.Event()
+    reports = [ReminderReport() for _ in range(concurrency)]
+
+    def work(report: ReminderReport) -> None:
+        report.add(run_worker(db_session_module.session_scope, notifiers, stop, batch_size=batch_size, poll_interval=poll_interval))
+
+    threads = [threading.Thread(target=work, args=(report,), name=f"poppy-worker-{i}") for i, report in enumerate(reports)]
+    for thread in threads:
+        thread.start()
+    typer.echo(f"Worker started with {concurrency} thread(s), press Ctrl+C to stop", err=True)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    fired = sum(report.fired for report in reports)
+    typer.echo(f"Stopped after firing {fired} reminders", err=True)
+
+
+@app.command("import")
+def import_file(
+    file: str = typer.Argument(..., help="NDJSON or CSV file to import, use '-' to read from stdin"),
+    fmt: ImportFormat | None = typer.Option(None, "--format", help="Defaults to csv for *.csv files, ndjson otherwise"),
+    batch_size: int = typer.Option(DEFAULT_IMPORT_BATCH_SIZE, "--batch-size", min=1, help="Rows written per COPY or INSERT batch"),
+    max_errors_shown: int = typer.Option(20, "--max-errors-shown", min=0, help="Failed lines printed at the end"),
+) -> None:
+    """Import events from an NDJSON or CSV file (one event per line) using PostgreSQL COPY, or INSERT on SQLite."""
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        Progress,
+        TextColumn,
+        TimeElapsedColumn,
+    )
+
+    from poppy.services.importer import import_events
+
+    from_stdin = file == "-"
+    path = Path(file)
+    if fmt is None:
+        fmt = ImportFormat.csv if path.suffix.lower() == ".csv" else ImportFormat.ndjson
+    if not from_stdin and not path.is_file():
+        typer.echo(f"File not found: {file}")
+        raise typer.Exit(code=2)
+
+    console = get_console()
+    progress = Progress(
+        TextColumn("[bold blue]Importing"),
+        BarColumn(),
+        DownloadColumn(),
+        TextColumn("{task.fields[imported]} imported, {task.fields[failed]} failed"),
+        TimeElapsedColumn(),
+        console=console,
+    )
+    with progress, db_session() as connected_session:
+        if from_stdin:
+            stream, raw, total = sys.stdin, None, None
+        else:
+            raw = path.open("rb")
+            stream, total = TextIOWrapper(raw, encoding="utf-8", newline=""), path.stat().st_size
+        task = progress.add_task("import", total=total, imported=0, failed=0)
+
+        def on_batch(running_report: ImportReport) -> None:
+            progress.update(
+                task,
+                completed=raw.tell() if raw is not None else None,
+                imported=running_report.imported,
+                failed=running_report.failed,
+            )
+
+        try:
+            report = import_events(connected_session, stream, fmt, batch_size=batch_size, source="import", on_batch=on_batch)
+        finally:
+            if raw is not None:
+                stream.close()
+        progress.update(task, completed=total, imported=report.imported, failed=report.failed)
+
+    console.print(f"Imported {report.imported} events, {report.failed} lines failed", style="bold green")
+    for error in report.errors[:max_errors_shown]:
+        console.print(f"line {error.line_number}: {error.message}", style="red", highlight=False)
+    if report.failed > max_errors_shown:
+        console.print(f"... and {report.failed - max_errors_shown} more failed lines", style="red")
+    if report.failed:
+        raise typer.Exit(code=1)
+
+
+@app.command("export")
+def export_file(
+    output: str = typer.Argument("-", help="File to write to, '-' (the default) writes to stdout"),
+    fmt: ExportFormat = typer.Option(ExportFormat.ndjson, "--format", help="Parquet requires the `parquet` extra"),
+    start: datetime | None = typer.Option(None, "--start", help="Export events created on or after this ISO date"),
+    end: datetime | None = typer.Option(None, "--end", help="Export events created before this ISO date"),
+    chunk_size: int = typer.Option(DEFAULT_EXPORT_CHUNK_SIZE, "--chunk-size", min=1, help="Rows fetched per round trip"),
+) -> None:
+    """Export events as NDJSON, CSV or Parquet, streaming them with constant memory."""
+    from poppy.services.exporter import export_events
+
+    with db_session() as connected_session:
+        chunks = export_events(connected_session, fmt, start, end, chunk_size=chunk_size)
+        if output == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with Path(output).open("wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+
+def get_console() -> Console:
+    """Return the rich console used for tables and progress bars."""
+    from rich.console import Console
+
+    return Console()
+
+
+def report_profile(trace: Trace) -> None:
+    """Print the spans of the `--profile` trace of a command to stderr, and export it like the API traces."""
+    from poppy.core.settings import get_settings
+    from poppy.core.tracing import export_trace
+
+    typer.echo(f"Profile of {trace.name}: {trace.duration_ms:.1f} ms", err=True)
+    for name, (duration, count) in trace.totals().items():
+        typer.echo(f"  {name:<10} {count:>4} x {duration:>9.3f} ms", err=True)
+    for span in trace.spans:
+        if span.name == "db":
+            statement = " ".join(span.attributes["statement"].split())
+            typer.echo(f"    {span.duration_ms:>9.3f} ms {span.attributes['rows']:>6} rows  {statement[:100]}", err=True)
+    export_trace(trace, get_settings().trace_file)
+
+
+def check_meta_filters(expressions: list[str] | None) -> list[str]:
+    """Check the syntax of the --where filters before connecting, see `poppy.services.meta_filters`."""
+    from poppy.services.meta_filters import parse_meta_filter
+
+    for expression in expressions or ():
+        try:
+            parse_meta_filter(expression)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--where") from e
+    return expressions or []
+
+
+@contextmanager
+def db_session() -> Iterator[Session]:
+    """Initialize the DB engine on first use and open a session, exiting with code 2 if DATABASE_URL is missing."""
+    import poppy.db.session as db_session_module
+
+    init_db()
+    with db_session_module.session_scope() as session:
+        yield session
+
+
+def require_postgresql(feature: str) -> None:
+    """Exit with code 2 before connecting if DATABASE_URL is not a PostgreSQL one, which `feature` needs."""
+    import poppy.db.session as db_session_module
+
+    init_db()
+    dialect = db_session_module.ENGINE.dialect.name
+    if dialect != "postgresql":
+        typer.echo(f"{feature} requires PostgreSQL, DATABASE_URL points to a {dialect} database.", err=True)
+        raise typer.Exit(code=2)
+
+
+def init_db() -> None:
+    """Initialize the DB engine on first use, exiting with code 2 if DATABASE_URL is missing."""
+    import poppy.db.session as db_session_module
+
+    if db_session_module.ENGINE is None:
+        try:
+            db_session_module.init_db_engine_and_sessionmaker()
+        except RuntimeError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=2) from e
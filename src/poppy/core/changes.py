@@ -0,0 +1,25 @@
+"""The pydantic models of the changes of events streamed by `GET /event/stream`."""
+from __future__ import annotations
+
+from enum import StrEnum
+
+from pydantic import BaseModel
+
+from poppy.core.events import EventRead
+
+
+class EventChangeKind(StrEnum):
+    """What happened to an event, sent as the name of its Server-Sent Event."""
+
+    created = "created"
+    completed = "completed"
+    updated = "updated"
+
+
+class EventChange(BaseModel):
+    """An event as it is right after a change, as sent to the subscribers of the change feed."""
+
+    change: EventChangeKind
+    event: EventRead
+
+    model_config = {"frozen": True}
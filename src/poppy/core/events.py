@@ -3,9 +3,12 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import StrEnum, auto
-from typing import Any
+from typing import Annotated, Any
 
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, StringConstraints, model_validator
+
+# Upper bound on the number of events completed or updated by a single statement
+MAX_BATCH_IDS = 10_000
 
 
 class EventKind(StrEnum):
@@ -19,6 +22,13 @@ class EventKind(StrEnum):
     meeting = auto()
 
 
+class TagMatch(StrEnum):
+    """Whether events must have all the tags of a filter (`@>`), or any of them (`&&`)."""
+
+    all = auto()
+    any = auto()
+
+
 class EventCreate(BaseModel):
     """Controller (from MVC design) Used by both API and CLI to create events."""
 
@@ -41,6 +51,50 @@ class EventCreate(BaseModel):
         return self
 
 
+class EventImport(EventCreate):
+    """Used by the bulk import to validate one line of an import file.
+
+    Unlike `EventCreate` it keeps the original `created_at` and `completed_at` of the event, and enforces the
+    column sizes of the `events` table so that a single bad line is reported instead of failing a whole batch in the DB.
+    """
+
+    source: Annotated[str, StringConstraints(max_length=64)] | None = None
+    tags: list[Annotated[str, StringConstraints(max_length=64)]] = Field(default_factory=list)
+    created_at: datetime | None = None
+    completed_at: datetime | None = None
+
+
+class EventCompletion(BaseModel):
+    """Controller (from MVC design) Used by the API to complete several events in one statement."""
+
+    ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+    completed_at: datetime | None = Field(default=None, description="Defaults to now")
+
+    model_config = {"frozen": True}
+
+
+class EventBulkUpdate(BaseModel):
+    """Controller (from MVC design) Used by the API to edit the tags and meta of several events in one statement."""
+
+    ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+    add_tags: list[Annotated[str, StringConstraints(max_length=64)]] = Field(
+        default_factory=list, description="Appended to the tags of each event which does not have them yet"
+    )
+    remove_tags: list[str] = Field(default_factory=list, description="Removed before `add_tags` are appended")
+    meta: dict[str, Any] = Field(default_factory=dict, description="Merged into the meta of each event, replacing its top-level keys")
+    unset_meta: list[str] = Field(default_factory=list, description="Top-level keys removed from the meta of each event")
+
+    model_config = {"frozen": True}
+
+    @model_validator(mode="after")
+    def check_something_to_update(self) -> EventBulkUpdate:
+        """Ensure that the update changes something."""
+        if not (self.add_tags or self.remove_tags or self.meta or self.unset_meta):
+            error_msg = "Nothing to update, set add_tags, remove_tags, meta or unset_meta."
+            raise ValueError(error_msg)
+        return self
+
+
 class EventRead(BaseModel):
     """Controller (from MVC design) Used by both API to send DB read events over HTTP."""
 
@@ -56,3 +110,19 @@ class EventRead(BaseModel):
     completed_at: datetime | None
 
     model_config = {"from_attributes": True, "frozen": True}
+
+
+class EventPage(BaseModel):
+    """Controller (from MVC design) Used by the API to send one page of events over HTTP."""
+
+    items: list[EventRead]
+    next_cursor: str | None = Field(description="Pass as `cursor` to get the next page, null on the last page")
+
+    model_config = {"frozen": True}
+
+
+class EventSearchHit(EventRead):
+    """Controller (from MVC design) Used by both API and CLI to send one search result."""
+
+    rank: float = Field(description="Relevance, higher is better. Only comparable within one search")
+    headline: str = Field(description="Excerpt of the text and why, with the matched words highlighted")
@@ -0,0 +1,33 @@
+"""File formats and batch sizes of the import and export services.
+
+This module only depends on the standard library, so that the CLI can declare its options with these
+values without loading SQLAlchemy, psycopg and pydantic before a command actually needs them.
+"""
+from enum import StrEnum, auto
+
+# Rows sent per `COPY` statement by the import, each batch is committed in its own transaction
+DEFAULT_IMPORT_BATCH_SIZE = 10_000
+# Rows fetched from the server-side cursor and encoded at once by the export
+DEFAULT_EXPORT_CHUNK_SIZE = 5_000
+
+
+class ImportFormat(StrEnum):
+    """Supported import file formats."""
+
+    ndjson = auto()
+    csv = auto()
+
+
+class ExportFormat(StrEnum):
+    """Supported export file formats."""
+
+    ndjson = auto()
+    csv = auto()
+    parquet = auto()
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
@@ -0,0 +1,18 @@
+"""The pydantic model of the reminders handed to the notifiers by `poppy worker`."""
+from __future__ import annotations
+
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from poppy.core.events import EventRead
+
+
+class Reminder(BaseModel):
+    """A pending event whose due date has come, as sent to the notifiers."""
+
+    event: EventRead
+    remind_at: datetime
+    attempts: int = Field(description="Previous attempts which failed, 0 on the first one")
+
+    model_config = {"frozen": True}
@@ -0,0 +1,94 @@
+"""Application settings, read from environment variables first and then from the `.env` file.
+
+Nothing is read at import time: `get_settings()` resolves the settings on first use and caches them, so
+commands which do not touch the DB (e.g. `poppy --help`) work without any configuration.
+"""
+from __future__ import annotations
+
+from enum import StrEnum, auto
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from poppy.services.utils import DEFAULT_ENV_FILE_PATH
+
+
+class WriteDurability(StrEnum):
+    """When the events created through the write buffer are acknowledged, see `poppy.services.write_buffer`."""
+
+    # Once their commit is flushed to disk: an acknowledged event is never lost
+    durable = auto()
+    # Once committed, before the flush (`synchronous_commit = off`): a crash of Postgres may lose the events
+    # acknowledged in the last few hundred milliseconds, but never part of a transaction
+    relaxed = auto()
+
+
+class Settings(BaseSettings):
+    """All settings of PopPy. Each field is read from the upper case environment variable of the same name."""
+
+    database_url: str | None = None
+
+    # Connection pool, see `sqlalchemy.pool.QueuePool` for the meaning of each option
+    db_pool_size: int = Field(default=5, ge=1)
+    db_max_overflow: int = Field(default=10, ge=0)
+    db_pool_timeout: float = Field(default=30.0, gt=0, description="Seconds to wait for a connection before failing")
+    db_pool_recycle: int = Field(default=-1, description="Replace connections older than this many seconds, -1 never does")
+    db_pool_pre_ping: bool = Field(default=True, description="Test each connection on checkout, costs one round trip")
+    db_statement_timeout_ms: int | None = Field(default=None, ge=0, description="Abort statements running longer than this")
+    db_pgbouncer: bool = Field(
+        default=False, description="Be compatible with PgBouncer in transaction mode: no prepared statements nor startup options"
+    )
+
+    # Read-through cache of the week views, see `poppy.services.cache`
+    cache_enabled: bool = True
+    cache_max_entries: int = Field(default=256, ge=1)
+    cache_ttl_seconds: float = Field(
+        default=30.0, gt=0, description="Upper bound on the staleness of writes made by other processes"
+    )
+
+    # Monthly partitions of `events`, see `poppy.services.partitions`
+    partition_months_ahead: int = Field(
+        default=3, ge=0, description="Months to create the partitions of ahead of time when the API starts, 0 disables"
+    )
+
+    # Request traces, see `poppy.core.tracing`
+    tracing_enabled: bool = Field(
+        default=False, description="Trace each API request: Server-Timing header, log line and TRACE_FILE"
+    )
+    trace_file: Path | None = Field(default=None, description="Append the traces to this file, as OTLP JSON lines")
+
+    # Compression of the API responses, see `poppy.api.encoding`
+    compression_enabled: bool = Field(default=True, description="Compress the responses with zstd or gzip when accepted")
+    compression_min_size: int = Field(
+        default=1024, ge=0, description="Smallest body compressed, in bytes, smaller ones gain less than they cost"
+    )
+
+    # Group commit of `POST /event`, see `poppy.services.write_buffer`
+    write_buffer_enabled: bool = Field(
+        default=False, description="Insert the events of POST /event by batches, from a single writer"
+    )
+    write_buffer_max_delay_ms: float = Field(default=5.0, gt=0, description="Longest wait of an event for its batch")
+    write_buffer_max_batch: int = Field(default=500, ge=1, description="Most events inserted by one statement")
+    write_buffer_max_pending: int = Field(
+        default=10_000, ge=1, description="Events buffered at most, further requests wait for room"
+    )
+    write_buffer_durability: WriteDurability = WriteDurability.durable
+
+    model_config = SettingsConfigDict(env_file=DEFAULT_ENV_FILE_PATH, env_file_encoding="utf-8", extra="ignore")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the settings, read once and cached. Call `get_settings.cache_clear()` to read them again."""
+    return Settings()
+
+
+def get_database_url(settings: Settings | None = None) -> str:
+    """Return the configured DATABASE_URL, raising a `RuntimeError` explaining how to set it if it is missing."""
+    settings = settings or get_settings()
+    if not settings.database_url:
+        msg = f"DATABASE_URL is not set. Export it as an environment variable or add it to {DEFAULT_ENV_FILE_PATH}."
+        raise RuntimeError(msg)
+    return settings.database_url
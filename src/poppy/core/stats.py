@@ -0,0 +1,74 @@
+"""The pydantic models of the statistics sent by the API and printed by the CLI."""
+from __future__ import annotations
+
+from datetime import datetime
+from enum import StrEnum, auto
+
+from pydantic import BaseModel, Field
+
+from poppy.core.events import EventKind
+
+
+class StatsPeriod(StrEnum):
+    """Length of the periods events are counted by, in UTC. Weeks start on Monday like `week_bounds`."""
+
+    day = auto()
+    week = auto()
+    month = auto()
+    year = auto()
+
+
+class PeriodKindCount(BaseModel):
+    """Number of events of one kind created during one period."""
+
+    period_start: datetime
+    kind: EventKind
+    count: int
+
+    model_config = {"from_attributes": True, "frozen": True}
+
+
+class ActionStats(BaseModel):
+    """Progress of the actions created in the range of the stats."""
+
+    total: int
+    completed: int
+    pending: int = Field(description="Not completed, with a due date")
+    overdue: int = Field(description="Pending and due before now")
+    completion_rate: float | None = Field(description="Completed actions / actions, null without actions")
+    avg_seconds_to_complete: float | None = Field(description="From `created_at` to `completed_at`, null if none is completed")
+
+    model_config = {"from_attributes": True, "frozen": True}
+
+
+class WeeklyRollup(BaseModel):
+    """Aggregates of the events of one kind created during one week, as stored in `event_weekly_rollups`."""
+
+    week_start: datetime
+    kind: EventKind
+    event_count: int
+    completed_count: int
+    tag_counts: dict[str, int] = Field(description="Number of events with each tag")
+
+    model_config = {"from_attributes": True, "frozen": True}
+
+
+class TagCount(BaseModel):
+    """Number of events with one tag."""
+
+    tag: str
+    count: int
+
+    model_config = {"from_attributes": True, "frozen": True}
+
+
+class EventStats(BaseModel):
+    """Statistics of the events created in `[start, end)`, where missing bounds mean the whole history."""
+
+    start: datetime | None
+    end: datetime | None
+    period: StatsPeriod
+    counts: list[PeriodKindCount]
+    actions: ActionStats
+
+    model_config = {"frozen": True}
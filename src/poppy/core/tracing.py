@@ -0,0 +1,189 @@
+"""Traces of API requests and CLI commands, telling how their time splits between the DB, loading and serializing.
+
+A `Trace` is started for each request by `poppy.api.tracing.TracingMiddleware` (when the `TRACING_ENABLED`
+setting is on), and for each command run with `poppy --profile`. While it is the current trace, spans are
+recorded into it:
+
+- `queue`: from the `X-Request-Start` header set by the proxy, to the start of the request in the API.
+- `checkout`: each wait for a connection of the pool, recorded by `poppy.db.metrics`.
+- `db`: each statement, with its row count, recorded by the engine hooks of `poppy.db.session`.
+- `load`: the service calls of the routes, i.e. their statements plus building the ORM objects or rows.
+- `serialize`: turning the results into JSON.
+
+Finished traces are sent as a `Server-Timing` header by the API, logged as one JSON line on the
+`poppy.core.tracing` logger, and appended to the `TRACE_FILE` setting if set, as OTLP JSON lines which the
+`otlpjsonfile` receiver of an OpenTelemetry collector can read. Only the standard library is imported, so
+the CLI can import this module before knowing whether a command needs the DB.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import secrets
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "poppy"
+# Longest statement text kept in a span
+MAX_STATEMENT_LENGTH = 500
+
+_current_trace: ContextVar[Trace | None] = ContextVar("poppy_current_trace", default=None)
+_file_lock = threading.Lock()
+
+
+@dataclass
+class Span:
+    """A timed step of a trace. Times are nanoseconds since the epoch, like in OTLP."""
+
+    name: str
+    start_ns: int
+    end_ns: int
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:  # noqa: D102
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+@dataclass
+class Trace:
+    """The spans recorded while handling one request or running one command."""
+
+    name: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    trace_id: str = field(default_factory=lambda: secrets.token_hex(16))
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    spans: list[Span] = field(default_factory=list)
+
+    @property
+    def duration_ms(self) -> float:
+        """Time since the start of the trace, up to its end once finished."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def totals(self) -> dict[str, tuple[float, int]]:
+        """Return the total duration in milliseconds and the number of the spans, per span name."""
+        totals: dict[str, tuple[float, int]] = {}
+        for span_ in self.spans:
+            duration, count = totals.get(span_.name, (0.0, 0))
+            totals[span_.name] = (duration + span_.duration_ms, count + 1)
+        return totals
+
+
+def current_trace() -> Trace | None:
+    """Return the trace being recorded, if any."""
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(name: str, **attributes: Any) -> Iterator[Trace]:
+    """Record a trace named `name` while in the block, then finish it. It is not exported, see `export_trace`."""
+    trace = Trace(name, attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.end_ns = time.time_ns()
+        _current_trace.reset(token)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes: Any) -> None:
+    """Add a span which already ended to the current trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(Span(name, start_ns, end_ns, attributes))
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """Time the block as a span of the current trace, if any. Attributes can be added to the yielded dict."""
+    if _current_trace.get() is None:
+        yield attributes
+        return
+    start_ns = time.time_ns()
+    try:
+        yield attributes
+    finally:
+        record_span(name, start_ns, time.time_ns(), **attributes)
+
+
+def server_timing(trace: Trace) -> str:
+    """Format the totals of `trace` as a `Server-Timing` header value, e.g. `db;dur=1.2;desc="3 queries"`."""
+    metrics = []
+    for name, (duration, count) in trace.totals().items():
+        desc = f';desc="{count} queries"' if name == "db" else ""
+        metrics.append(f"{name};dur={duration:.3f}{desc}")
+    metrics.append(f"total;dur={trace.duration_ms:.3f}")
+    return ", ".join(metrics)
+
+
+def trace_summary(trace: Trace) -> dict[str, Any]:
+    """Summarize `trace` as a JSON-compatible dict, as logged by `export_trace`."""
+    return {
+        "trace_id": trace.trace_id,
+        "name": trace.name,
+        **trace.attributes,
+        "duration_ms": round(trace.duration_ms, 3),
+        "spans": {
+            name: {"duration_ms": round(duration, 3), "count": count} for name, (duration, count) in trace.totals().items()
+        },
+    }
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace_id: str, span_id: str, parent_span_id: str, span_: Span) -> dict[str, Any]:
+    return {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "parentSpanId": parent_span_id,
+        "name": span_.name,
+        # SERVER for the root span, INTERNAL for the others
+        "kind": 1 if parent_span_id else 2,
+        "startTimeUnixNano": str(span_.start_ns),
+        "endTimeUnixNano": str(span_.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span_.attributes.items()],
+    }
+
+
+def to_otlp_json(trace: Trace) -> dict[str, Any]:
+    """Convert `trace` to an OTLP `ExportTraceServiceRequest` in JSON: a root span, parent of the recorded ones."""
+    root_id = secrets.token_hex(8)
+    root = Span(trace.name, trace.start_ns, trace.end_ns or time.time_ns(), trace.attributes)
+    spans = [_otlp_span(trace.trace_id, root_id, "", root)]
+    spans.extend(_otlp_span(trace.trace_id, secrets.token_hex(8), root_id, span_) for span_ in trace.spans)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def export_trace(trace: Trace, trace_file: Path | None = None) -> None:
+    """Log the summary of `trace`, and append it to `trace_file` as one line of OTLP JSON if it is set."""
+    logger.info(json.dumps(trace_summary(trace), default=str))
+    if trace_file is None:
+        return
+    line = json.dumps(to_otlp_json(trace), separators=(",", ":"), default=str) + "\n"
+    # One write per trace, so that concurrent requests do not interleave their lines
+    with _file_lock, trace_file.open("a", encoding="utf-8") as file:
+        file.write(line)
@@ -0,0 +1,84 @@
+"""Connection pool metrics, to size pools per deployment and see pool starvation before it shows up as latency."""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool, QueuePool
+
+from poppy.core.tracing import record_span
+
+
+@dataclass
+class PoolMetrics:
+    """Counters of one connection pool, updated on every checkout."""
+
+    checkouts: int = 0
+    checkout_timeouts: int = 0
+    # Time spent in `Pool.connect()`: waiting for a free connection, opening a new one, and the pre-ping
+    checkout_seconds_total: float = 0.0
+    checkout_seconds_max: float = 0.0
+
+    def observe_checkout(self, seconds: float, *, timed_out: bool = False) -> None:
+        """Record a checkout which took `seconds`, or gave up after them if `timed_out`."""
+        if timed_out:
+            self.checkout_timeouts += 1
+        else:
+            self.checkouts += 1
+        self.checkout_seconds_total += seconds
+        self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+
+def instrumented_pool_class(base: type[Pool], metrics: PoolMetrics) -> type[Pool]:
+    """Return a subclass of `base` recording each checkout in `metrics`, and in the current trace if any.
+
+    The metrics are attached to the class, so they survive `Pool.recreate()` (e.g. on `Engine.dispose()`).
+    """
+
+    class InstrumentedPool(base):  # type: ignore[misc, valid-type]
+        pool_metrics = metrics
+
+        def connect(self) -> Any:
+            started = time.perf_counter()
+            started_ns = time.time_ns()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                self.pool_metrics.observe_checkout(time.perf_counter() - started, timed_out=True)
+                record_span("checkout", started_ns, time.time_ns(), timed_out=True)
+                raise
+            self.pool_metrics.observe_checkout(time.perf_counter() - started)
+            record_span("checkout", started_ns, time.time_ns())
+            return connection
+
+    InstrumentedPool.__name__ = InstrumentedPool.__qualname__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def render_prometheus(pools: dict[str, Pool]) -> str:
+    """Render the metrics of `pools`, keyed by engine name, in the Prometheus text exposition format."""
+    samples: dict[tuple[str, str, str], list[str]] = {}
+
+    def add(name: str, kind: str, doc: str, engine: str, value: float) -> None:
+        samples.setdefault((name, kind, doc), []).append(f'{name}{{engine="{engine}"}} {value}')
+
+    for engine, pool in pools.items():
+        if isinstance(pool, QueuePool):
+            add("poppy_db_pool_size", "gauge", "Connections kept open by the pool.", engine, pool.size())
+            add("poppy_db_pool_checked_in", "gauge", "Idle connections in the pool.", engine, pool.checkedin())
+            add("poppy_db_pool_checked_out", "gauge", "Connections currently in use.", engine, pool.checkedout())
+            add("poppy_db_pool_overflow", "gauge", "Connections opened beyond the pool size, negative while the pool is not full.", engine, pool.overflow())
+        metrics = getattr(pool, "pool_metrics", None)
+        if metrics is None:
+            continue
+        add("poppy_db_pool_checkouts_total", "counter", "Connections checked out of the pool.", engine, metrics.checkouts)
+        add("poppy_db_pool_checkout_timeouts_total", "counter", "Checkouts which timed out waiting for a connection.", engine, metrics.checkout_timeouts)
+        add("poppy_db_pool_checkout_seconds_total", "counter", "Time spent waiting for connections on checkout, including timed out ones.", engine, metrics.checkout_seconds_total)
+        add("poppy_db_pool_checkout_seconds_max", "gauge", "Longest wait for a connection on checkout.", engine, metrics.checkout_seconds_max)
+
+    lines = []
+    for (name, kind, doc), values in samples.items():
+        lines.extend((f"# HELP {name} {doc}", f"# TYPE {name} {kind}", *values))
+    return "\n".join(lines) + "\n"
@@ -6,34 +6,300 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import DateTime, Integer, String, Text
-from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Computed,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    Text,
+    event,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
+from poppy.db.portable import (
+    POSTGRESQL_ONLY,
+    SQLITE_ROWID,
+    UTCDateTime,
+    json_document,
+    string_array,
+)
 from poppy.services.utils import utcnow
 
+# `array_to_string` is only STABLE, while generated columns can only use IMMUTABLE functions
+EVENTS_TAGS_TO_TEXT_FUNCTION = """
+CREATE OR REPLACE FUNCTION events_tags_to_text(tags varchar[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT array_to_string(tags, ' ') $$
+"""
+# Weighted like the ranking should be: a match in `text` (A) beats one in `why` (B), which beats a tag (C)
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english'::regconfig, text), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, COALESCE(why, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, events_tags_to_text(tags)), 'C')"
+)
+
 
 class Base(DeclarativeBase):
     """All SqlAlechemy ORM models should inherit from this base class."""
 
 
 class Event(Base):
-    """Maps to table `events` in the database. Stores all event records."""
+    """Maps to table `events` in the database. Stores all event records.
+
+    On PostgreSQL the table is partitioned by month of `created_at`, see `poppy.services.partitions`. The
+    partition key must be part of the primary key, but `id` alone identifies an event for the ORM. On SQLite,
+    `id` alone is the primary key, and the columns and indexes of the PostgreSQL only features are left out.
+    """
 
     __tablename__ = "events"
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at").ddl_if(dialect="postgresql"),
+        # Range scans ordered like `list_events_between`, without a sort step
+        Index("ix_events_created_at_id", "created_at", "id"),
+        # Only the pending actions listed by `list_todo(pending_only=True)`, so it stays small
+        Index(
+            "ix_events_pending_actions",
+            "created_at",
+            "id",
+            postgresql_where=text("kind = 'action' AND due_at IS NOT NULL AND completed_at IS NULL"),
+            sqlite_where=text("kind = 'action' AND due_at IS NOT NULL AND completed_at IS NULL"),
+        ),
+        # Containment queries on tags (`&&`, `@>`) and meta (`@>`, jsonpath)
+        Index("ix_events_tags", "tags", postgresql_using="gin").ddl_if(dialect="postgresql"),
+        Index(
+            "ix_events_meta", "meta", postgresql_using="gin", postgresql_ops={"meta": "jsonb_path_ops"}
+        ).ddl_if(dialect="postgresql"),
+        # Full-text search, see `poppy.services.search`
+        Index("ix_events_search_vector", "search_vector", postgresql_using="gin").ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Not eager: the ORM would otherwise return `search_vector` from each INSERT, which SQLite does not have
+    __mapper_args__ = {"primary_key": ["id"], "eager_defaults": False}  # noqa: RUF012
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, autoincrement=True, info={SQLITE_ROWID: True})
+    created_at: Mapped[datetime] = mapped_column(UTCDateTime, default=utcnow, nullable=False)
     kind: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
 
     # Optional fields
     why: Mapped[str | None] = mapped_column(Text, nullable=True)
     source: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
-    tags: Mapped[list[str]] = mapped_column(ARRAY(String(64)), nullable=False, default=list)
-    meta: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=False, default=dict)
-    due_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
-    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    tags: Mapped[list[str]] = mapped_column(string_array(64), nullable=False, default=list)
+    meta: Mapped[dict[str, Any]] = mapped_column(json_document(), nullable=False, default=dict)
+    due_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+
+    # Maintained by Postgres, only used for searching, hence deferred and never sent to clients
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True), deferred=True, info={POSTGRESQL_ONLY: True}
+    )
+
+
+event.listen(Event.__table__, "before_create", DDL(EVENTS_TAGS_TO_TEXT_FUNCTION).execute_if(dialect="postgresql"))
+# Catches the events of the months without a partition, until `create_partition` moves them to their own
+event.listen(
+    Event.__table__,
+    "after_create",
+    DDL("CREATE TABLE events_default PARTITION OF events DEFAULT").execute_if(dialect="postgresql"),
+)
+
+
+class EventWeeklyRollup(Base):
+    """Maps to table `event_weekly_rollups`: aggregates of the events created during one week, per kind.
+
+    Weeks are the UTC ISO weeks of `week_bounds`. The rows are maintained by statement-level triggers on
+    `events` (see `EVENT_WEEKLY_ROLLUPS_DDL`), so every write path keeps them up to date, including `COPY`.
+    `poppy.services.rollups.rebuild_weekly_rollups` recomputes them from scratch, e.g. after a backfill.
+    """
+
+    __tablename__ = "event_weekly_rollups"
+
+    week_start: Mapped[datetime] = mapped_column(UTCDateTime, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32), primary_key=True)
+    event_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    completed_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # Tag -> number of events with that tag, tags without events are removed
+    tag_counts: Mapped[dict[str, int]] = mapped_column(json_document(), nullable=False, default=dict)
+
+
+EVENT_WEEKLY_ROLLUPS_DDL = (
+    # Adds up two {key: count} objects, dropping the keys whose count falls to 0
+    """
+CREATE OR REPLACE FUNCTION jsonb_sum_counts(a jsonb, b jsonb) RETURNS jsonb
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}')
+    FROM (
+        SELECT key, sum(value::bigint) AS total
+        FROM (SELECT * FROM jsonb_each_text(a) UNION ALL SELECT * FROM jsonb_each_text(b)) AS counts
+        GROUP BY key
+        HAVING sum(value::bigint) <> 0
+    ) AS sums
+$$
+""",
+    # Adds (sign = 1) or removes (sign = -1) the `changed` events to or from their rollups
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_apply(changed events[], sign integer) RETURNS void
+LANGUAGE sql AS $$
+    WITH changed_events AS (
+        SELECT date_trunc('week', created_at, 'UTC') AS week_start, kind, completed_at, tags FROM unnest(changed)
+    ),
+    counts AS (
+        SELECT week_start, kind, count(*) AS event_count, count(completed_at) AS completed_count
+        FROM changed_events
+        GROUP BY week_start, kind
+    ),
+    tag_counts AS (
+        SELECT week_start, kind, jsonb_object_agg(tag, sign * tag_count) AS tag_counts
+        FROM (
+            SELECT week_start, kind, tag, count(*) AS tag_count
+            FROM changed_events, unnest(tags) AS tag
+            GROUP BY week_start, kind, tag
+        ) AS per_tag
+        GROUP BY week_start, kind
+    )
+    INSERT INTO event_weekly_rollups AS rollup (week_start, kind, event_count, completed_count, tag_counts)
+    SELECT week_start, kind, sign * event_count, sign * completed_count, COALESCE(tag_counts, '{}')
+    FROM counts LEFT JOIN tag_counts USING (week_start, kind)
+    -- Concurrent statements lock the rollups in the same order, so they cannot deadlock
+    ORDER BY week_start, kind
+    ON CONFLICT (week_start, kind) DO UPDATE SET
+        event_count = rollup.event_count + excluded.event_count,
+        completed_count = rollup.completed_count + excluded.completed_count,
+        tag_counts = jsonb_sum_counts(rollup.tag_counts, excluded.tag_counts)
+$$
+""",
+    # One call per statement rather than per row: a bulk insert or a `COPY` batch upserts each rollup once
+    """
+CREATE OR REPLACE FUNCTION event_weekly_rollups_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT new_row::events FROM new_rows AS new_row), 1);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM event_weekly_rollups_apply(ARRAY(SELECT old_row::events FROM old_rows AS old_row), -1);
+    ELSE
+        -- Only the updates which change what the rollups count, e.g. not the edits of the text
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT old_row::events FROM old_rows AS old_row JOIN new_rows AS new_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), -1);
+        PERFORM event_weekly_rollups_apply(ARRAY(
+            SELECT new_row::events FROM new_rows AS new_row JOIN old_rows AS old_row USING (id)
+            WHERE (old_row.created_at, old_row.kind, old_row.completed_at IS NULL, old_row.tags)
+                IS DISTINCT FROM (new_row.created_at, new_row.kind, new_row.completed_at IS NULL, new_row.tags)
+        ), 1);
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_insert AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_update AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+    """
+CREATE TRIGGER event_weekly_rollups_delete AFTER DELETE ON events
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_weekly_rollups_trigger()
+""",
+)
+for statement in EVENT_WEEKLY_ROLLUPS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+class EventReminder(Base):
+    """Maps to table `event_reminders`: the queue of the reminders of pending events with a due date.
+
+    Rows are scheduled and cancelled by statement-level triggers on `events` (see `EVENT_REMINDERS_DDL`),
+    and deleted by the workers of `poppy.services.reminders` once fired. No foreign key: the partitions of
+    archived months could not be detached while referenced.
+    """
+
+    __tablename__ = "event_reminders"
+    __table_args__ = (
+        # The workers only look at the next due reminders, however many are scheduled
+        Index("ix_event_reminders_remind_at", "remind_at", postgresql_where=text("failed_at IS NULL")),
+    )
+
+    event_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    # Lets the workers look up the event in its partition only
+    event_created_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+    remind_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Set once the notifiers failed too many times, the reminder is then kept for inspection
+    failed_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+
+
+EVENT_REMINDERS_DDL = (
+    # Events inserted already past due (e.g. imported history) are overdue, not reminded
+    """
+CREATE OR REPLACE FUNCTION event_reminders_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO event_reminders (event_id, event_created_at, remind_at)
+        SELECT id, created_at, due_at FROM new_rows
+        WHERE due_at >= now() AND completed_at IS NULL
+        ON CONFLICT (event_id) DO NOTHING;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM event_reminders AS reminder USING old_rows AS old_row WHERE reminder.event_id = old_row.id;
+    ELSE
+        -- Completed events and events without a due date are not reminded anymore
+        DELETE FROM event_reminders AS reminder USING new_rows AS new_row
+        WHERE reminder.event_id = new_row.id AND (new_row.due_at IS NULL OR new_row.completed_at IS NOT NULL);
+        -- A new due date schedules a new reminder, even if the previous one was fired
+        INSERT INTO event_reminders AS reminder (event_id, event_created_at, remind_at)
+        SELECT new_row.id, new_row.created_at, new_row.due_at
+        FROM new_rows AS new_row JOIN old_rows AS old_row USING (id)
+        WHERE new_row.due_at IS NOT NULL AND new_row.completed_at IS NULL
+            AND (new_row.due_at IS DISTINCT FROM old_row.due_at OR old_row.completed_at IS NOT NULL)
+        ON CONFLICT (event_id) DO UPDATE SET
+            event_created_at = excluded.event_created_at,
+            remind_at = excluded.remind_at,
+            attempts = 0,
+            last_error = NULL,
+            failed_at = NULL;
+        -- Follow the events moved to another partition
+        UPDATE event_reminders AS reminder SET event_created_at = new_row.created_at
+        FROM new_rows AS new_row
+        WHERE reminder.event_id = new_row.id AND reminder.event_created_at <> new_row.created_at;
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+    """
+CREATE TRIGGER event_reminders_insert AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+    """
+CREATE TRIGGER event_reminders_update AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+    """
+CREATE TRIGGER event_reminders_delete AFTER DELETE ON events
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION event_reminders_trigger()
+""",
+)
+for statement in EVENT_REMINDERS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
 
 
-EXPECTED_TABLES_IN_DB = {"events", "alembic_version"}
+EXPECTED_TABLES_IN_DB = {"events", "event_weekly_rollups", "event_reminders", "alembic_version"}
+# Columns of `events` which are not part of `EventRead`
+INTERNAL_EVENT_COLUMNS = {"search_vector"}
@@ -0,0 +1,142 @@
+"""Column types and SQL expressions which work on both PostgreSQL and the embedded SQLite backend.
+
+On PostgreSQL they are the native types and operators the indexes are built for: `ARRAY` and `JSONB`
+columns, `@>`/`&&` on tags and `= ANY(array)`. On SQLite, see `poppy.db.sqlite`, arrays and JSON documents
+are stored as JSON text, datetimes as UTC text, and the operators are rewritten with `json_each`.
+"""
+from __future__ import annotations
+
+from collections.abc import Collection
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import JSON, Boolean, DateTime, Integer, String, any_, bindparam, cast
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.engine import Dialect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql.compiler import DDLCompiler, SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+# Keys of `Column.info` read by the SQLite DDL, see `_create_column_on_sqlite`
+POSTGRESQL_ONLY = "postgresql_only"
+SQLITE_ROWID = "sqlite_rowid"
+
+
+def string_array(length: int) -> TypeEngine[list[str]]:
+    """`VARCHAR(length)[]` on PostgreSQL, a JSON array on SQLite."""
+    return ARRAY(String(length)).with_variant(JSON(), "sqlite")
+
+
+def json_document() -> TypeEngine[dict[str, Any]]:
+    """`JSONB` on PostgreSQL, JSON text on SQLite."""
+    return JSONB().with_variant(JSON(), "sqlite")
+
+
+INTEGER_ARRAY = ARRAY(Integer).with_variant(JSON(), "sqlite")
+
+
+class UTCDateTime(TypeDecorator[datetime]):
+    """`TIMESTAMP WITH TIME ZONE` on PostgreSQL. SQLite has no time zones: values are stored in UTC and read back as
+    aware datetimes, so that both backends return the same values.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | None, dialect: Dialect) -> datetime | None:  # noqa: D102
+        if value is not None and value.tzinfo is not None and dialect.name == "sqlite":
+            return value.astimezone(UTC).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value: datetime | None, dialect: Dialect) -> datetime | None:  # noqa: ARG002, D102
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=UTC)
+        return value
+
+
+class tags_contain(FunctionElement[bool]):  # noqa: N801
+    """`column @> tags` on PostgreSQL: the array `column` has all of `tags`."""
+
+    type = Boolean()
+    name = "tags_contain"
+    inherit_cache = True
+
+
+class tags_overlap(FunctionElement[bool]):  # noqa: N801
+    """`column && tags` on PostgreSQL: the array `column` has any of `tags`."""
+
+    type = Boolean()
+    name = "tags_overlap"
+    inherit_cache = True
+
+
+class id_in(FunctionElement[bool]):  # noqa: N801
+    """`column = ANY(:ids)` on PostgreSQL: one array parameter, and one cached plan, whatever the number of ids."""
+
+    type = Boolean()
+    name = "id_in"
+    inherit_cache = True
+
+
+def has_tags(column: Any, tags: Collection[str], *, match_any: bool = False) -> FunctionElement[bool]:
+    """Tell whether the tags `column` has all of `tags`, or any of them if `match_any`."""
+    values = bindparam(None, list(tags), type_=column.type)
+    return tags_overlap(column, values) if match_any else tags_contain(column, values)
+
+
+def has_id_in(column: Any, ids: Collection[int]) -> id_in:
+    """Tell whether the integer `column` is one of `ids`."""
+    return id_in(column, bindparam(None, list(ids), type_=INTEGER_ARRAY))
+
+
+@compiles(tags_contain)
+def _tags_contain(element: tags_contain, compiler: SQLCompiler, **kw: Any) -> str:
+    column, values = element.clauses
+    return compiler.process(column.contains(values), **kw)
+
+
+@compiles(tags_overlap)
+def _tags_overlap(element: tags_overlap, compiler: SQLCompiler, **kw: Any) -> str:
+    column, values = element.clauses
+    return compiler.process(column.overlap(values), **kw)
+
+
+@compiles(id_in)
+def _id_in(element: id_in, compiler: SQLCompiler, **kw: Any) -> str:
+    column, ids = element.clauses
+    return compiler.process(column == any_(cast(ids, ARRAY(Integer))), **kw)
+
+
+@compiles(tags_contain, "sqlite")
+def _tags_contain_on_sqlite(element: tags_contain, compiler: SQLCompiler, **kw: Any) -> str:
+    column, values = (compiler.process(clause, **kw) for clause in element.clauses)
+    return (
+        f"NOT EXISTS (SELECT 1 FROM json_each({values}) AS wanted "  # noqa: S608
+        f"WHERE wanted.value NOT IN (SELECT value FROM json_each({column})))"
+    )
+
+
+@compiles(tags_overlap, "sqlite")
+def _tags_overlap_on_sqlite(element: tags_overlap, compiler: SQLCompiler, **kw: Any) -> str:
+    column, values = (compiler.process(clause, **kw) for clause in element.clauses)
+    return f"EXISTS (SELECT 1 FROM json_each({column}) AS tag WHERE tag.value IN (SELECT value FROM json_each({values})))"  # noqa: S608
+
+
+@compiles(id_in, "sqlite")
+def _id_in_on_sqlite(element: id_in, compiler: SQLCompiler, **kw: Any) -> str:
+    column, ids = (compiler.process(clause, **kw) for clause in element.clauses)
+    return f"{column} IN (SELECT value FROM json_each({ids}))"  # noqa: S608
+
+
+@compiles(CreateColumn, "sqlite")
+def _create_column_on_sqlite(element: CreateColumn[Any], compiler: DDLCompiler, **kw: Any) -> str | None:
+    column = element.element
+    if column.info.get(POSTGRESQL_ONLY):
+        return None
+    # The primary key of a partitioned table must include the partition key, SQLite can only generate the
+    # values of a single column primary key
+    if column.info.get(SQLITE_ROWID):
+        return f"{compiler.preparer.format_column(column)} INTEGER PRIMARY KEY AUTOINCREMENT"
+    return compiler.visit_create_column(element, **kw)
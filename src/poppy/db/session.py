@@ -1,26 +1,125 @@
-"""Creates the engine and sessionmaker for DB access. Used by the entire application."""
+"""Creates the engine and sessionmaker for DB access. Used by the entire application.
+
+The CLI uses the sync engine and sessions, the FastAPI routes use the async ones, so that waiting on
+Postgres does not hold a threadpool worker. Both are built from the same `postgresql+psycopg` URL.
+The sync engine can also be the embedded SQLite backend of `poppy.db.sqlite`, for a `sqlite:///` URL,
+which the API refuses: its routes rely on PostgreSQL, e.g. `NOTIFY` for the change feed.
+"""
 from __future__ import annotations
 
-from collections.abc import Generator
-from contextlib import contextmanager
+import time
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any
 
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 
-from poppy.services.utils import get_database_url_from_env_file
+from poppy.core.settings import Settings, get_database_url, get_settings
+from poppy.core.tracing import MAX_STATEMENT_LENGTH, current_trace, record_span
+from poppy.db.metrics import PoolMetrics, instrumented_pool_class
+from poppy.db.sqlite import create_sqlite_engine, is_sqlite_url
 
-DATABASE_URL = get_database_url_from_env_file()
 ENGINE: Engine | None = None
 SESSION_LOCAL: sessionmaker | None = None
+ASYNC_ENGINE: AsyncEngine | None = None
+ASYNC_SESSION_LOCAL: async_sessionmaker[AsyncSession] | None = None
+
+
+def engine_options(settings: Settings, pool_class: type[Pool]) -> dict[str, Any]:
+    """Keyword arguments of `create_engine`/`create_async_engine` for the pool and connection `settings`.
+
+    `pool_class` is instrumented with a fresh `PoolMetrics`, reported by the `/metrics` endpoint.
+    """
+    connect_args: dict[str, Any] = {}
+    if settings.db_pgbouncer:
+        # PgBouncer in transaction mode may run each statement on a different server connection,
+        # where a statement prepared by psycopg would not exist
+        connect_args["prepare_threshold"] = None
+    elif settings.db_statement_timeout_ms is not None:
+        connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    return {
+        "poolclass": instrumented_pool_class(pool_class, PoolMetrics()),
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "connect_args": connect_args,
+    }
+
+
+def _set_statement_timeout_per_transaction(engine: Engine, timeout_ms: int) -> None:
+    """PgBouncer rejects startup options, so the statement timeout is set at the start of each transaction."""
+
+    @event.listens_for(engine, "begin")
+    def _set_local_statement_timeout(conn: Any) -> None:
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
 
+def trace_statements(engine: Engine) -> None:
+    """Record each statement run while a trace is being recorded as a `db` span, see `poppy.core.tracing`.
 
-def init_db_engine_and_sessionmaker(database_url: str = DATABASE_URL) -> None:
-    """Initialize the global ENGINE and SESSION_LOCAL variables."""
+    Without a current trace, the hooks only cost a context variable lookup per statement.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_statement_span(conn: Any, *args: Any) -> None:  # noqa: ARG001
+        if current_trace() is not None:
+            conn.info["statement_started_ns"] = time.time_ns()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_statement_span(conn: Any, cursor: Any, statement: str, *args: Any) -> None:  # noqa: ARG001
+        started_ns = conn.info.pop("statement_started_ns", None)
+        if started_ns is not None:
+            # -1 when the driver does not tell, e.g. SQLite for a SELECT
+            record_span("db", started_ns, time.time_ns(), statement=statement[:MAX_STATEMENT_LENGTH], rows=cursor.rowcount)
+
+
+def init_db_engine_and_sessionmaker(database_url: str | None = None, settings: Settings | None = None) -> None:
+    """Initialize the global ENGINE and SESSION_LOCAL variables.
+    The URL, pool and connection options come from `settings`, which defaults to `get_settings()`.
+    The pool and connection options do not apply to a SQLite URL, whose file is opened in-process.
+    """
     global ENGINE, SESSION_LOCAL  # noqa: PLW0603
-    ENGINE = create_engine(database_url, future=True, pool_pre_ping=True)
+    settings = settings or get_settings()
+    database_url = database_url or get_database_url(settings)
+    if is_sqlite_url(database_url):
+        ENGINE = create_sqlite_engine(database_url)
+    else:
+        ENGINE = create_engine(database_url, future=True, **engine_options(settings, QueuePool))
+        if settings.db_pgbouncer and settings.db_statement_timeout_ms is not None:
+            _set_statement_timeout_per_transaction(ENGINE, settings.db_statement_timeout_ms)
+    trace_statements(ENGINE)
     SESSION_LOCAL = sessionmaker(bind=ENGINE, autoflush=False, autocommit=False, future=True)
 
 
+def init_async_db_engine_and_sessionmaker(database_url: str | None = None, settings: Settings | None = None) -> None:
+    """Initialize the global ASYNC_ENGINE and ASYNC_SESSION_LOCAL variables, like `init_db_engine_and_sessionmaker`.
+
+    Raises a `RuntimeError` for a SQLite URL, the embedded backend is only meant for the CLI.
+    """
+    global ASYNC_ENGINE, ASYNC_SESSION_LOCAL  # noqa: PLW0603
+    settings = settings or get_settings()
+    database_url = database_url or get_database_url(settings)
+    if is_sqlite_url(database_url):
+        msg = "The API requires PostgreSQL, DATABASE_URL points to a sqlite database. Use the `poppy` CLI with SQLite."
+        raise RuntimeError(msg)
+    ASYNC_ENGINE = create_async_engine(database_url, **engine_options(settings, AsyncAdaptedQueuePool))
+    if settings.db_pgbouncer and settings.db_statement_timeout_ms is not None:
+        _set_statement_timeout_per_transaction(ASYNC_ENGINE.sync_engine, settings.db_statement_timeout_ms)
+    trace_statements(ASYNC_ENGINE.sync_engine)
+    # Expiring on commit would make reading the returned objects lazy load them, which async sessions cannot do
+    ASYNC_SESSION_LOCAL = async_sessionmaker(bind=ASYNC_ENGINE, autoflush=False, expire_on_commit=False)
+
+
 def get_session() -> Session:  # noqa: D103
     if SESSION_LOCAL is None:
         msg="Database engine and sessionmaker not initialized. Call init_db_engine_and_sessionmaker() first."
@@ -28,6 +127,23 @@ def get_session() -> Session:  # noqa: D103
     return SESSION_LOCAL()
 
 
+def get_async_session() -> AsyncSession:  # noqa: D103
+    if ASYNC_SESSION_LOCAL is None:
+        msg = "Async database engine and sessionmaker not initialized. Call init_async_db_engine_and_sessionmaker() first."
+        raise RuntimeError(msg)
+    return ASYNC_SESSION_LOCAL()
+
+
+def engine_pools() -> dict[str, Pool]:
+    """Return the pools of the initialized engines, keyed by engine name, for the `/metrics` endpoint."""
+    pools = {}
+    if ENGINE is not None:
+        pools["sync"] = ENGINE.pool
+    if ASYNC_ENGINE is not None:
+        pools["async"] = ASYNC_ENGINE.pool
+    return pools
+
+
 @contextmanager
 def session_scope() -> Generator[Session, None, None]:
     """Provide a secure connection to the CLI, and prevent using the try...finally block everywhere."""
@@ -38,9 +154,25 @@ def session_scope() -> Generator[Session, None, None]:
         session.close()
 
 
+@asynccontextmanager
+async def async_session_scope() -> AsyncGenerator[AsyncSession, None]:
+    """Async counterpart of `session_scope`."""
+    session = get_async_session()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
 def get_db_connection() -> Generator[Session, None, None]:
     """Yield a database session and ensures it is closed after use.
     This is intended for use with FastAPI's dependency injection system.
     """
     with session_scope() as session:
         yield session
+
+
+async def get_async_db_connection() -> AsyncGenerator[AsyncSession, None]:
+    """Async counterpart of `get_db_connection`, used by the `async def` FastAPI routes."""
+    async with async_session_scope() as session:
+        yield session
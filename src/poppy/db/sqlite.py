@@ -0,0 +1,57 @@
+"""The embedded SQLite backend, selected by a `sqlite:///path/to/poppy.db` DATABASE_URL.
+
+It lets the CLI capture and list events on a laptop without a server: a write is a local file append in
+WAL mode rather than a round trip to Postgres. The schema is created by the first connection, without
+Alembic, from the same models as on PostgreSQL (see `poppy.db.portable`).
+
+The services creating, importing, listing, filtering by tag, completing and updating events, and the
+statistics, work on both backends. The others rely on PostgreSQL features and need it: full-text search,
+meta filters, the weekly rollups (maintained by triggers), reminders, partitions and the change feed
+(`NOTIFY`). The CLI commands using them exit with an explanation on SQLite, and the API refuses to start.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.engine import URL
+
+from poppy.db.models import Base
+
+# Stored in `PRAGMA user_version`, increment it when the models change
+SCHEMA_VERSION = 1
+# Milliseconds a writer waits for the lock held by another process, e.g. the CLI while the API writes
+BUSY_TIMEOUT_MS = 5000
+
+
+def is_sqlite_url(url: str | URL) -> bool:
+    """Tell whether the DATABASE_URL `url` selects the SQLite backend."""
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _configure_connection(dbapi_connection: Any, connection_record: Any) -> None:  # noqa: ARG001
+    cursor = dbapi_connection.cursor()
+    # Readers do not block the writer and a commit appends to the log, without rewriting the database file
+    cursor.execute("PRAGMA journal_mode = WAL")
+    # Durable once checkpointed: a power loss may only lose the last commits, never corrupt the file
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def create_sqlite_engine(url: str | URL) -> Engine:
+    """Create the engine of the SQLite database at `url`, and its schema if it is a new database."""
+    engine = create_engine(url)
+    event.listen(engine, "connect", _configure_connection)
+    create_sqlite_schema(engine)
+    return engine
+
+
+def create_sqlite_schema(engine: Engine) -> bool:
+    """Create the tables unless they exist, return False if they do. Costs a single `PRAGMA` when they do."""
+    with engine.begin() as connection:
+        if connection.exec_driver_sql("PRAGMA user_version").scalar_one() >= SCHEMA_VERSION:
+            return False
+        Base.metadata.create_all(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
@@ -0,0 +1,166 @@
+"""Async versions of the services in `event_handlers`, used by the `async def` FastAPI routes.
+
+Each function runs its sync counterpart with `AsyncSession.run_sync`, so the queries and business rules
+live in one place, while the underlying async driver waits on Postgres without blocking the event loop.
+"""
+from __future__ import annotations
+
+from collections.abc import Collection, Hashable, Iterable, Mapping, Sequence
+from datetime import date, datetime
+from typing import Any
+
+from sqlalchemy import Row, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from poppy.core.events import EventCreate, EventKind, EventRead, TagMatch
+from poppy.db.models import Event
+from poppy.services import event_handlers
+from poppy.services.event_handlers import (
+    DEFAULT_BULK_CHUNK_SIZE,
+    DEFAULT_PAGE_SIZE,
+    EventsVersion,
+)
+
+
+async def create_event(session: AsyncSession, payload: EventCreate) -> Event:
+    """Async version of `event_handlers.create_event`."""
+    return await session.run_sync(event_handlers.create_event, payload)
+
+
+async def create_events_bulk(
+    session: AsyncSession, payloads: Iterable[EventCreate], *, chunk_size: int = DEFAULT_BULK_CHUNK_SIZE
+) -> list[Row[Any]]:
+    """Async version of `event_handlers.create_events_bulk`."""
+    return await session.run_sync(event_handlers.create_events_bulk, payloads, chunk_size=chunk_size)
+
+
+async def get_event_by_id(session: AsyncSession, event_id: int) -> Event | None:
+    """Async version of `event_handlers.get_event_by_id`."""
+    return await session.get(Event, event_id)
+
+
+async def list_events_by_tags(
+    session: AsyncSession, tags: Collection[str], *, match: TagMatch = TagMatch.all, limit: int | None = None
+) -> list[Event]:
+    """Async version of `event_handlers.list_events_by_tags`."""
+    return await session.run_sync(event_handlers.list_events_by_tags, tags, match=match, limit=limit)
+
+
+async def list_event_rows_by_tags(
+    session: AsyncSession, tags: Collection[str], *, match: TagMatch = TagMatch.all, limit: int | None = None
+) -> list[Row[Any]]:
+    """Async version of `event_handlers.list_event_rows_by_tags`."""
+    return await session.run_sync(event_handlers.list_event_rows_by_tags, tags, match=match, limit=limit)
+
+
+async def list_events_between(session: AsyncSession, start: datetime, end: datetime) -> list[Event]:
+    """Async version of `event_handlers.list_events_between`."""
+    return await session.run_sync(event_handlers.list_events_between, start, end)
+
+
+async def list_events_page(
+    session: AsyncSession,
+    cursor: str | None = None,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    meta: Sequence[str] = (),
+) -> tuple[list[Event], str | None]:
+    """Async version of `event_handlers.list_events_page`."""
+    return await session.run_sync(
+        event_handlers.list_events_page,
+        cursor,
+        limit=limit,
+        start=start,
+        end=end,
+        kind=kind,
+        source=source,
+        tag=tag,
+        meta=meta,
+    )
+
+
+async def list_event_rows_page(
+    session: AsyncSession,
+    cursor: str | None = None,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    meta: Sequence[str] = (),
+) -> tuple[list[Row[Any]], str | None]:
+    """Async version of `event_handlers.list_event_rows_page`."""
+    return await session.run_sync(
+        event_handlers.list_event_rows_page,
+        cursor,
+        limit=limit,
+        start=start,
+        end=end,
+        kind=kind,
+        source=source,
+        tag=tag,
+        meta=meta,
+    )
+
+
+async def get_events_version(session: AsyncSession, stmt: Select[tuple[Event]]) -> EventsVersion:
+    """Async version of `event_handlers.get_events_version`."""
+    return await session.run_sync(event_handlers.get_events_version, stmt)
+
+
+async def list_week(
+    session: AsyncSession, anchor: date | None = None, *, tags: Collection[str] = (), meta: Sequence[str] = ()
+) -> list[Event]:
+    """Async version of `event_handlers.list_week`."""
+    return await session.run_sync(event_handlers.list_week, anchor, tags=tags, meta=meta)
+
+
+async def list_week_cached(
+    session: AsyncSession, anchor: date | None = None, *, version: Hashable | None = None
+) -> list[EventRead]:
+    """Async version of `event_handlers.list_week_cached`."""
+    return await session.run_sync(event_handlers.list_week_cached, anchor, version=version)
+
+
+async def list_todo(
+    session: AsyncSession, *, pending_only: bool = True, tags: Collection[str] = (), meta: Sequence[str] = ()
+) -> list[Event]:
+    """Async version of `event_handlers.list_todo`."""
+    return await session.run_sync(event_handlers.list_todo, pending_only=pending_only, tags=tags, meta=meta)
+
+
+async def list_todo_split_by_current_week(session: AsyncSession) -> dict[str, list[Event]]:
+    """Async version of `event_handlers.list_todo_split_by_current_week`."""
+    return await session.run_sync(event_handlers.list_todo_split_by_current_week)
+
+
+async def mark_event_completed(session: AsyncSession, event_id: int, completed_at: datetime | None = None) -> Event:
+    """Async version of `event_handlers.mark_event_completed`."""
+    return await session.run_sync(event_handlers.mark_event_completed, event_id, completed_at)
+
+
+async def complete_events(session: AsyncSession, ids: Iterable[int], completed_at: datetime | None = None) -> list[Row[Any]]:
+    """Async version of `event_handlers.complete_events`."""
+    return await session.run_sync(event_handlers.complete_events, ids, completed_at)
+
+
+async def update_events(
+    session: AsyncSession,
+    ids: Iterable[int],
+    *,
+    add_tags: Sequence[str] = (),
+    remove_tags: Sequence[str] = (),
+    meta: Mapping[str, Any] | None = None,
+    unset_meta: Sequence[str] = (),
+) -> list[Row[Any]]:
+    """Async version of `event_handlers.update_events`."""
+    return await session.run_sync(
+        event_handlers.update_events, ids, add_tags=add_tags, remove_tags=remove_tags, meta=meta, unset_meta=unset_meta
+    )
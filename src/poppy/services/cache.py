@@ -0,0 +1,181 @@
+"""Read-through cache of the week views, invalidated by the services which write events.
+
+Entries are immutable `EventRead` snapshots rather than ORM objects, so they can be shared between sessions
+and threads. The cache is in-process by default (`InMemoryCache`); any object implementing `CacheBackend`
+can be installed with `set_cache_backend`, e.g. to share it between API workers.
+
+Writes made by other processes (e.g. `poppy add` while the API is running) are not seen by an in-process
+cache, the TTL bounds how long such a change can stay invisible.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from datetime import UTC, date
+from typing import Any, Protocol
+
+from poppy.core.events import EventRead
+from poppy.core.settings import get_settings
+from poppy.services.utils import week_bounds
+
+CacheKey = tuple[Hashable, ...]
+
+
+class CacheBackend(Protocol):
+    """Storage of the cache entries. Implementations must be safe to use from several threads."""
+
+    def get(self, key: CacheKey) -> Any | None:
+        """Return the value stored under `key`, or None if it is missing or expired."""
+        ...
+
+    def set(self, key: CacheKey, value: Any) -> None:
+        """Store `value` under `key`."""
+        ...
+
+    def delete(self, *keys: CacheKey) -> None:
+        """Remove `keys`, ignoring the missing ones."""
+        ...
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        ...
+
+
+class InMemoryCache:
+    """LRU cache holding at most `max_entries` values, each for at most `ttl_seconds`."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 30.0) -> None:  # noqa: D107
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[CacheKey, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Any | None:  # noqa: D102
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: CacheKey, value: Any) -> None:  # noqa: D102
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: CacheKey) -> None:  # noqa: D102
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:  # noqa: D102
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._entries)
+
+
+class NullCache:
+    """Backend which stores nothing, installed when the cache is disabled."""
+
+    def get(self, key: CacheKey) -> Any | None:  # noqa: ARG002, D102
+        return None
+
+    def set(self, key: CacheKey, value: Any) -> None:  # noqa: D102
+        pass
+
+    def delete(self, *keys: CacheKey) -> None:  # noqa: D102
+        pass
+
+    def clear(self) -> None:  # noqa: D102
+        pass
+
+
+CACHE_BACKEND: CacheBackend | None = None
+# Incremented by every invalidation, a value loaded while it changed may be stale and is not stored
+_GENERATION = 0
+_GENERATION_LOCK = threading.Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    """Return the installed backend, creating the one configured in the settings on first use."""
+    global CACHE_BACKEND  # noqa: PLW0603
+    if CACHE_BACKEND is None:
+        settings = get_settings()
+        CACHE_BACKEND = (
+            InMemoryCache(settings.cache_max_entries, settings.cache_ttl_seconds) if settings.cache_enabled else NullCache()
+        )
+    return CACHE_BACKEND
+
+
+def set_cache_backend(backend: CacheBackend | None) -> None:
+    """Install `backend`, or reset to the configured default backend if None."""
+    global CACHE_BACKEND  # noqa: PLW0603
+    CACHE_BACKEND = backend
+
+
+def week_key(anchor: date | None = None) -> CacheKey:
+    """Key of the week view of `anchor`, by the start of its week so that all its days share one entry."""
+    start, _ = week_bounds(anchor)
+    return ("week", start.isoformat())
+
+
+def read_through(
+    key: CacheKey, load: Callable[[], list[EventRead]], *, version: Hashable | None = None
+) -> list[EventRead]:
+    """Return the value cached under `key`, or call `load` and cache its result.
+
+    If `version` is given (e.g. the `EventsVersion` of the view, read from the DB), a value cached with
+    another version is stale and is reloaded. This also catches the writes made by other processes.
+    """
+    backend = get_cache_backend()
+    cached = backend.get(key)
+    if cached is not None and (version is None or cached[0] == version):
+        # A copy, so that callers cannot alter the cached list
+        return list(cached[1])
+    generation = _GENERATION
+    value = load()
+    # A write committed while loading may have been invalidated before `value` was read, do not resurrect it
+    with _GENERATION_LOCK:
+        if generation == _GENERATION:
+            backend.set(key, (version, list(value)))
+    return value
+
+
+def _invalidate(keys: Iterable[CacheKey]) -> None:
+    global _GENERATION  # noqa: PLW0603
+    with _GENERATION_LOCK:
+        _GENERATION += 1
+        get_cache_backend().delete(*keys)
+
+
+def invalidate_events(events: Iterable[Any]) -> None:
+    """Drop the views which contain any of `events`, call it after committing their creation or update.
+
+    `events` can be `Event` objects or rows, only their `created_at` is read.
+    """
+    keys = {week_key(ev.created_at.astimezone(UTC).date()) for ev in events}
+    if keys:
+        _invalidate(keys)
+
+
+def invalidate_all() -> None:
+    """Drop every cached view, for writes which cannot list the events they touched (e.g. imports)."""
+    global _GENERATION  # noqa: PLW0603
+    with _GENERATION_LOCK:
+        _GENERATION += 1
+        get_cache_backend().clear()
+
+
+def snapshot(events: Iterable[Any]) -> list[EventRead]:
+    """Copy `events` into immutable `EventRead` models, which outlive the session they were loaded in."""
+    return [EventRead.model_validate(ev) for ev in events]
@@ -0,0 +1,238 @@
+"""Publish the changes of events with Postgres `NOTIFY`, and fan them out to any number of async subscribers.
+
+The services which write events (`create_event`, `create_events_bulk`, `mark_event_completed`,
+`complete_events` and `update_events`) call `publish_event_changes` in their transaction, so that the
+notifications are only sent if it commits. Each notification carries the id of one event, plus its
+`created_at` to prune the lookup to its partition.
+
+`EventFeed` LISTENs on one dedicated connection, loads the changed events by batches on that same
+connection, and hands them to every subscriber whose filters match. Live updates thus cost one connection
+and one query per batch of changes, whatever the number of clients, where each polling client costs one
+query per poll. Imports, SQL scripts and the other processes which do not go through these services are
+not published.
+
+LISTEN needs a session of its own on the server: behind PgBouncer in transaction mode, point the API at
+Postgres directly or at a session mode pool.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+from collections.abc import AsyncIterator, Iterable
+from datetime import datetime
+from typing import Any
+
+import psycopg
+from sqlalchemy import URL, NullPool, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+
+from poppy.core.changes import EventChange, EventChangeKind
+from poppy.core.events import EventKind, EventRead
+from poppy.db.models import Event
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "poppy_events"
+# Changes buffered per subscriber, a client which lags further behind is disconnected
+DEFAULT_QUEUE_SIZE = 1000
+# Seconds spent gathering notifications before loading their events, and upper bound on a batch
+BATCH_WINDOW = 0.05
+MAX_BATCH_SIZE = 500
+RECONNECT_DELAY = 1.0
+# Like `event_handlers.EVENT_READ_COLUMNS`, which imports this module
+EVENT_READ_COLUMNS = tuple(Event.__table__.c[name] for name in EventRead.model_fields)
+CONNECTION_ERRORS = (SQLAlchemyError, psycopg.Error, OSError)
+
+
+def publish_event_changes(session: Session, events: Iterable[Any], change: EventChangeKind) -> None:
+    """Notify the listeners of the change feed that `events` changed, when the transaction of `session` commits.
+
+    `events` are `Event` objects or rows with their `id` and `created_at`, which must be flushed already.
+    Nothing is published on SQLite, which has no `NOTIFY`.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    payloads = [
+        json.dumps({"change": change, "id": event.id, "created_at": event.created_at.isoformat()}) for event in events
+    ]
+    if payloads:
+        session.execute(
+            text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+            {"channel": CHANNEL, "payloads": payloads},
+        )
+
+
+class Subscription:
+    """The changes of the events matching a kind and tags, as received by one client of the feed."""
+
+    def __init__(self, kind: EventKind | None, tags: Iterable[str], queue_size: int) -> None:  # noqa: D107
+        self.kind = kind
+        self.tags = frozenset(tags)
+        # None tells `changes` that the subscription is closed
+        self._queue: asyncio.Queue[EventChange | None] = asyncio.Queue(queue_size + 1)
+        self.closed = False
+
+    def matches(self, event: EventRead) -> bool:
+        """Tell whether the changes of `event` are sent to this subscription."""
+        return (self.kind is None or event.kind == self.kind) and self.tags.issubset(event.tags)
+
+    def put(self, change: EventChange) -> None:
+        """Queue `change`, or close the subscription if its client lags too far behind."""
+        if self.closed:
+            return
+        if self._queue.qsize() >= self._queue.maxsize - 1:
+            logger.warning("A subscriber of the event feed lags %d changes behind, closing it", self._queue.qsize())
+            self.close()
+            return
+        self._queue.put_nowait(change)
+
+    def close(self) -> None:
+        """End `changes` once the changes already queued are consumed."""
+        if not self.closed:
+            self.closed = True
+            self._queue.put_nowait(None)
+
+    async def changes(self, heartbeat: float | None = None) -> AsyncIterator[EventChange | None]:
+        """Yield the changes until the subscription is closed, and None after each `heartbeat` seconds without any."""
+        while True:
+            try:
+                change = await asyncio.wait_for(self._queue.get(), heartbeat)
+            except TimeoutError:
+                yield None
+                continue
+            if change is None:
+                return
+            yield change
+
+
+class EventFeed:
+    """Listens to the changes of events on one connection, and fans them out to the subscriptions.
+
+    The connection is opened by the first subscription and kept until `close`. It is opened again if it is
+    lost, the changes committed in the meantime are missed.
+    """
+
+    def __init__(self, url: str | URL, *, queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+        """Listen on a connection to the `postgresql+psycopg` database at `url`."""
+        self.url = url
+        self.queue_size = queue_size
+        self.subscriptions: set[Subscription] = set()
+        self._engine: AsyncEngine | None = None
+        self._listener: asyncio.Task[None] | None = None
+        self._start_lock = asyncio.Lock()
+
+    async def subscribe(self, kind: EventKind | None = None, tags: Iterable[str] = ()) -> Subscription:
+        """Subscribe to the changes of the events of `kind` having all of `tags`, committed from now on.
+
+        Raises a `SQLAlchemyError` if the connection of the feed cannot be opened.
+        """
+        async with self._start_lock:
+            if self._listener is None:
+                # Listening before returning, so that no change committed after this call is missed
+                connection = await self._connect()
+                self._listener = asyncio.create_task(self._listen(connection), name="poppy-event-feed")
+        subscription = Subscription(kind, tags, self.queue_size)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop sending changes to `subscription` and close it."""
+        self.subscriptions.discard(subscription)
+        subscription.close()
+
+    async def close(self) -> None:
+        """Close the subscriptions and the connection of the feed."""
+        for subscription in list(self.subscriptions):
+            self.unsubscribe(subscription)
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def _connect(self) -> AsyncConnection:
+        if self._engine is None:
+            # Not from the pool of the API: the connection is held for as long as the feed runs
+            self._engine = create_async_engine(self.url, poolclass=NullPool)
+        connection = await self._engine.connect()
+        try:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            await connection.execute(text(f"LISTEN {CHANNEL}"))
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    async def _listen(self, connection: AsyncConnection) -> None:
+        try:
+            while True:
+                try:
+                    await self._forward(connection)
+                except CONNECTION_ERRORS as e:
+                    logger.warning("Lost the connection of the event feed, reconnecting: %s", e)
+                finally:
+                    await connection.close()
+                connection = await self._reconnect()
+        except Exception:
+            # Not retried, but not silent either: the clients are disconnected and the next one starts it again
+            logger.exception("The event feed stopped")
+            self._listener = None
+            for subscription in list(self.subscriptions):
+                self.unsubscribe(subscription)
+
+    async def _forward(self, connection: AsyncConnection) -> None:
+        driver_connection = (await connection.get_raw_connection()).driver_connection
+        while True:
+            # Wait for a first notification, then gather the ones which follow it closely
+            notifications = [notify async for notify in driver_connection.notifies(stop_after=1)]
+            notifications += [
+                notify async for notify in driver_connection.notifies(timeout=BATCH_WINDOW, stop_after=MAX_BATCH_SIZE)
+            ]
+            payloads = [notify.payload for notify in notifications]
+            try:
+                changes = await self._load(connection, payloads)
+            except CONNECTION_ERRORS:
+                raise
+            except Exception:
+                # E.g. a payload which is not ours, the batch is lost but the feed goes on
+                logger.exception("Could not load a batch of %d changes of the event feed, skipping it", len(payloads))
+                continue
+            self._publish(changes)
+
+    async def _reconnect(self) -> AsyncConnection:
+        while True:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                return await self._connect()
+            except CONNECTION_ERRORS as e:
+                logger.warning("Could not reconnect the event feed: %s", e)
+
+    @staticmethod
+    async def _load(connection: AsyncConnection, payloads: list[str]) -> list[EventChange]:
+        published = [json.loads(payload) for payload in payloads]
+        result = await connection.execute(
+            select(*EVENT_READ_COLUMNS).where(
+                Event.id.in_({change["id"] for change in published}),
+                Event.created_at.in_({datetime.fromisoformat(change["created_at"]) for change in published}),
+            )
+        )
+        events = {row.id: EventRead.model_validate(row) for row in result}
+        # Events deleted since their change are skipped
+        return [
+            EventChange(change=change["change"], event=events[change["id"]]) for change in published if change["id"] in events
+        ]
+
+    def _publish(self, changes: list[EventChange]) -> None:
+        for change in changes:
+            for subscription in list(self.subscriptions):
+                if subscription.closed:
+                    self.subscriptions.discard(subscription)
+                elif subscription.matches(change.event):
+                    subscription.put(change)
@@ -1,61 +1,313 @@
 """Manipulate event-related data and handle event-driven operations in PopPy."""
 from __future__ import annotations
 
+import hashlib
+from collections.abc import Collection, Hashable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
 from datetime import date, datetime
+from typing import Any, TypeVar
 
-from sqlalchemy import select
+from sqlalchemy import (
+    BigInteger,
+    Row,
+    Select,
+    String,
+    Text,
+    all_,
+    case,
+    cast,
+    false,
+    func,
+    insert,
+    literal_column,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import Session
 
-from poppy.core.events import EventCreate, EventKind
+from poppy.core.changes import EventChangeKind
+from poppy.core.events import EventCreate, EventKind, EventRead, TagMatch
 from poppy.db.models import Event
-from poppy.services.utils import utcnow, week_bounds
+from poppy.db.portable import has_id_in, has_tags
+from poppy.services import cache
+from poppy.services.change_feed import publish_event_changes
+from poppy.services.meta_filters import meta_conditions
+from poppy.services.utils import (
+    chunked,
+    decode_cursor,
+    encode_cursor,
+    utcnow,
+    week_bounds,
+)
+
+T = TypeVar("T", Event, Row[Any])
+
+# Rows per multi-row INSERT statement and per transaction in `create_events_bulk`
+DEFAULT_BULK_CHUNK_SIZE = 1000
+# Events per page in `list_events_page`
+DEFAULT_PAGE_SIZE = 100
+# The columns of `EventRead`, selected as plain rows by the lean read path (see `as_event_rows`)
+EVENT_READ_COLUMNS = tuple(Event.__table__.c[name] for name in EventRead.model_fields)
+
+
+def event_values_from_payload(payload: EventCreate) -> dict[str, Any]:
+    """Map a validated `EventCreate` to the column values of an `Event` row."""
+    return {
+        "kind": payload.kind,
+        "text": payload.text,
+        "why": payload.why,
+        "source": payload.source,
+        "tags": payload.tags,
+        "meta": payload.meta,
+        "due_at": payload.due_at,
+    }
 
 
 def create_event(session: Session, payload: EventCreate) -> Event:
     """Use in API and the CLI to create events in the DB."""
-    ev = Event(
-        kind=payload.kind,
-        text=payload.text,
-        why=payload.why,
-        source=payload.source,
-        tags=payload.tags,
-        meta=payload.meta,
-        due_at=payload.due_at,
-    )
+    ev = Event(**event_values_from_payload(payload))
     session.add(ev)
+    session.flush()
+    publish_event_changes(session, [ev], EventChangeKind.created)
     session.commit()
     session.refresh(ev)
+    cache.invalidate_events([ev])
     return ev
 
 
+def create_events_bulk(
+    session: Session, payloads: Iterable[EventCreate], *, chunk_size: int = DEFAULT_BULK_CHUNK_SIZE
+) -> list[Row[Any]]:
+    """Create many events with one multi-row `INSERT ... RETURNING` per chunk.
+
+    Each chunk is committed in its own transaction, so a failure only loses the chunk being written.
+    The created rows are returned as plain rows, they are not tracked by the session's identity map,
+    hence the commits do not expire them and they can be read without a refresh per event.
+    """
+    stmt = insert(Event.__table__).returning(*EVENT_READ_COLUMNS, sort_by_parameter_order=True)
+    created: list[Row[Any]] = []
+    for chunk in chunked(payloads, chunk_size):
+        rows = session.execute(stmt, [event_values_from_payload(payload) for payload in chunk]).all()
+        publish_event_changes(session, rows, EventChangeKind.created)
+        session.commit()
+        cache.invalidate_events(rows)
+        created.extend(rows)
+    return created
+
+
 def get_event_by_id(session: Session, event_id: int) -> Event | None:
     """Fetch an event by its ID."""
     return session.get(Event, event_id)
 
 
-def list_events_between(session: Session, start: datetime, end: datetime) -> list[Event]:
-    """List events created on or after `start` and before `end`."""
-    stmt = (
+def events_between_stmt(start: datetime, end: datetime) -> Select[tuple[Event]]:
+    """Select the events created on or after `start` and before `end`, oldest first."""
+    return (
         select(Event)
         .where(Event.created_at >= start, Event.created_at < end)
         .order_by(Event.created_at.asc(), Event.id.asc())
     )
-    return list(session.execute(stmt).scalars())
 
 
-def list_week(session: Session, anchor: date | None = None) -> list[Event]:
+def with_tags(stmt: Select[tuple[Event]], tags: Collection[str], match: TagMatch = TagMatch.all) -> Select[tuple[Event]]:
+    """Restrict `stmt` to the events with all (`@>`) or any (`&&`) of `tags`, unchanged if `tags` is empty.
+
+    Both operators are answered by the GIN index `ix_events_tags`, so the matching events are found by
+    probing the index for each tag rather than by reading every row. SQLite has no such index, see `has_tags`.
+    """
+    if not tags:
+        return stmt
+    tags = list(tags)
+    return stmt.where(has_tags(Event.tags, tags, match_any=match == TagMatch.any))
+
+
+def events_by_tags_stmt(tags: Collection[str], *, match: TagMatch = TagMatch.all) -> Select[tuple[Event]]:
+    """Select the events with all or any of `tags`, oldest first. Without tags, no event matches."""
+    stmt = select(Event) if tags else select(Event).where(false())
+    return with_tags(stmt, tags, match).order_by(Event.created_at.asc(), Event.id.asc())
+
+
+def list_events_by_tags(
+    session: Session, tags: Collection[str], *, match: TagMatch = TagMatch.all, limit: int | None = None
+) -> list[Event]:
+    """List the events with all of `tags`, or any of them if `match` is `TagMatch.any`, oldest first.
+
+    At most `limit` events are returned if it is set.
+    """
+    return list(session.execute(events_by_tags_stmt(tags, match=match).limit(limit)).scalars())
+
+
+def list_event_rows_by_tags(
+    session: Session, tags: Collection[str], *, match: TagMatch = TagMatch.all, limit: int | None = None
+) -> list[Row[Any]]:
+    """Like `list_events_by_tags`, but returns plain rows of the `EventRead` columns, for the lean read path."""
+    return list(session.execute(as_event_rows(events_by_tags_stmt(tags, match=match).limit(limit))))
+
+
+def list_events_between(session: Session, start: datetime, end: datetime) -> list[Event]:
+    """List events created on or after `start` and before `end`."""
+    return list(session.execute(events_between_stmt(start, end)).scalars())
+
+
+def events_page_stmt(
+    cursor: str | None = None,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    meta: Sequence[str] = (),
+) -> Select[tuple[Event]]:
+    """Select one page of events for `list_events_page`, plus one row telling whether there is a next page.
+
+    Raises a ValueError if the cursor or a meta filter is invalid.
+    """
+    stmt = select(Event)
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Event.created_at, Event.id) > tuple_(*decode_cursor(cursor)))
+    if start is not None:
+        stmt = stmt.where(Event.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Event.created_at < end)
+    if kind is not None:
+        stmt = stmt.where(Event.kind == kind.value)
+    if source is not None:
+        stmt = stmt.where(Event.source == source)
+    if tag is not None:
+        stmt = stmt.where(has_tags(Event.tags, [tag]))
+    if meta:
+        stmt = stmt.where(*meta_conditions(meta))
+
+    # One extra row tells whether there is a next page, without a separate COUNT query
+    return stmt.order_by(Event.created_at.asc(), Event.id.asc()).limit(limit + 1)
+
+
+def list_events_page(
+    session: Session,
+    cursor: str | None = None,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    meta: Sequence[str] = (),
+) -> tuple[list[Event], str | None]:
+    """List one page of events ordered like `list_events_between`, using keyset pagination.
+
+    `cursor` is the `next_cursor` returned with the previous page, or None for the first page.
+    The page continues strictly after the `(created_at, id)` encoded in the cursor, so every page is an
+    index range scan on `ix_events_created_at_id`, however deep the client pages (unlike OFFSET).
+    Only the events meeting all the `meta` filters are listed, see `meta_filters` for their syntax.
+    Returns the events and the cursor of the next page, which is None on the last page.
+    Raises a ValueError if the cursor or a meta filter is invalid.
+    """
+    stmt = events_page_stmt(cursor, limit=limit, start=start, end=end, kind=kind, source=source, tag=tag, meta=meta)
+    return _split_page(list(session.execute(stmt).scalars()), limit)
+
+
+def list_event_rows_page(
+    session: Session,
+    cursor: str | None = None,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    kind: EventKind | None = None,
+    source: str | None = None,
+    tag: str | None = None,
+    meta: Sequence[str] = (),
+) -> tuple[list[Row[Any]], str | None]:
+    """Like `list_events_page`, but returns plain rows of the `EventRead` columns, for the lean read path."""
+    stmt = events_page_stmt(cursor, limit=limit, start=start, end=end, kind=kind, source=source, tag=tag, meta=meta)
+    return _split_page(list(session.execute(as_event_rows(stmt))), limit)
+
+
+def _split_page(items: list[T], limit: int) -> tuple[list[T], str | None]:
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1].created_at, items[-1].id)
+
+
+def as_event_rows(stmt: Select[tuple[Event]]) -> Select[Any]:
+    """Select the `EventRead` columns of the events of `stmt` as plain rows.
+
+    Rows skip the identity map and the attribute instrumentation of ORM objects, and can be serialized
+    to JSON directly, which makes large lists several times cheaper to send (see `benchmarks/`).
+    """
+    return stmt.with_only_columns(*EVENT_READ_COLUMNS)
+
+
+@dataclass(frozen=True)
+class EventsVersion:
+    """Version of the events selected by a statement, see `get_events_version`."""
+
+    etag: str
+    # Latest creation or completion among the events, None if there are none
+    last_modified: datetime | None
+
+
+def get_events_version(session: Session, stmt: Select[tuple[Event]]) -> EventsVersion:
+    """Compute a version which changes whenever an event selected by `stmt` is created, updated or deleted.
+
+    It costs one aggregate query over the selected rows, without loading nor serializing them.
+    Postgres sets the `xmin` system column of a row to the ID of the transaction which wrote it, so the sum
+    of `xmin` changes on every update, the count on deletes and the max `id` on inserts. SQLite has no
+    such column: there the rows are concatenated and hashed instead, which reads them but stays local.
+    """
+    modified_at = case((Event.completed_at > Event.created_at, Event.completed_at), else_=Event.created_at)
+    if session.get_bind().dialect.name == "postgresql":
+        row_version = cast(cast(literal_column("xmin"), Text), BigInteger)
+        combine_versions = func.sum
+    else:
+        row_version = func.json_array(*EVENT_READ_COLUMNS)
+        # In the order of `stmt`
+        combine_versions = func.group_concat
+    rows = stmt.with_only_columns(Event.id, modified_at.label("modified_at"), row_version.label("row_version")).subquery()
+    count, max_id, versions, last_modified = session.execute(
+        select(func.count(), func.max(rows.c.id), combine_versions(rows.c.row_version), func.max(rows.c.modified_at))
+    ).one()
+    digest = hashlib.blake2b(f"{count}:{max_id}:{versions}".encode(), digest_size=8).hexdigest()
+    # Weak, the same events may be sent in different encodings
+    return EventsVersion(etag=f'W/"{digest}"', last_modified=last_modified)
+
+
+def list_week(
+    session: Session, anchor: date | None = None, *, tags: Collection[str] = (), meta: Sequence[str] = ()
+) -> list[Event]:
     """List events created during the week of `anchor` date.
-    Defaults to current week if `anchor` is None.
+    Defaults to current week if `anchor` is None. Only the events with all of `tags` and meeting all the
+    `meta` filters are listed, if any. Raises a ValueError if a meta filter is invalid.
+    """
+    stmt = with_tags(events_between_stmt(*week_bounds(anchor)), tags).where(*meta_conditions(meta))
+    return list(session.execute(stmt).scalars())
+
+
+def list_week_cached(
+    session: Session, anchor: date | None = None, *, version: Hashable | None = None
+) -> list[EventRead]:
+    """Like `list_week`, but served from the read-through cache when possible.
+
+    Pass the `EventsVersion` of the week to also reload the entry if another process changed the week.
     """
-    start, end = week_bounds(anchor)
-    return list_events_between(session, start, end)
+    stmt = as_event_rows(events_between_stmt(*week_bounds(anchor)))
+    return cache.read_through(cache.week_key(anchor), lambda: cache.snapshot(session.execute(stmt)), version=version)
 
 
-def list_todo(session: Session, *, pending_only: bool = True) -> list[Event]:
+def list_todo(
+    session: Session, *, pending_only: bool = True, tags: Collection[str] = (), meta: Sequence[str] = ()
+) -> list[Event]:
     """List all actions as a todo list.
 
     If `pending_only` is True, only returns actions which have a non-null `due_at`
-    and null `completed_at`.
+    and null `completed_at`. If `tags` are given, only returns actions with all of them, and if `meta`
+    filters are given, only the actions meeting all of them. Raises a ValueError if a meta filter is invalid.
     """
     # Actions are the only kind of event in todo list
     stmt = select(Event).where(Event.kind == EventKind.action.value)
@@ -63,6 +315,7 @@ def list_todo(session: Session, *, pending_only: bool = True) -> list[Event]:
     # Pending only = the event has a non-null `due_at`` field and null `completed_at` field
     if pending_only:
         stmt = stmt.where(Event.due_at.is_not(None)).where(Event.completed_at.is_(None))
+    stmt = with_tags(stmt, tags).where(*meta_conditions(meta))
 
     stmt = stmt.order_by(Event.created_at.asc(), Event.id.asc())
     return list(session.execute(stmt).scalars())
@@ -92,6 +345,119 @@ def mark_event_completed(session: Session, event_id: str, completed_at: datetime
 
     event.completed_at = completed_at or utcnow()
     session.add(event)
+    session.flush()
+    publish_event_changes(session, [event], EventChangeKind.completed)
     session.commit()
     session.refresh(event)
+    cache.invalidate_events([event])
     return event
+
+
+def complete_events(session: Session, ids: Iterable[int], completed_at: datetime | None = None) -> list[Row[Any]]:
+    """Mark the pending events among `ids` as completed at `completed_at` (now by default) and commit.
+
+    One `UPDATE ... WHERE id = ANY(:ids) RETURNING` completes them all, whatever their number. Events which
+    do not exist or are already completed are left alone: the returned rows, of the `EventRead` columns,
+    are the events completed by this call.
+    """
+    stmt = (
+        update(Event.__table__)
+        .where(has_id_in(Event.id, list(ids)), Event.completed_at.is_(None))
+        .values(completed_at=completed_at or utcnow())
+        .returning(*EVENT_READ_COLUMNS)
+    )
+    rows = session.execute(stmt).all()
+    publish_event_changes(session, rows, EventChangeKind.completed)
+    session.commit()
+    cache.invalidate_events(rows)
+    return rows
+
+
+def update_events(
+    session: Session,
+    ids: Iterable[int],
+    *,
+    add_tags: Sequence[str] = (),
+    remove_tags: Sequence[str] = (),
+    meta: Mapping[str, Any] | None = None,
+    unset_meta: Sequence[str] = (),
+) -> list[Row[Any]]:
+    """Edit the tags and meta of the events `ids` with a single `UPDATE ... RETURNING`, and commit.
+
+    `remove_tags` are removed, then the `add_tags` an event does not have yet are appended, in order.
+    `meta` is merged into the meta of each event (JSONB `||`, its top-level keys replace the existing
+    ones), then the `unset_meta` keys are removed. Returns the rows, of the `EventRead` columns, of the
+    updated events. Raises a ValueError if there is nothing to update.
+
+    SQLite has no array nor JSONB operators: there the events are read, edited in Python and written back
+    one by one, in the same transaction.
+    """
+    if not (add_tags or remove_tags or meta or unset_meta):
+        msg = "Nothing to update, pass add_tags, remove_tags, meta or unset_meta."
+        raise ValueError(msg)
+    ids = list(ids)
+    if session.get_bind().dialect.name == "postgresql":
+        values = _edited_columns(add_tags, remove_tags, meta, unset_meta)
+        stmt = update(Event.__table__).where(has_id_in(Event.id, ids)).values(values).returning(*EVENT_READ_COLUMNS)
+        rows = session.execute(stmt).all()
+    else:
+        rows = _update_events_one_by_one(
+            session, ids, add_tags=add_tags, remove_tags=remove_tags, meta=meta or {}, unset_meta=unset_meta
+        )
+    publish_event_changes(session, rows, EventChangeKind.updated)
+    session.commit()
+    cache.invalidate_events(rows)
+    return rows
+
+
+def _edited_columns(
+    add_tags: Sequence[str], remove_tags: Sequence[str], meta: Mapping[str, Any] | None, unset_meta: Sequence[str]
+) -> dict[str, Any]:
+    """Build the SQL expressions of the new tags and meta for `update_events`, with the PostgreSQL operators."""
+    values: dict[str, Any] = {}
+    if add_tags or remove_tags:
+        tags = Event.tags
+        for tag in dict.fromkeys(remove_tags):
+            tags = func.array_remove(tags, tag)
+        if add_tags:
+            added = func.unnest(cast(list(dict.fromkeys(add_tags)), ARRAY(String))).table_valued("tag", with_ordinality="n").render_derived()
+            # Compared with the tags left after the removals, so a tag both removed and added moves to the end
+            missing = select(added.c.tag).where(added.c.tag != all_(tags)).order_by(added.c.n)
+            tags = func.array_cat(tags, func.array(missing.scalar_subquery()))
+        values["tags"] = tags
+    if meta or unset_meta:
+        merged = Event.meta
+        if meta:
+            merged = merged.op("||")(cast(dict(meta), JSONB))
+        if unset_meta:
+            merged = merged.op("-")(cast(list(unset_meta), ARRAY(Text)))
+        values["meta"] = merged
+    return values
+
+
+def _update_events_one_by_one(
+    session: Session,
+    ids: list[int],
+    *,
+    add_tags: Sequence[str],
+    remove_tags: Sequence[str],
+    meta: Mapping[str, Any],
+    unset_meta: Sequence[str],
+) -> list[Row[Any]]:
+    """Apply the edits of `update_events` in Python, for the backends without its array and JSONB operators."""
+    current = session.execute(select(Event.id, Event.tags, Event.meta).where(has_id_in(Event.id, ids))).all()
+    removed = set(remove_tags)
+    rows = []
+    for event_id, tags, event_meta in current:
+        values: dict[str, Any] = {}
+        if add_tags or remove_tags:
+            kept = [tag for tag in tags if tag not in removed]
+            values["tags"] = kept + [tag for tag in dict.fromkeys(add_tags) if tag not in kept]
+        if meta or unset_meta:
+            merged = {**event_meta, **meta}
+            for key in unset_meta:
+                merged.pop(key, None)
+            values["meta"] = merged
+        stmt = update(Event.__table__).where(Event.id == event_id).values(values).returning(*EVENT_READ_COLUMNS)
+        rows.append(session.execute(stmt).one())
+    return rows
@@ -0,0 +1,247 @@
+"""Stream events out of the DB as NDJSON, CSV or Parquet.
+
+Rows are read through a server-side cursor and encoded one chunk at a time, so an export uses
+constant memory and the first bytes are available as soon as the first chunk is fetched.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Iterator, Sequence
+from datetime import datetime
+from typing import Any, Protocol
+
+from pydantic_core import to_json
+from sqlalchemy import Row, Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from poppy.core.formats import DEFAULT_EXPORT_CHUNK_SIZE, ExportFormat
+from poppy.db.models import Event
+from poppy.services.importer import COPY_COLUMNS
+
+EXPORT_COLUMNS = ("id", *COPY_COLUMNS)
+
+
+def export_stmt(start: datetime | None = None, end: datetime | None = None) -> Select[Any]:
+    """Select the events created in `[start, end)`, ordered like `list_events_between`.
+
+    Either bound can be omitted to export from the beginning or up to the end of history.
+    """
+    stmt = select(*(Event.__table__.c[column] for column in EXPORT_COLUMNS))
+    if start is not None:
+        stmt = stmt.where(Event.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Event.created_at < end)
+    return stmt.order_by(Event.created_at.asc(), Event.id.asc())
+
+
+def iter_event_row_chunks(
+    session: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> Iterator[Sequence[Row[Any]]]:
+    """Yield the rows of `export_stmt` in chunks of `chunk_size` rows.
+
+    `yield_per` makes the driver use a server-side cursor, only `chunk_size` rows are held at a time.
+    """
+    yield from session.execute(export_stmt(start, end), execution_options={"yield_per": chunk_size}).partitions()
+
+
+async def iter_event_row_chunks_async(
+    session: AsyncSession,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[Sequence[Row[Any]]]:
+    """Async version of `iter_event_row_chunks`, streaming from the server-side cursor with `AsyncSession.stream`."""
+    result = await session.stream(export_stmt(start, end), execution_options={"yield_per": chunk_size})
+    async for rows in result.partitions():
+        yield rows
+
+
+class ChunkEncoder(Protocol):
+    """Encodes an export chunk by chunk: `header()`, then `encode()` for every chunk, then `finish()`."""
+
+    def header(self) -> bytes: ...  # noqa: D102
+
+    def encode(self, rows: Sequence[Row[Any]]) -> bytes: ...  # noqa: D102
+
+    def finish(self) -> bytes: ...  # noqa: D102
+
+
+class NdjsonEncoder:
+    """Newline delimited JSON objects, with the same field names as `EventRead`."""
+
+    def header(self) -> bytes:  # noqa: D102
+        return b""
+
+    def encode(self, rows: Sequence[Row[Any]]) -> bytes:  # noqa: D102
+        return b"".join(to_json(row._asdict()) + b"\n" for row in rows)
+
+    def finish(self) -> bytes:  # noqa: D102
+        return b""
+
+
+class CsvEncoder:
+    """CSV rows after a header row, with `tags` and `meta` as JSON so that `poppy import` reads them back unchanged."""
+
+    def __init__(self) -> None:  # noqa: D107
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self) -> bytes:  # noqa: D102
+        self._writer.writerow(EXPORT_COLUMNS)
+        return self._drain()
+
+    def encode(self, rows: Sequence[Row[Any]]) -> bytes:  # noqa: D102
+        for row in rows:
+            values = row._asdict()
+            values["tags"] = json.dumps(values["tags"])
+            values["meta"] = json.dumps(values["meta"])
+            self._writer.writerow(
+                value.isoformat() if isinstance(value, datetime) else value for value in values.values()
+            )
+        return self._drain()
+
+    def finish(self) -> bytes:  # noqa: D102
+        return b""
+
+
+def import_pyarrow() -> tuple[Any, Any]:
+    """Import pyarrow lazily, it is an optional dependency only needed for Parquet exports."""
+    try:
+        import pyarrow as pa  # noqa: PLC0415
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError as e:
+        msg = "Parquet export requires pyarrow, install poppy with the `parquet` extra."
+        raise RuntimeError(msg) from e
+    return pa, pq
+
+
+class ParquetEncoder:
+    """A Parquet file with one row group per chunk. Requires the `parquet` extra (pyarrow)."""
+
+    def __init__(self) -> None:  # noqa: D107
+        pa, pq = import_pyarrow()
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("kind", pa.string()),
+            ("text", pa.string()),
+            ("why", pa.string()),
+            ("source", pa.string()),
+            ("tags", pa.list_(pa.string())),
+            # Parquet has no JSON type, meta is stored as its JSON text
+            ("meta", pa.string()),
+            ("due_at", pa.timestamp("us", tz="UTC")),
+            ("completed_at", pa.timestamp("us", tz="UTC")),
+        ])
+        self._sink = _DrainableSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+
+    def header(self) -> bytes:  # noqa: D102
+        return self._sink.drain()
+
+    def encode(self, rows: Sequence[Row[Any]]) -> bytes:  # noqa: D102
+        columns = {name: [getattr(row, name) for row in rows] for name in EXPORT_COLUMNS}
+        columns["meta"] = [json.dumps(meta) for meta in columns["meta"]]
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        """Close the writer, which appends the Parquet footer."""
+        self._writer.close()
+        return self._sink.drain()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object handing over the bytes written so far, so that they are not kept in memory."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._pending += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """Return and forget the bytes written since the last call."""
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+
+ENCODERS: dict[ExportFormat, type[ChunkEncoder]] = {
+    ExportFormat.ndjson: NdjsonEncoder,
+    ExportFormat.csv: CsvEncoder,
+    ExportFormat.parquet: ParquetEncoder,
+}
+
+
+def make_encoder(fmt: ExportFormat) -> ChunkEncoder:
+    """Create the encoder of `fmt`, raising a `RuntimeError` if its optional dependencies are missing."""
+    return ENCODERS[fmt]()
+
+
+def export_events(
+    session: Session,
+    fmt: ExportFormat,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Yield the encoded export of the events created in `[start, end)`, one chunk of bytes at a time.
+
+    Raises a `RuntimeError` straight away, before anything is streamed, if the format is not available.
+    """
+    encoder = make_encoder(fmt)
+    return _encode_chunks(encoder, iter_event_row_chunks(session, start, end, chunk_size=chunk_size))
+
+
+def _encode_chunks(encoder: ChunkEncoder, chunks: Iterator[Sequence[Row[Any]]]) -> Iterator[bytes]:
+    yield encoder.header()
+    for rows in chunks:
+        yield encoder.encode(rows)
+    yield encoder.finish()
+
+
+def export_events_async(
+    session: AsyncSession,
+    fmt: ExportFormat,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """Async version of `export_events`, for `StreamingResponse` in the `async def` FastAPI routes."""
+    encoder = make_encoder(fmt)
+    return _encode_chunks_async(encoder, iter_event_row_chunks_async(session, start, end, chunk_size=chunk_size))
+
+
+async def _encode_chunks_async(encoder: ChunkEncoder, chunks: AsyncIterator[Sequence[Row[Any]]]) -> AsyncIterator[bytes]:
+    yield encoder.header()
+    async for rows in chunks:
+        yield encoder.encode(rows)
+    yield encoder.finish()
@@ -0,0 +1,186 @@
+"""Stream events from NDJSON or CSV files into the DB using PostgreSQL `COPY`.
+
+The import is a generator pipeline: lines are parsed into records, records are validated into
+`EventImport` models, and the models are written in bounded batches. Only one batch is held in memory
+at a time, so memory stays flat regardless of the size of the input. SQLite has no `COPY`, the batches
+are written with one multi-row `INSERT` each instead.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+from psycopg.types.json import Jsonb
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventImport
+from poppy.core.formats import DEFAULT_IMPORT_BATCH_SIZE, ImportFormat
+from poppy.db.models import Event
+from poppy.services import cache
+from poppy.services.event_handlers import event_values_from_payload
+from poppy.services.utils import chunked, utcnow
+
+# Errors kept in memory for the final report, the rest are only counted
+MAX_REPORTED_ERRORS = 1_000
+
+COPY_COLUMNS = ("created_at", "kind", "text", "why", "source", "tags", "meta", "due_at", "completed_at")
+COPY_STATEMENT = f"COPY {Event.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+CSV_LIST_SEPARATOR = ";"
+
+
+@dataclass(frozen=True)
+class LineError:
+    """A line of the import file that could not be imported."""
+
+    line_number: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    """Summary of an import run."""
+
+    imported: int = 0
+    failed: int = 0
+    errors: list[LineError] = field(default_factory=list)
+
+    def add_error(self, error: LineError) -> None:
+        """Count the error, and keep it for the report unless too many were kept already."""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+
+def iter_ndjson_records(stream: TextIO) -> Iterator[tuple[int, dict[str, Any] | LineError]]:
+    """Yield `(line_number, record)` for each non blank line, or a `LineError` if it is not a JSON object."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, LineError(line_number, f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, LineError(line_number, "Expected a JSON object")
+            continue
+        yield line_number, record
+
+
+def iter_csv_records(stream: TextIO) -> Iterator[tuple[int, dict[str, Any] | LineError]]:
+    """Yield `(line_number, record)` for each CSV row, the first row being the header.
+
+    Empty cells are treated as missing values and `meta` is a JSON object. `tags` are either a JSON array,
+    as written by `poppy export`, or separated by `;` for files written by hand.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # DictReader counts the header as a line, so this is the line number in the file
+        line_number = reader.line_num
+        record: dict[str, Any] = {key: value for key, value in row.items() if key is not None and value != ""}
+        if "tags" in record and not record["tags"].lstrip().startswith("["):
+            record["tags"] = [tag.strip() for tag in record["tags"].split(CSV_LIST_SEPARATOR) if tag.strip()]
+        try:
+            for column in ("tags", "meta"):
+                if isinstance(record.get(column), str):
+                    record[column] = json.loads(record[column])
+        except json.JSONDecodeError as e:
+            yield line_number, LineError(line_number, f"Invalid JSON in {column}: {e}")
+            continue
+        yield line_number, record
+
+
+RECORD_READERS: dict[ImportFormat, Callable[[TextIO], Iterator[tuple[int, dict[str, Any] | LineError]]]] = {
+    ImportFormat.ndjson: iter_ndjson_records,
+    ImportFormat.csv: iter_csv_records,
+}
+
+
+def validate_records(
+    records: Iterable[tuple[int, dict[str, Any] | LineError]], report: ImportReport, *, source: str | None = None
+) -> Iterator[EventImport]:
+    """Validate each record into an `EventImport`, recording the failures in `report`.
+
+    `source` is used for the records which do not set one themselves.
+    """
+    for line_number, record in records:
+        if isinstance(record, LineError):
+            report.add_error(record)
+            continue
+        if source is not None:
+            record.setdefault("source", source)
+        try:
+            yield EventImport.model_validate(record)
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'event'}: {err['msg']}" for err in e.errors())
+            report.add_error(LineError(line_number, message))
+
+
+def copy_row_from_event(event: EventImport) -> tuple[Any, ...]:
+    """Order the values of `event` as `COPY_COLUMNS`, adapting them for psycopg."""
+    return (
+        event.created_at or utcnow(),
+        str(event.kind),
+        event.text,
+        event.why,
+        event.source,
+        event.tags,
+        Jsonb(event.meta),
+        event.due_at,
+        event.completed_at,
+    )
+
+
+def copy_events(session: Session, events: Iterable[EventImport]) -> int:
+    """Write `events` with a single `COPY ... FROM STDIN` and commit. Returns the number of rows written."""
+    driver_connection = session.connection().connection.driver_connection
+    written = 0
+    with driver_connection.cursor() as cursor, cursor.copy(COPY_STATEMENT) as copy:
+        for event in events:
+            copy.write_row(copy_row_from_event(event))
+            written += 1
+    session.commit()
+    return written
+
+
+def insert_events(session: Session, events: Iterable[EventImport]) -> int:
+    """Write `events` with a single multi-row `INSERT` and commit, for the backends without `COPY`."""
+    rows = [
+        {**event_values_from_payload(event), "created_at": event.created_at or utcnow(), "completed_at": event.completed_at}
+        for event in events
+    ]
+    if rows:
+        session.execute(insert(Event.__table__), rows)
+    session.commit()
+    return len(rows)
+
+
+def import_events(
+    session: Session,
+    stream: TextIO,
+    fmt: ImportFormat,
+    *,
+    batch_size: int = DEFAULT_IMPORT_BATCH_SIZE,
+    source: str | None = None,
+    on_batch: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """Stream `stream` into the `events` table in batches of `batch_size` rows.
+
+    Lines which fail to parse or validate are skipped and reported, they never abort the import.
+    `on_batch` is called with the running report after each committed batch, e.g. to update a progress bar.
+    """
+    report = ImportReport()
+    write_events = copy_events if session.get_bind().dialect.name == "postgresql" else insert_events
+    events = validate_records(RECORD_READERS[fmt](stream), report, source=source)
+    for batch in chunked(events, batch_size):
+        report.imported += write_events(session, batch)
+        # Imported events can be backdated to any week, a batch touches too many views to drop them one by one
+        cache.invalidate_all()
+        if on_batch is not None:
+            on_batch(report)
+    return report
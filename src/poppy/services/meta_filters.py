@@ -0,0 +1,179 @@
+"""Filter events on the keys of their JSONB `meta`, with a small syntax safe to take from users.
+
+A filter is `meta.KEY` (the key exists) or `meta.KEY OP VALUE`, where `KEY` is one or more names of
+letters, digits and underscores separated by dots for nested objects, e.g. `meta.venue.city`, and `OP`
+is one of `=`, `!=`, `>`, `>=`, `<` and `<=`. `VALUE` is read as JSON when it parses, e.g. `2`, `true` or
+`"007"`, and as a plain string otherwise, e.g. `meta.doi=10.1000/182`.
+
+Filters are turned into SQL operators, never into SQL text: keys are validated and values are bound.
+`=`, `!=` and the existence test use the JSONB containment (`@>`) and jsonpath (`@?`) operators, which
+the GIN index `ix_events_meta` answers for any key. Comparisons read the key with `->`, which an
+expression index on the key answers, see `create_meta_index` and `poppy index meta KEY`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+from sqlalchemy import ColumnElement, String, and_, bindparam, cast, func, not_, text
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
+from sqlalchemy.orm import Session
+
+from poppy.db.models import Event
+from poppy.services.partitions import list_partitions
+
+FILTER_PATTERN = re.compile(
+    r"meta\.(?P<path>[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*)\s*(?:(?P<operator>>=|<=|!=|=|>|<)\s*(?P<value>.*))?", re.DOTALL
+)
+# Postgres truncates longer identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+
+class MetaOperator(StrEnum):
+    """The operators of meta filters."""
+
+    exists = "exists"
+    eq = "="
+    ne = "!="
+    gt = ">"
+    ge = ">="
+    lt = "<"
+    le = "<="
+
+
+@dataclass(frozen=True)
+class MetaFilter:
+    """A parsed meta filter: the keys leading to a value of `meta`, compared to `value` with `operator`."""
+
+    path: tuple[str, ...]
+    operator: MetaOperator
+    value: Any = None
+
+
+def parse_meta_filter(expression: str) -> MetaFilter:
+    """Parse a filter like `meta.priority>=2`, raising a ValueError explaining the syntax if it is invalid."""
+    match = FILTER_PATTERN.fullmatch(expression.strip())
+    if match is None:
+        msg = (
+            f"Invalid meta filter {expression!r}, expected meta.KEY or meta.KEY OP VALUE "
+            "with OP one of =, !=, >, >=, <, <=, e.g. meta.priority>=2."
+        )
+        raise ValueError(msg)
+    path = tuple(match["path"].split("."))
+    if match["operator"] is None:
+        return MetaFilter(path, MetaOperator.exists)
+    raw_value = match["value"].strip()
+    if not raw_value:
+        msg = f"Invalid meta filter {expression!r}, the value is missing."
+        raise ValueError(msg)
+    try:
+        value = json.loads(raw_value)
+    except ValueError:
+        value = raw_value
+    operator = MetaOperator(match["operator"])
+    comparable = isinstance(value, int | float | str) and not isinstance(value, bool)
+    if operator not in {MetaOperator.eq, MetaOperator.ne} and not comparable:
+        msg = f"Invalid meta filter {expression!r}, only numbers and strings can be compared with {operator}."
+        raise ValueError(msg)
+    return MetaFilter(path, operator, value)
+
+
+def meta_value(path: Iterable[str]) -> ColumnElement[Any]:
+    """Select the JSONB value at `path` in `meta`, with the expression the indexes of `create_meta_index` are on.
+
+    The keys are rendered as literals, a bound key would not match the expression of the index.
+    """
+    value: ColumnElement[Any] = Event.meta
+    for key in path:
+        value = value.op("->", return_type=JSONB)(bindparam(None, key, type_=String, literal_execute=True))
+    return value
+
+
+def meta_filter_condition(meta_filter: MetaFilter) -> ColumnElement[bool]:
+    """Turn `meta_filter` into a condition on `events`, see the module docstring for the index it can use."""
+    path = meta_filter.path
+    if meta_filter.operator == MetaOperator.exists:
+        return Event.meta.op("@?", is_comparison=True)(cast("$" + "".join(f'."{key}"' for key in path), JSONPATH))
+
+    if meta_filter.operator in {MetaOperator.eq, MetaOperator.ne}:
+        contained: Any = meta_filter.value
+        for key in reversed(path):
+            contained = {key: contained}
+        condition = Event.meta.contains(contained)
+        # Events without the key do not equal the value either
+        return condition if meta_filter.operator == MetaOperator.eq else not_(condition)
+
+    value = meta_value(path)
+    # Without it, `>` would also match the booleans, arrays and objects, which JSONB orders after numbers
+    json_type = "string" if isinstance(meta_filter.value, str) else "number"
+    return and_(
+        func.jsonb_typeof(value) == json_type,
+        value.op(meta_filter.operator.value, is_comparison=True)(cast(meta_filter.value, JSONB)),
+    )
+
+
+def meta_conditions(expressions: Iterable[str]) -> list[ColumnElement[bool]]:
+    """Parse the filters `expressions` into conditions which events must all meet, see `parse_meta_filter`."""
+    return [meta_filter_condition(parse_meta_filter(expression)) for expression in expressions]
+
+
+def meta_index_name(key: str) -> str:
+    """Return the name of the expression index on `key` of `meta`, e.g. `ix_events_meta_venue__city`.
+
+    Postgres folds unquoted names to lower case but the JSON keys are case-sensitive, so the keys with upper
+    case letters get a hash of their exact spelling, e.g. `ix_events_meta_venue__city_efedfcde` for `venue.City`.
+    """
+    match = FILTER_PATTERN.fullmatch(f"meta.{key}")
+    if match is None or match["operator"] is not None:
+        msg = f"Invalid meta key {key!r}, expected names of letters, digits and underscores separated by dots."
+        raise ValueError(msg)
+    name = f"ix_events_meta_{key.replace('.', '__')}"
+    if not name.islower():
+        name = f"{name.lower()}_{hashlib.blake2b(key.encode(), digest_size=4).hexdigest()}"
+    # The partitions' copies are named like `ix_events_y2026m03_meta_KEY`
+    if len(name) + len("_y2026m03") > MAX_IDENTIFIER_LENGTH:
+        msg = f"The meta key {key!r} is too long to name its index."
+        raise ValueError(msg)
+    return name
+
+
+def create_meta_index(session: Session, key: str, *, concurrently: bool = True) -> bool:
+    """Create the index on the values of `key` of `meta`, e.g. `venue.city`, return False if it already exists.
+
+    Meta filters comparing the key with `>`, `>=`, `<` or `<=` then scan the index, see `meta_value`. With
+    `concurrently`, each partition is indexed without blocking writes, outside of any transaction: the one of
+    `session` is committed first. The partitions created later get a copy of the index.
+    """
+    name = meta_index_name(key)
+    valid = session.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+    if valid:
+        return False
+    # Same expression as `meta_value`, the keys are validated by `meta_index_name`
+    expression = "meta" + "".join(f" -> '{part}'" for part in key.split("."))
+    if concurrently:
+        session.commit()
+        connection = session.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    else:
+        connection = session.connection()
+    # Indexed partition by partition, named like the copies made by `create_partition`. The index of the parent
+    # stays invalid until the index of every partition is attached to it, an interrupted run is resumed by the
+    # next one.
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY events (({expression}))"))
+    for partition in list_partitions(session):
+        partition_index = name.replace("ix_events_", f"ix_{partition.name}_", 1)
+        connection.execute(
+            text(
+                f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {partition_index} "
+                f"ON {partition.name} (({expression}))"
+            )
+        )
+        connection.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+    session.commit()
+    return True
@@ -0,0 +1,90 @@
+"""Notifiers fired by the reminder workers, see `poppy.services.reminders`.
+
+A notifier is any object with a `notify(reminder)` method which raises when the reminder could not be
+delivered, so that it is retried later. Notifiers are shared by the worker threads, hence thread-safe.
+`notifier_from_spec` builds the ones of the command line: `stdout`, `file:PATH` and `webhook:URL`.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import urllib.request
+from pathlib import Path
+from typing import Protocol, TextIO
+
+from poppy.core.reminders import Reminder
+
+DEFAULT_WEBHOOK_TIMEOUT = 10.0
+
+
+class Notifier(Protocol):
+    """Delivers reminders somewhere."""
+
+    def notify(self, reminder: Reminder) -> None:
+        """Deliver `reminder`, raising if it could not be."""
+        ...
+
+
+class StdoutNotifier:
+    """Prints one line per reminder."""
+
+    def __init__(self, stream: TextIO | None = None) -> None:
+        """Print to `stream`, the standard output by default."""
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def notify(self, reminder: Reminder) -> None:  # noqa: D102
+        event = reminder.event
+        due = event.due_at.isoformat(timespec="minutes") if event.due_at else "-"
+        with self._lock:
+            stream = self.stream or sys.stdout
+            stream.write(f"[reminder] due {due}  #{event.id}  [{event.kind}]  {event.text}\n")
+            stream.flush()
+
+
+class FileNotifier:
+    """Appends each reminder to a file as one JSON object per line."""
+
+    def __init__(self, path: str | Path) -> None:  # noqa: D107
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def notify(self, reminder: Reminder) -> None:  # noqa: D102
+        line = reminder.model_dump_json() + "\n"
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class WebhookNotifier:
+    """POSTs each reminder as JSON to a URL, any status other than 2xx is a failure."""
+
+    def __init__(self, url: str, timeout: float = DEFAULT_WEBHOOK_TIMEOUT) -> None:  # noqa: D107
+        if not url.startswith(("http://", "https://")):
+            msg = f"Webhook URLs must be http:// or https:// ones, got {url!r}."
+            raise ValueError(msg)
+        self.url = url
+        self.timeout = timeout
+
+    def notify(self, reminder: Reminder) -> None:  # noqa: D102
+        request = urllib.request.Request(  # noqa: S310
+            self.url,
+            data=reminder.model_dump_json().encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # Raises `HTTPError` on 4xx and 5xx responses
+        with urllib.request.urlopen(request, timeout=self.timeout):  # noqa: S310
+            pass
+
+
+def notifier_from_spec(spec: str) -> Notifier:
+    """Build a notifier from `stdout`, `file:PATH` or `webhook:URL`, raising `ValueError` on other specs."""
+    kind, _, argument = spec.partition(":")
+    if kind == "stdout" and not argument:
+        return StdoutNotifier()
+    if kind == "file" and argument:
+        return FileNotifier(argument)
+    if kind == "webhook" and argument:
+        return WebhookNotifier(argument)
+    msg = f"Unknown notifier {spec!r}, expected stdout, file:PATH or webhook:URL."
+    raise ValueError(msg)
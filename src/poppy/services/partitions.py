@@ -0,0 +1,165 @@
+"""Maintain the monthly partitions of the `events` table.
+
+`events` is partitioned by range of `created_at`, one partition per UTC month named `events_yYYYYmMM`, plus
+the `events_default` partition which catches the events of the months without one. Time-bounded queries
+only scan the partitions of their range, e.g. one or two for a week, and old months are archived by
+detaching their partition, without deleting a single row.
+
+Partitions are created ahead of time by `create_partitions_ahead`, which the API runs at startup and
+`poppy partitions create` runs on demand (e.g. from cron). Creating the partition of a month whose events
+landed in `events_default` moves them to the new partition.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from poppy.services.utils import utcnow
+
+DEFAULT_PARTITION = "events_default"
+ARCHIVE_SCHEMA = "events_archive"
+DEFAULT_MONTHS_AHEAD = 3
+BOUNDS_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+# The columns written by `INSERT`, `search_vector` is generated
+EVENT_COLUMNS = "id, created_at, kind, text, why, source, tags, meta, due_at, completed_at"
+
+
+@dataclass(frozen=True)
+class EventPartition:
+    """A partition of `events`, holding the events created in `[start, end)`, or the default partition."""
+
+    name: str
+    start: datetime | None
+    end: datetime | None
+    estimated_rows: int | None
+
+    @property
+    def is_default(self) -> bool:
+        """Tell whether this is the partition of the events of the months without their own partition."""
+        return self.start is None
+
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    """Return the start of the UTC month of `moment`, shifted by `months`."""
+    moment = moment.astimezone(UTC)
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=UTC)
+
+
+def partition_name(month: datetime) -> str:
+    """Return the name of the partition of the events created during the UTC month of `month`."""
+    month = month_start(month)
+    return f"events_y{month.year:04d}m{month.month:02d}"
+
+
+def list_partitions(session: Session) -> list[EventPartition]:
+    """Return the partitions of `events`, oldest month first and the default partition last."""
+    rows = session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples FROM pg_inherits AS i "
+            "JOIN pg_class AS c ON c.oid = i.inhrelid WHERE i.inhparent = 'events'::regclass"
+        )
+    )
+    partitions = []
+    for name, bound, reltuples in rows:
+        match = BOUNDS_PATTERN.search(bound)
+        start, end = (datetime.fromisoformat(match[1]), datetime.fromisoformat(match[2])) if match else (None, None)
+        # -1 until the partition is first vacuumed or analyzed
+        partitions.append(EventPartition(name, start, end, int(reltuples) if reltuples >= 0 else None))
+    return sorted(partitions, key=lambda partition: (partition.is_default, partition.start))
+
+
+def create_partition(session: Session, month: datetime) -> bool:
+    """Create the partition of the UTC month of `month` and commit, return False if it already exists.
+
+    The events of the month which are in the default partition are moved to the new one. The partition
+    indexes are named after the ones of `events`, e.g. `ix_events_y2026m03_created_at_id`, so that query
+    plans tell which index of the parent they use.
+    """
+    start, end = month_start(month), month_start(month, 1)
+    name = partition_name(start)
+    if session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+
+    bounds = {"start": start, "end": end}
+    in_month = "created_at >= :start AND created_at < :end"
+    moved = session.execute(text(f"SELECT EXISTS (SELECT FROM {DEFAULT_PARTITION} WHERE {in_month})"), bounds).scalar()  # noqa: S608
+    if moved:
+        # Deleted and inserted again through `events`, so that the triggers of the rollups see both
+        session.execute(
+            text(f"CREATE TEMPORARY TABLE moved_events ON COMMIT DROP AS SELECT {EVENT_COLUMNS} FROM events WITH NO DATA")  # noqa: S608
+        )
+        session.execute(
+            text(
+                f"WITH moved AS (DELETE FROM events WHERE {in_month} RETURNING {EVENT_COLUMNS}) "  # noqa: S608
+                "INSERT INTO moved_events SELECT * FROM moved"
+            ),
+            bounds,
+        )
+    session.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF events "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+    if moved:
+        session.execute(text(f"INSERT INTO events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM moved_events"))  # noqa: S608
+    _rename_partition_indexes(session, name)
+    session.commit()
+    return True
+
+
+def _rename_partition_indexes(session: Session, name: str) -> None:
+    # Postgres names them `<partition>_<columns>_idx[N]`, which does not tell apart two indexes on the same columns
+    indexes = session.execute(
+        text(
+            "SELECT child.relname, parent.relname FROM pg_index AS i "
+            "JOIN pg_class AS child ON child.oid = i.indexrelid "
+            "JOIN pg_inherits AS inh ON inh.inhrelid = child.oid "
+            "JOIN pg_class AS parent ON parent.oid = inh.inhparent "
+            "WHERE i.indrelid = CAST(:name AS regclass)"
+        ),
+        {"name": name},
+    )
+    for index_name, parent_index_name in indexes.all():
+        if parent_index_name.startswith("ix_events_"):
+            new_name = parent_index_name.replace("ix_events_", f"ix_{name}_", 1)
+            session.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{new_name}"'))
+
+
+def create_partitions_ahead(
+    session: Session, months_ahead: int = DEFAULT_MONTHS_AHEAD, *, now: datetime | None = None
+) -> list[str]:
+    """Create the partitions of the current month and of the `months_ahead` next ones, return the created ones."""
+    current = month_start(now or utcnow())
+    return [
+        partition_name(month_start(current, months))
+        for months in range(months_ahead + 1)
+        if create_partition(session, month_start(current, months))
+    ]
+
+
+def detach_partitions(session: Session, before: datetime, *, drop: bool = False) -> list[str]:
+    """Detach the partitions of the months ending before `before` and commit, return the detached ones.
+
+    Detached partitions are moved to the `events_archive` schema, where they can be dumped or attached
+    again, or dropped if `drop` is True. Either way their events are not deleted one by one: the weekly
+    rollups keep counting them, so the statistics still cover the archived months (as long as their
+    weeks are not rebuilt).
+    """
+    detached = [
+        partition.name
+        for partition in list_partitions(session)
+        if not partition.is_default and partition.end is not None and partition.end <= before
+    ]
+    if detached and not drop:
+        session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+    for name in detached:
+        session.execute(text(f"ALTER TABLE events DETACH PARTITION {name}"))
+        session.execute(text(f"DROP TABLE {name}" if drop else f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+    session.commit()
+    return detached
@@ -0,0 +1,203 @@
+"""Fire the reminders of pending events when their due date comes, from any number of concurrent workers.
+
+The triggers on `events` keep the `event_reminders` queue up to date (see `poppy.db.models`), so workers
+never scan `events`: each batch is one index range scan of the due reminders, claimed with
+`FOR UPDATE SKIP LOCKED`. Claiming leases the batch: its `remind_at` is pushed `lease` ahead and the claim
+is committed right away, so other workers skip the batch without a transaction staying open while the
+notifiers run (e.g. webhooks timing out). The outcome is then written in a second short transaction, only
+for the reminders still holding this lease. The reminders of a worker which crashes are due again once
+their lease is over.
+
+Delivery is at least once: a reminder is only deleted when all the notifiers succeeded. Failed reminders
+are retried with an exponential backoff, then given up after `max_attempts`.
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable, Sequence
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Row, delete, select, update
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventRead
+from poppy.core.reminders import Reminder
+from poppy.db.models import Event, EventReminder
+from poppy.services.event_handlers import as_event_rows
+from poppy.services.notifiers import Notifier
+from poppy.services.utils import utcnow
+
+DEFAULT_REMINDER_BATCH_SIZE = 100
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BACKOFF = timedelta(seconds=30)
+MAX_RETRY_BACKOFF = timedelta(hours=1)
+MAX_ERROR_LENGTH = 500
+# Longer than the notifiers may take for a batch, a lease which runs out lets another worker fire it again
+DEFAULT_REMINDER_LEASE = timedelta(minutes=15)
+
+
+@dataclass
+class ReminderReport:
+    """Summary of the reminders processed by a worker."""
+
+    fired: int = 0
+    retried: int = 0
+    failed: int = 0
+    # Reminders of events which are gone (their partition was detached), deleted without firing
+    orphaned: int = 0
+
+    @property
+    def claimed(self) -> int:
+        """Number of reminders processed, whatever their outcome."""
+        return self.fired + self.retried + self.failed + self.orphaned
+
+    def add(self, other: ReminderReport) -> None:
+        """Add the counts of `other` to this report."""
+        self.fired += other.fired
+        self.retried += other.retried
+        self.failed += other.failed
+        self.orphaned += other.orphaned
+
+
+@dataclass
+class _Claim:
+    event_id: int
+    remind_at: datetime
+    attempts: int
+    event: Row[Any]
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Return how long to wait before the next attempt, after `attempts` failed ones."""
+    return min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+
+
+def process_due_reminders(
+    session: Session,
+    notifiers: Sequence[Notifier],
+    *,
+    batch_size: int = DEFAULT_REMINDER_BATCH_SIZE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    lease: timedelta = DEFAULT_REMINDER_LEASE,
+    now: datetime | None = None,
+) -> ReminderReport:
+    """Claim up to `batch_size` reminders due at `now` for `lease`, fire them with `notifiers` and record the outcome.
+
+    Reminders locked or leased by other workers are skipped. `now` defaults to the current time.
+    """
+    now = now or utcnow()
+    report = ReminderReport()
+    leased_until = now + lease
+    claims = _claim_due_reminders(session, report, batch_size=batch_size, leased_until=leased_until, now=now)
+
+    errors: dict[int, str] = {}
+    for claim in claims:
+        try:
+            payload = Reminder(event=EventRead.model_validate(claim.event), remind_at=claim.remind_at, attempts=claim.attempts)
+            for notifier in notifiers:
+                notifier.notify(payload)
+        except Exception as e:  # noqa: BLE001 - any failure of a notifier is retried
+            errors[claim.event_id] = f"{type(e).__name__}: {e}"[:MAX_ERROR_LENGTH]
+
+    # Only the reminders still under this lease: not rescheduled by a new due date, nor claimed again
+    held = (EventReminder.remind_at == leased_until, EventReminder.failed_at.is_(None))
+    for claim in claims:
+        error = errors.get(claim.event_id)
+        if error is None:
+            session.execute(delete(EventReminder).where(EventReminder.event_id == claim.event_id, *held))
+            report.fired += 1
+            continue
+        attempts = claim.attempts + 1
+        values: dict[str, Any] = {"attempts": attempts, "last_error": error}
+        if attempts >= max_attempts:
+            values["failed_at"] = now
+            report.failed += 1
+        else:
+            values["remind_at"] = now + retry_delay(attempts)
+            report.retried += 1
+        session.execute(update(EventReminder).where(EventReminder.event_id == claim.event_id, *held).values(values))
+    session.commit()
+    return report
+
+
+def _claim_due_reminders(
+    session: Session, report: ReminderReport, *, batch_size: int, leased_until: datetime, now: datetime
+) -> list[_Claim]:
+    """Lease up to `batch_size` reminders due at `now` until `leased_until`, commit, and return them with their events.
+
+    The reminders of events which are gone are deleted, and counted in `report`.
+    """
+    reminders = session.execute(
+        select(EventReminder)
+        .where(EventReminder.failed_at.is_(None), EventReminder.remind_at <= now)
+        .order_by(EventReminder.remind_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not reminders:
+        session.commit()
+        return []
+
+    # `created_at` prunes the lookup to the partitions of the claimed events
+    rows = session.execute(
+        as_event_rows(
+            select(Event).where(
+                Event.id.in_([reminder.event_id for reminder in reminders]),
+                Event.created_at.in_({reminder.event_created_at for reminder in reminders}),
+            )
+        )
+    )
+    events = {row.id: row for row in rows}
+    claims = []
+    for reminder in reminders:
+        row = events.get(reminder.event_id)
+        if row is None:
+            # The partition of the event was detached
+            session.delete(reminder)
+            report.orphaned += 1
+            continue
+        claims.append(_Claim(reminder.event_id, reminder.remind_at, reminder.attempts, row))
+        reminder.remind_at = leased_until
+    session.commit()
+    return claims
+
+
+def drain_due_reminders(
+    session_scope: Callable[[], AbstractContextManager[Session]],
+    notifiers: Sequence[Notifier],
+    *,
+    batch_size: int = DEFAULT_REMINDER_BATCH_SIZE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> ReminderReport:
+    """Process batches of due reminders until fewer than `batch_size` are due, each in its own session."""
+    report = ReminderReport()
+    while True:
+        with session_scope() as session:
+            batch = process_due_reminders(session, notifiers, batch_size=batch_size, max_attempts=max_attempts)
+        report.add(batch)
+        if batch.claimed < batch_size:
+            return report
+
+
+def run_worker(
+    session_scope: Callable[[], AbstractContextManager[Session]],
+    notifiers: Sequence[Notifier],
+    stop: threading.Event,
+    *,
+    batch_size: int = DEFAULT_REMINDER_BATCH_SIZE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> ReminderReport:
+    """Fire the due reminders every `poll_interval` seconds until `stop` is set, and return what was processed.
+
+    Run one per thread or process for more throughput, they share the work through `SKIP LOCKED`.
+    """
+    report = ReminderReport()
+    while not stop.is_set():
+        report.add(drain_due_reminders(session_scope, notifiers, batch_size=batch_size, max_attempts=max_attempts))
+        stop.wait(poll_interval)
+    return report
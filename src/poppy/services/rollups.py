@@ -0,0 +1,140 @@
+"""Read and rebuild the weekly rollups of events, so that dashboards read one row per week and kind.
+
+The `event_weekly_rollups` rows are maintained by triggers on `events` (see `poppy.db.models`): every insert,
+completion, tag change or deletion adjusts the rollups it touches in the same transaction, whichever code
+path writes. Past weeks are then never aggregated again, except by `rebuild_weekly_rollups`, for backfills
+and repairs.
+"""
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import (
+    Select,
+    and_,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventKind
+from poppy.core.stats import WeeklyRollup
+from poppy.db.models import Event, EventWeeklyRollup
+from poppy.services.utils import week_bounds
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # Naive datetimes are UTC ones, like the dates of the CLI options
+    return moment.replace(tzinfo=UTC) if moment.tzinfo is None else moment.astimezone(UTC)
+
+
+def is_week_start(moment: datetime) -> bool:
+    """Tell whether `moment` is the start of a rollup week, a Monday at midnight UTC."""
+    moment = _as_utc(moment)
+    return week_bounds(moment.date())[0] == moment
+
+
+def align_to_weeks(start: datetime | None, end: datetime | None) -> tuple[datetime | None, datetime | None]:
+    """Widen `[start, end)` to whole weeks: `start` goes back to its week start, `end` on to the next one."""
+    if start is not None:
+        start = week_bounds(_as_utc(start).date())[0]
+    if end is not None:
+        end = _as_utc(end) if is_week_start(end) else week_bounds(_as_utc(end).date())[1]
+    return start, end
+
+
+def _weeks_in_range(stmt: Select[Any], start: datetime | None, end: datetime | None) -> Select[Any]:
+    if start is not None:
+        stmt = stmt.where(EventWeeklyRollup.week_start >= start)
+    if end is not None:
+        stmt = stmt.where(EventWeeklyRollup.week_start < end)
+    return stmt
+
+
+def list_weekly_rollups(
+    session: Session, start: datetime | None = None, end: datetime | None = None, *, kind: EventKind | None = None
+) -> list[WeeklyRollup]:
+    """Return the rollups of the weeks starting in `[start, end)`, oldest week first, then by kind.
+
+    Rollups whose events were all deleted are omitted.
+    """
+    stmt = _weeks_in_range(select(EventWeeklyRollup), start, end).where(EventWeeklyRollup.event_count > 0)
+    if kind is not None:
+        stmt = stmt.where(EventWeeklyRollup.kind == kind.value)
+    stmt = stmt.order_by(EventWeeklyRollup.week_start, EventWeeklyRollup.kind)
+    return [WeeklyRollup.model_validate(rollup) for rollup in session.execute(stmt).scalars()]
+
+
+async def list_weekly_rollups_async(
+    session: AsyncSession, start: datetime | None = None, end: datetime | None = None, *, kind: EventKind | None = None
+) -> list[WeeklyRollup]:
+    """Async version of `list_weekly_rollups`, for the `async def` FastAPI routes."""
+    return await session.run_sync(list_weekly_rollups, start, end, kind=kind)
+
+
+def rebuild_weekly_rollups(session: Session, start: datetime | None = None, end: datetime | None = None) -> int:
+    """Recompute the rollups of the weeks overlapping `[start, end)` from the events, and return how many there are.
+
+    The range is widened to whole weeks, by default all the rollups are rebuilt. Writes to `events` wait
+    until the rebuild is committed, so that the triggers cannot count an event twice, or not at all.
+    """
+    start, end = align_to_weeks(start, end)
+    session.execute(text("LOCK TABLE events IN SHARE MODE"))
+    session.execute(_weeks_in_range(delete(EventWeeklyRollup), start, end))
+
+    week_start = func.date_trunc("week", Event.created_at, "UTC")
+    weekly_events = select(week_start.label("week_start"), Event.kind, Event.completed_at, Event.tags)
+    if start is not None:
+        weekly_events = weekly_events.where(Event.created_at >= start)
+    if end is not None:
+        weekly_events = weekly_events.where(Event.created_at < end)
+    weekly = weekly_events.cte("weekly_events")
+    counts = (
+        select(
+            weekly.c.week_start,
+            weekly.c.kind,
+            func.count().label("event_count"),
+            func.count(weekly.c.completed_at).label("completed_count"),
+        )
+        .group_by(weekly.c.week_start, weekly.c.kind)
+        .subquery("counts")
+    )
+    tag = func.unnest(weekly.c.tags).table_valued("tag").render_derived()
+    per_tag = (
+        select(weekly.c.week_start, weekly.c.kind, tag.c.tag, func.count().label("tag_count"))
+        .select_from(weekly)
+        .join(tag, true())
+        .group_by(weekly.c.week_start, weekly.c.kind, tag.c.tag)
+        .subquery("per_tag")
+    )
+    tag_counts = (
+        select(
+            per_tag.c.week_start,
+            per_tag.c.kind,
+            func.jsonb_object_agg(per_tag.c.tag, per_tag.c.tag_count).label("tag_counts"),
+        )
+        .group_by(per_tag.c.week_start, per_tag.c.kind)
+        .subquery("tag_counts")
+    )
+    rollups = select(
+        counts.c.week_start,
+        counts.c.kind,
+        counts.c.event_count,
+        counts.c.completed_count,
+        func.coalesce(tag_counts.c.tag_counts, cast(literal("{}"), JSONB)),
+    ).outerjoin(tag_counts, and_(tag_counts.c.week_start == counts.c.week_start, tag_counts.c.kind == counts.c.kind))
+    stmt = insert(EventWeeklyRollup).from_select(
+        ["week_start", "kind", "event_count", "completed_count", "tag_counts"], rollups
+    )
+    rebuilt = len(session.execute(stmt.returning(EventWeeklyRollup.week_start)).all())
+    session.commit()
+    return rebuilt
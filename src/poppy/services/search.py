@@ -0,0 +1,186 @@
+"""Full-text search over the text, why and tags of events.
+
+On PostgreSQL, events are matched against the `search_vector` generated column through its GIN index, so
+a search costs milliseconds however many events there are. Only the page of results is ranked twice and
+highlighted: `ts_headline` re-parses the text and is by far the most expensive step.
+
+Other databases (e.g. in tests which run without Postgres) fall back to `InMemorySearchIndex`, an
+inverted index built from the candidate events. It approximates the Postgres behaviour: no stemming, and
+only plain words and `-word` exclusions in queries.
+"""
+from __future__ import annotations
+
+import math
+import re
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventKind, EventRead, EventSearchHit
+from poppy.db.models import Event
+from poppy.services.event_handlers import EVENT_READ_COLUMNS, as_event_rows
+
+DEFAULT_SEARCH_LIMIT = 20
+DEFAULT_HIGHLIGHT = ("<b>", "</b>")
+SEARCH_CONFIG = "english"
+HEADLINE_SEPARATOR = " | "
+
+
+def search_events(
+    session: Session,
+    query: str,
+    *,
+    kind: EventKind | None = None,
+    tags: list[str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    highlight: tuple[str, str] = DEFAULT_HIGHLIGHT,
+) -> list[EventSearchHit]:
+    """Search the events matching `query`, best matches first.
+
+    `query` uses the web search syntax: words are all required, `"quoted phrases"` must be adjacent,
+    `or` separates alternatives and `-word` excludes. Only events of `kind`, with all of `tags` and
+    created in `[start, end)` are searched. The matched words are wrapped in `highlight` in the headlines.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        candidates = session.execute(as_event_rows(_filtered(select(Event), kind=kind, start=start, end=end)))
+        index = InMemorySearchIndex(row for row in candidates if not tags or set(tags) <= set(row.tags))
+        return index.search(query, limit=limit, highlight=highlight)
+
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank_cd(Event.search_vector, tsquery)
+    matches = _filtered(select(Event.id, rank.label("rank")), kind=kind, start=start, end=end)
+    matches = matches.where(Event.search_vector.bool_op("@@")(tsquery))
+    if tags:
+        matches = matches.where(Event.tags.contains(tags))
+    page = matches.order_by(rank.desc(), Event.id.desc()).limit(limit).subquery()
+
+    start_sel, stop_sel = highlight
+    headline = func.ts_headline(
+        SEARCH_CONFIG,
+        func.concat_ws(HEADLINE_SEPARATOR, Event.text, Event.why),
+        tsquery,
+        f'StartSel="{start_sel}", StopSel="{stop_sel}", MinWords=10, MaxWords=30',
+    )
+    stmt = (
+        select(*EVENT_READ_COLUMNS, page.c.rank, headline.label("headline"))
+        .join(page, page.c.id == Event.id)
+        .order_by(page.c.rank.desc(), Event.id.desc())
+    )
+    return [EventSearchHit.model_validate(row) for row in session.execute(stmt)]
+
+
+async def search_events_async(
+    session: AsyncSession,
+    query: str,
+    *,
+    kind: EventKind | None = None,
+    tags: list[str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    highlight: tuple[str, str] = DEFAULT_HIGHLIGHT,
+) -> list[EventSearchHit]:
+    """Async version of `search_events`, for the `async def` FastAPI routes."""
+    return await session.run_sync(
+        search_events, query, kind=kind, tags=tags, start=start, end=end, limit=limit, highlight=highlight
+    )
+
+
+def _filtered(
+    stmt: Select[Any], *, kind: EventKind | None, start: datetime | None, end: datetime | None
+) -> Select[Any]:
+    if kind is not None:
+        stmt = stmt.where(Event.kind == kind.value)
+    if start is not None:
+        stmt = stmt.where(Event.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Event.created_at < end)
+    return stmt
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_TERM_PATTERN = re.compile(r"(-?)(\w+)")
+# The default weights of `ts_rank_cd` for the A (text), B (why) and C (tags) parts of `search_vector`
+FIELD_WEIGHTS = {"text": 1.0, "why": 0.4, "tags": 0.2}
+
+
+def tokenize(value: str) -> list[str]:
+    """Split `value` into lower case words."""
+    return [token.lower() for token in TOKEN_PATTERN.findall(value)]
+
+
+class InMemorySearchIndex:
+    """Pure-Python inverted index of events, used by `search_events` when the DB is not PostgreSQL."""
+
+    def __init__(self, events: Iterable[Any] = ()) -> None:
+        """Index `events`, which can be `Event` objects, rows of the `EventRead` columns or `EventRead` models."""
+        self._events: dict[int, EventRead] = {}
+        # Word -> event ID -> weighted number of occurrences
+        self._postings: defaultdict[str, defaultdict[int, float]] = defaultdict(lambda: defaultdict(float))
+        self._event_tokens: dict[int, set[str]] = {}
+        for ev in events:
+            self.add(ev)
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._events)
+
+    def add(self, ev: Any) -> None:
+        """Index `ev`, replacing a previous version of the same event."""
+        event = EventRead.model_validate(ev)
+        self.remove(event.id)
+        self._events[event.id] = event
+        fields = {"text": event.text, "why": event.why or "", "tags": " ".join(event.tags)}
+        tokens = self._event_tokens[event.id] = set()
+        for field, value in fields.items():
+            for token in tokenize(value):
+                self._postings[token][event.id] += FIELD_WEIGHTS[field]
+                tokens.add(token)
+
+    def remove(self, event_id: int) -> None:
+        """Drop the event `event_id` from the index, if it is indexed."""
+        if self._events.pop(event_id, None) is None:
+            return
+        for token in self._event_tokens.pop(event_id):
+            del self._postings[token][event_id]
+            if not self._postings[token]:
+                del self._postings[token]
+
+    def search(
+        self, query: str, *, limit: int = DEFAULT_SEARCH_LIMIT, highlight: tuple[str, str] = DEFAULT_HIGHLIGHT
+    ) -> list[EventSearchHit]:
+        """Search the events containing all the words of `query` and none of its `-word`, best matches first.
+
+        The rank sums the weighted occurrences of each word, scaled by how rare the word is (its IDF).
+        """
+        required = [term.lower() for sign, term in QUERY_TERM_PATTERN.findall(query) if not sign]
+        excluded = {term.lower() for sign, term in QUERY_TERM_PATTERN.findall(query) if sign}
+        if not required:
+            return []
+        matching = set.intersection(*(set(self._postings.get(term, ())) for term in required))
+        for term in excluded:
+            matching -= set(self._postings.get(term, ()))
+
+        def rank(event_id: int) -> float:
+            return sum(
+                self._postings[term][event_id] * math.log(1 + len(self._events) / len(self._postings[term]))
+                for term in required
+            )
+
+        ranked = sorted(((rank(event_id), event_id) for event_id in matching), reverse=True)[:limit]
+        terms = set(required)
+        hits = []
+        for score, event_id in ranked:
+            event = self._events[event_id]
+            text = HEADLINE_SEPARATOR.join(part for part in (event.text, event.why) if part)
+            headline = TOKEN_PATTERN.sub(
+                lambda match: f"{highlight[0]}{match[0]}{highlight[1]}" if match[0].lower() in terms else match[0], text
+            )
+            hits.append(EventSearchHit(**event.model_dump(), rank=score, headline=headline))
+        return hits
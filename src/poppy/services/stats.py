@@ -0,0 +1,200 @@
+"""Aggregate events in SQL, so that reports only transfer the aggregates, however long the history grows.
+
+Each statistic is one `GROUP BY` or `FILTER` query over the `ix_events_created_at_id` range of the report.
+Tags are counted by unnesting the `tags` arrays of the range and grouping the tags.
+Weekly counts over whole weeks are read from the `event_weekly_rollups` table instead, one row per week
+and kind, see `poppy.services.rollups`.
+
+On SQLite, which has neither the triggers filling the rollups nor `date_trunc` and `unnest`, the same
+statistics are computed from `events` with `strftime`, `julianday` and `json_each`.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    and_,
+    extract,
+    func,
+    select,
+    true,
+    type_coerce,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventKind
+from poppy.core.stats import (
+    ActionStats,
+    EventStats,
+    PeriodKindCount,
+    StatsPeriod,
+    TagCount,
+)
+from poppy.db.models import Event
+from poppy.db.portable import UTCDateTime
+from poppy.services.rollups import is_week_start, list_weekly_rollups
+from poppy.services.utils import utcnow
+
+# `strftime` format and modifiers of the start of each period on SQLite, the same number of modifiers each
+# so that the statement only differs by its parameters. Weeks start on Monday, like `date_trunc('week')`.
+SQLITE_PERIOD_STARTS = {
+    StatsPeriod.day: ("%Y-%m-%d 00:00:00", "+0 days", "+0 days"),
+    StatsPeriod.week: ("%Y-%m-%d 00:00:00", "weekday 0", "-6 days"),
+    StatsPeriod.month: ("%Y-%m-01 00:00:00", "+0 days", "+0 days"),
+    StatsPeriod.year: ("%Y-01-01 00:00:00", "+0 days", "+0 days"),
+}
+SECONDS_PER_DAY = 86400
+
+
+def _is_postgresql(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def _period_start(session: Session, period: StatsPeriod) -> ColumnElement[datetime]:
+    if _is_postgresql(session):
+        # The time zone argument makes the periods UTC ones, whatever the time zone of the DB session
+        return func.date_trunc(period.value, Event.created_at, "UTC")
+    # SQLite stores UTC already
+    period_format, *modifiers = SQLITE_PERIOD_STARTS[period]
+    return type_coerce(func.strftime(period_format, Event.created_at, *modifiers), UTCDateTime)
+
+
+def _in_range(stmt: Select[Any], start: datetime | None, end: datetime | None) -> Select[Any]:
+    if start is not None:
+        stmt = stmt.where(Event.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Event.created_at < end)
+    return stmt
+
+
+def count_events_per_period_and_kind(
+    session: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    period: StatsPeriod = StatsPeriod.week,
+) -> list[PeriodKindCount]:
+    """Count the events created in `[start, end)` per `period` and kind, oldest period first.
+
+    Periods and kinds without events are omitted.
+    """
+    whole_weeks = period == StatsPeriod.week and all(bound is None or is_week_start(bound) for bound in (start, end))
+    if whole_weeks and _is_postgresql(session):
+        return [
+            PeriodKindCount(period_start=rollup.week_start, kind=rollup.kind, count=rollup.event_count)
+            for rollup in list_weekly_rollups(session, start, end)
+        ]
+    period_start = _period_start(session, period).label("period_start")
+    stmt = (
+        _in_range(select(period_start, Event.kind, func.count().label("count")), start, end)
+        .group_by(period_start, Event.kind)
+        .order_by(period_start, Event.kind)
+    )
+    return [PeriodKindCount.model_validate(row) for row in session.execute(stmt)]
+
+
+def get_action_stats(
+    session: Session, start: datetime | None = None, end: datetime | None = None, *, now: datetime | None = None
+) -> ActionStats:
+    """Compute the completion statistics of the actions created in `[start, end)`, in a single scan.
+
+    Actions are overdue if they are pending and due before `now`, which defaults to the current time.
+    """
+    now = now or utcnow()
+    pending = and_(Event.due_at.is_not(None), Event.completed_at.is_(None))
+    if _is_postgresql(session):
+        seconds_to_complete = extract("epoch", Event.completed_at - Event.created_at)
+    else:
+        seconds_to_complete = (func.julianday(Event.completed_at) - func.julianday(Event.created_at)) * SECONDS_PER_DAY
+    stmt = _in_range(
+        select(
+            func.count().label("total"),
+            func.count().filter(Event.completed_at.is_not(None)).label("completed"),
+            func.count().filter(pending).label("pending"),
+            func.count().filter(pending, Event.due_at < now).label("overdue"),
+            func.avg(seconds_to_complete).label("avg_seconds_to_complete"),
+        ).where(Event.kind == EventKind.action.value),
+        start,
+        end,
+    )
+    row = session.execute(stmt).one()
+    return ActionStats(
+        total=row.total,
+        completed=row.completed,
+        pending=row.pending,
+        overdue=row.overdue,
+        completion_rate=row.completed / row.total if row.total else None,
+        avg_seconds_to_complete=float(row.avg_seconds_to_complete) if row.avg_seconds_to_complete is not None else None,
+    )
+
+
+def count_tags(
+    session: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    kind: EventKind | None = None,
+    limit: int | None = None,
+) -> list[TagCount]:
+    """Count the events created in `[start, end)` with each tag, most used tags first, then by name.
+
+    Only the events of `kind` are counted if it is set, and only the `limit` most used tags are returned.
+    """
+    if _is_postgresql(session):
+        tags = func.unnest(Event.tags).table_valued("tag").render_derived()
+        tag = tags.c.tag
+    else:
+        tags = func.json_each(Event.tags).table_valued("value")
+        tag = tags.c.value.label("tag")
+    count = func.count().label("count")
+    stmt = _in_range(select(tag, count).select_from(Event).join(tags, true()), start, end)
+    if kind is not None:
+        stmt = stmt.where(Event.kind == kind.value)
+    stmt = stmt.group_by(tag).order_by(count.desc(), tag).limit(limit)
+    return [TagCount.model_validate(row) for row in session.execute(stmt)]
+
+
+async def count_tags_async(
+    session: AsyncSession,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    kind: EventKind | None = None,
+    limit: int | None = None,
+) -> list[TagCount]:
+    """Async version of `count_tags`, for the `async def` FastAPI routes."""
+    return await session.run_sync(count_tags, start, end, kind=kind, limit=limit)
+
+
+def get_event_stats(
+    session: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    period: StatsPeriod = StatsPeriod.week,
+    now: datetime | None = None,
+) -> EventStats:
+    """Compute all the statistics of the events created in `[start, end)`, see the functions above."""
+    return EventStats(
+        start=start,
+        end=end,
+        period=period,
+        counts=count_events_per_period_and_kind(session, start, end, period=period),
+        actions=get_action_stats(session, start, end, now=now),
+    )
+
+
+async def get_event_stats_async(
+    session: AsyncSession,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    period: StatsPeriod = StatsPeriod.week,
+    now: datetime | None = None,
+) -> EventStats:
+    """Async version of `get_event_stats`, for the `async def` FastAPI routes."""
+    return await session.run_sync(get_event_stats, start, end, period=period, now=now)
@@ -1,6 +1,14 @@
 """Helpers for various utilities used across the project."""
+import base64
+import binascii
+import json
+from collections.abc import Iterable, Iterator
 from datetime import UTC, date, datetime, timedelta
+from itertools import islice
 from pathlib import Path
+from typing import TypeVar
+
+T = TypeVar("T")
 
 DEFAULT_ENV_FILE_PATH = Path(__file__).parents[3] / ".env"
 ALEMBIC_INI_PATH = Path(__file__).parents[3] / "alembic.ini"
@@ -21,15 +29,32 @@ def week_bounds(anchor: date | None = None) -> tuple[datetime, datetime]:
     return start, end
 
 
-def get_database_url_from_env_file(env_file_path: Path = DEFAULT_ENV_FILE_PATH) -> str:
-    """Read the DATABASE_URL from a given .env file."""
-    if not env_file_path.exists():
-        msg = f".env file not found at: {env_file_path}"
-        raise FileNotFoundError(msg)
-
-    with env_file_path.open() as f:
-        for line in f:
-            if line.startswith("DATABASE_URL="):
-                return line.strip().split("=", 1)[1]
-    msg = "DATABASE_URL not found in the specified .env file."
-    raise ValueError(msg)
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Split `items` into lists of at most `size` elements without materializing the whole iterable."""
+    if size < 1:
+        msg = f"Chunk size must be a positive integer, got {size}."
+        raise ValueError(msg)
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def encode_cursor(created_at: datetime, event_id: int) -> str:
+    """Encode the keyset position `(created_at, id)` of an event as an opaque, URL-safe cursor."""
+    raw = json.dumps([created_at.isoformat(), event_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor made by `encode_cursor`, raising a `ValueError` if it was not."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, event_id = json.loads(raw)
+        position = datetime.fromisoformat(created_at), int(event_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        msg = f"Invalid cursor: {cursor!r}"
+        raise ValueError(msg) from e
+    if position[0].tzinfo is None:
+        msg = f"Invalid cursor: {cursor!r}"
+        raise ValueError(msg)
+    return position
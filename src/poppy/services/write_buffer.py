@@ -0,0 +1,192 @@
+"""Group commit of the events created one by one, e.g. by many clients calling `POST /event` at once.
+
+Without it, each request inserts its event in a transaction of its own, and waits for its own flush of
+the WAL to disk. With the `WRITE_BUFFER_ENABLED` setting, the API hands the validated payloads to a
+`WriteBuffer` instead: a single writer task inserts everything buffered with one multi-row `INSERT`
+(`event_handlers.create_events_bulk`), commits once, then answers each request with its row. Under load,
+hundreds of events share one transaction and one flush.
+
+A batch is written once it has `max_batch` events, or once its oldest event waited `max_delay` seconds,
+which bounds the latency added to a request. While a batch is written the next one fills up, so the
+batches grow with the load, without waiting longer. At most `max_pending` events are buffered, further
+requests wait for room, which pushes back on the clients instead of growing the memory.
+
+`WRITE_BUFFER_DURABILITY` sets when a request is answered, see `WriteDurability`. Either way, a request
+is only answered once its event is committed, and an event is never acknowledged by a batch which
+rolled back. A batch which fails is written again one event at a time, so that one bad event only fails
+its own request.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Row, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventCreate
+from poppy.core.settings import Settings, WriteDurability
+from poppy.core.tracing import span
+from poppy.services import event_handlers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_DELAY = 0.005
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_PENDING = 10_000
+
+SessionScope = Callable[[], AbstractAsyncContextManager[AsyncSession]]
+
+
+@dataclass
+class _PendingEvent:
+    payload: EventCreate
+    enqueued_at: float = field(default_factory=time.monotonic)
+    created: asyncio.Future[Row[Any]] = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+def write_batch(session: Session, payloads: list[EventCreate], durability: WriteDurability) -> list[Row[Any]]:
+    """Insert `payloads` in one transaction, committed with `durability`, and return their rows in order."""
+    if durability == WriteDurability.relaxed and session.get_bind().dialect.name == "postgresql":
+        # Only for this transaction, the other writes of the connection keep the setting of the server
+        session.execute(text("SET LOCAL synchronous_commit = off"))
+    return event_handlers.create_events_bulk(session, payloads, chunk_size=max(len(payloads), 1))
+
+
+class WriteBuffer:
+    """Buffers the events to create, and writes them by batches from a single task.
+
+    The task is started by the first `submit`, and stopped by `close` once the buffer is empty.
+    """
+
+    def __init__(
+        self,
+        session_scope: SessionScope,
+        *,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        durability: WriteDurability = WriteDurability.durable,
+    ) -> None:
+        """Write the batches in the sessions opened by `session_scope`, e.g. `async_session_scope`."""
+        self.session_scope = session_scope
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.durability = durability
+        self._queue: asyncio.Queue[_PendingEvent] = asyncio.Queue(max_pending)
+        self._writer: asyncio.Task[None] | None = None
+        self._closed = False
+
+    @classmethod
+    def from_settings(cls, settings: Settings, session_scope: SessionScope) -> WriteBuffer:
+        """Create the buffer configured by the `WRITE_BUFFER_*` settings."""
+        return cls(
+            session_scope,
+            max_delay=settings.write_buffer_max_delay_ms / 1000,
+            max_batch=settings.write_buffer_max_batch,
+            max_pending=settings.write_buffer_max_pending,
+            durability=settings.write_buffer_durability,
+        )
+
+    @property
+    def pending(self) -> int:
+        """Number of the events waiting for their batch."""
+        return self._queue.qsize()
+
+    async def submit(self, payload: EventCreate) -> Row[Any]:
+        """Create the event `payload` with the next batch, and return its row of the `EventRead` columns.
+
+        Raises the error of the insert if the event could not be written, or a `RuntimeError` once closed.
+        """
+        if self._closed:
+            msg = "The write buffer is closed."
+            raise RuntimeError(msg)
+        if self._writer is None:
+            # In a context of its own, the context of this request (e.g. its trace) must not leak into the batches
+            self._writer = asyncio.create_task(self._write(), name="poppy-write-buffer", context=contextvars.Context())
+        pending = _PendingEvent(payload)
+        with span("buffer"):
+            await self._queue.put(pending)
+            try:
+                # Shielded, a client which disconnects does not cancel the write of the other events of the batch
+                return await asyncio.shield(pending.created)
+            except asyncio.CancelledError:
+                # The event is still written, but nothing awaits its outcome anymore
+                pending.created.add_done_callback(_log_abandoned_error)
+                raise
+
+    async def close(self) -> None:
+        """Write the buffered events, then stop the writer. Further `submit` calls raise a `RuntimeError`."""
+        self._closed = True
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._writer
+        self._writer = None
+
+    async def _write(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self) -> list[_PendingEvent]:
+        batch = [await self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+        return batch
+
+    async def _write_batch(self, batch: list[_PendingEvent]) -> None:
+        try:
+            rows = await self._insert([pending.payload for pending in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0], error=e)
+                return
+            logger.warning("Could not write a batch of %d buffered events, writing them one by one", len(batch), exc_info=True)
+            for pending in batch:
+                await self._write_batch([pending])
+            return
+        for pending, row in zip(batch, rows, strict=True):
+            _resolve(pending, row)
+
+    async def _insert(self, payloads: list[EventCreate]) -> list[Row[Any]]:
+        async with self.session_scope() as session:
+            return await session.run_sync(write_batch, payloads, self.durability)
+
+
+def _resolve(pending: _PendingEvent, row: Row[Any] | None = None, *, error: Exception | None = None) -> None:
+    # Only the writer resolves the future, the requests await it through `asyncio.shield` which never cancels it
+    if error is not None:
+        pending.created.set_exception(error)
+    else:
+        pending.created.set_result(row)
+
+
+def _log_abandoned_error(created: asyncio.Future[Row[Any]]) -> None:
+    # Retrieving the error also keeps asyncio from warning that it was never retrieved
+    if (error := created.exception()) is not None:
+        logger.warning("Could not write a buffered event whose request was cancelled", exc_info=error)
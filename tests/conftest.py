@@ -1,20 +1,32 @@
-from collections.abc import Generator
+import asyncio
+from collections.abc import AsyncGenerator, Awaitable, Callable, Generator
+from pathlib import Path
+from typing import TypeVar
 
 import pytest
 from alembic.config import Config
 from fastapi.testclient import TestClient
-from sqlalchemy import Engine, RootTransaction, event
+from sqlalchemy import Engine, NullPool
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncSession,
+    AsyncTransaction,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session
 from testcontainers.postgres import PostgresContainer
 
 import poppy.db.session as db_session_module
 from alembic import command
 from poppy.api.app import app
+from poppy.db.sqlite import create_sqlite_engine
+from poppy.services.cache import get_cache_backend
 from poppy.services.utils import ALEMBIC_INI_PATH
 
 # If your project uses postgresql+psycopg, keep it consistent:
 DRIVER_PREFIX = "postgresql+psycopg"
 EXPOSED_PORT = 5432
+T = TypeVar("T")
 
 
 def get_postgres_url_for_tests(container: PostgresContainer) -> str:
@@ -40,6 +52,7 @@ def postgres_url() -> Generator[str, None, None]:
 def init_test_db(postgres_url: str) -> None:
     """Initialize the database engine and sessionmaker for tests."""
     db_session_module.init_db_engine_and_sessionmaker(database_url=postgres_url)
+    db_session_module.init_async_db_engine_and_sessionmaker(database_url=postgres_url)
 
 
 @pytest.fixture(scope="session")
@@ -61,6 +74,13 @@ def apply_migrations(postgres_url: str) -> None:
     command.upgrade(alembic_cfg, "head")
 
 
+@pytest.fixture(autouse=True)
+def clear_cache() -> Generator[None, None, None]:
+    """Empty the read-through cache after each test, the data it was loaded from is rolled back."""
+    yield
+    get_cache_backend().clear()
+
+
 @pytest.fixture
 def db_session() -> Generator[Session, None, None]:
     """Provides a DB session per test, isolated by a transaction rollback.
@@ -81,37 +101,75 @@ def db_session() -> Generator[Session, None, None]:
 
 
 @pytest.fixture
-def test_client(engine: Engine) -> Generator[TestClient, None, None]:
-    """
-    Use in FastAPI tests.
-    - Overrides get_db_connection so all requests use the same per-test Session
-    - Provides SAVEPOINT isolation even if the endpoint code commits
-    """
-    connection = engine.connect()
-    transaction = connection.begin()
+def sqlite_session(tmp_path: Path) -> Generator[Session, None, None]:
+    """Provides a session on a new database of the embedded SQLite backend, in a file like in production."""
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'poppy.db'}")
+    session = db_session_module.sessionmaker(bind=engine, autoflush=False, future=True)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
 
-    session_local = db_session_module.sessionmaker(bind=connection, autoflush=False, autocommit=False, future=True)
-    session = session_local()
 
-    # Start a SAVEPOINT so app code can commit without ending the outer transaction
-    session.begin_nested()
+@pytest.fixture(params=["postgresql", "sqlite"])
+def any_db_session(request: pytest.FixtureRequest) -> Session:
+    """Provides `db_session` and then `sqlite_session`, for the services which work on both backends."""
+    return request.getfixturevalue("db_session" if request.param == "postgresql" else "sqlite_session")
 
-    @event.listens_for(session, "after_transaction_end")
-    def _restart_savepoint(sess: Session, trans: RootTransaction) -> None:
-        # If the nested tx ended, reopen it so the next commit still only affects a SAVEPOINT
-        if trans.nested and not trans._parent.nested:
-            sess.begin_nested()
 
-    def _override_get_db_connection() -> Generator[Session, None, None]:
-        yield session
+async def _open_isolated_async_session(postgres_url: str) -> tuple[AsyncConnection, AsyncTransaction, AsyncSession]:
+    # NullPool: the connection belongs to the event loop of one TestClient and must not be reused by the next one
+    engine = create_async_engine(postgres_url, poolclass=NullPool)
+    # Like the engines of the app, so that the statements of the requests are traced
+    db_session_module.trace_statements(engine.sync_engine)
+    connection = await engine.connect()
+    transaction = await connection.begin()
+    # Commits in the app code only release a SAVEPOINT, the outer transaction is rolled back after the test
+    session = AsyncSession(bind=connection, autoflush=False, expire_on_commit=False, join_transaction_mode="create_savepoint")
+    return connection, transaction, session
+
 
-    app.dependency_overrides[db_session_module.get_db_connection] = _override_get_db_connection
+async def _close_isolated_async_session(connection: AsyncConnection, transaction: AsyncTransaction, session: AsyncSession) -> None:
+    await session.close()
+    await transaction.rollback()
+    await connection.close()
 
-    # Use context manager so FastAPI lifespan/startup runs
+
+@pytest.fixture
+def run_with_async_session(postgres_url: str) -> Callable[[Callable[[AsyncSession], Awaitable[T]]], T]:
+    """Use in tests of async services: runs `scenario(session)` in a new event loop and returns its result.
+    The session is isolated like `db_session`, everything it commits is rolled back afterwards.
+    """
+    def _run(scenario: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        async def _isolated() -> T:
+            connection, transaction, session = await _open_isolated_async_session(postgres_url)
+            try:
+                return await scenario(session)
+            finally:
+                await _close_isolated_async_session(connection, transaction, session)
+
+        return asyncio.run(_isolated())
+
+    return _run
+
+
+@pytest.fixture
+def test_client(postgres_url: str) -> Generator[TestClient, None, None]:
+    """
+    Use in FastAPI tests.
+    - Overrides get_async_db_connection so all requests use the same per-test AsyncSession
+    - Provides SAVEPOINT isolation even if the endpoint code commits
+    """
+    # Use context manager so FastAPI lifespan/startup runs, the session is opened in the app's event loop
     with TestClient(app) as client:
+        connection, transaction, session = client.portal.call(_open_isolated_async_session, postgres_url)
+
+        async def _override_get_async_db_connection() -> AsyncGenerator[AsyncSession, None]:
+            yield session
+
+        app.dependency_overrides[db_session_module.get_async_db_connection] = _override_get_async_db_connection
         yield client
 
-    app.dependency_overrides.clear()
-    session.close()
-    transaction.rollback()
-    connection.close()
+        app.dependency_overrides.clear()
+        client.portal.call(_close_isolated_async_session, connection, transaction, session)
@@ -0,0 +1,51 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from poppy.core.events import EventCreate
+from poppy.services.async_event_handlers import (
+    create_event,
+    create_events_bulk,
+    get_event_by_id,
+    list_events_page,
+    list_todo,
+    list_week,
+    mark_event_completed,
+)
+from poppy.services.exporter import ExportFormat, export_events_async
+from poppy.services.utils import utcnow
+
+RunWithAsyncSession = Callable[[Callable[[AsyncSession], Awaitable[Any]]], Any]
+
+
+def test_create_and_list_events(run_with_async_session: RunWithAsyncSession) -> None:
+    async def scenario(session: AsyncSession) -> None:
+        created = await create_event(session, EventCreate(kind="action", text="async action", due_at=utcnow()))
+        assert created.id is not None
+        await create_events_bulk(session, [EventCreate(kind="note", text=f"async note {i}") for i in range(3)])
+
+        assert [ev.text for ev in await list_week(session)] == ["async action", "async note 0", "async note 1", "async note 2"]
+        page, cursor = await list_events_page(session, limit=3)
+        assert len(page) == 3
+        assert cursor is not None
+
+        [todo] = await list_todo(session)
+        assert todo.id == created.id
+        completed = await mark_event_completed(session, created.id)
+        assert completed.completed_at is not None
+        assert await list_todo(session) == []
+        assert (await get_event_by_id(session, created.id)).completed_at == completed.completed_at
+
+    run_with_async_session(scenario)
+
+
+def test_export_events_async(run_with_async_session: RunWithAsyncSession) -> None:
+    async def scenario(session: AsyncSession) -> list[bytes]:
+        await create_events_bulk(session, [EventCreate(kind="note", text=f"exported {i}") for i in range(3)])
+        return [chunk async for chunk in export_events_async(session, ExportFormat.csv, chunk_size=2)]
+
+    chunks = run_with_async_session(scenario)
+    # Header, two chunks of rows, and the (empty) end of the CSV
+    assert len(chunks) == 4
+    assert b"".join(chunks).decode().splitlines()[1:] == [line for chunk in chunks[1:3] for line in chunk.decode().splitlines()]
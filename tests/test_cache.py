@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+import poppy.services.cache as cache_module
+from poppy.core.events import EventCreate
+from poppy.db.models import Event
+from poppy.services.cache import InMemoryCache, read_through, week_key
+from poppy.services.event_handlers import (
+    create_event,
+    events_between_stmt,
+    get_events_version,
+    list_week_cached,
+)
+from poppy.services.utils import week_bounds
+
+
+def test_in_memory_cache_evicts_least_recently_used() -> None:
+    backend = InMemoryCache(max_entries=2)
+    backend.set(("a",), 1)
+    backend.set(("b",), 2)
+    assert backend.get(("a",)) == 1
+    backend.set(("c",), 3)
+    assert backend.get(("b",)) is None
+    assert (backend.get(("a",)), backend.get(("c",))) == (1, 3)
+
+
+def test_in_memory_cache_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now)
+    backend = InMemoryCache(ttl_seconds=10)
+    backend.set(("a",), 1)
+    now += 9
+    assert backend.get(("a",)) == 1
+    now += 1
+    assert backend.get(("a",)) is None
+    assert len(backend) == 0
+
+
+def test_read_through_does_not_store_values_loaded_during_an_invalidation() -> None:
+    def load_while_writing() -> list:
+        cache_module.invalidate_all()
+        return []
+
+    read_through(("k",), load_while_writing)
+    assert cache_module.get_cache_backend().get(("k",)) is None
+    read_through(("k",), list)
+    assert cache_module.get_cache_backend().get(("k",)) == (None, [])
+
+
+def test_week_view_is_cached_until_an_event_is_created_in_that_week(db_session: Session) -> None:
+    start, _ = week_bounds()
+    last_week = (start - timedelta(days=3)).date()
+    db_session.add(Event(kind="note", text="old", created_at=start - timedelta(days=3), tags=[], meta={}))
+    db_session.commit()
+
+    assert list_week_cached(db_session) == []
+    assert [ev.text for ev in list_week_cached(db_session, last_week)] == ["old"]
+
+    # Writes which bypass the services are not seen until the entry is invalidated or expires
+    db_session.add(Event(kind="note", text="direct", tags=[], meta={}))
+    db_session.commit()
+    assert list_week_cached(db_session) == []
+
+    create_event(db_session, EventCreate(kind="note", text="new"))
+    assert [ev.text for ev in list_week_cached(db_session)] == ["direct", "new"]
+    # Other weeks are left alone
+    backend = cache_module.get_cache_backend()
+    assert backend.get(week_key(last_week)) is not None
+
+
+def test_week_view_is_reloaded_when_its_version_changes(db_session: Session) -> None:
+    stmt = events_between_stmt(*week_bounds())
+    assert list_week_cached(db_session, version=get_events_version(db_session, stmt)) == []
+
+    # E.g. an event created by another process, which could not invalidate this cache
+    db_session.add(Event(kind="note", text="direct", tags=[], meta={}))
+    db_session.commit()
+    events = list_week_cached(db_session, version=get_events_version(db_session, stmt))
+    assert [ev.text for ev in events] == ["direct"]
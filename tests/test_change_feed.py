@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Callable, Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select, text
+
+import poppy.db.session as db_session_module
+from poppy.core.changes import EventChange, EventChangeKind
+from poppy.core.events import EventCreate, EventKind, EventRead
+from poppy.db.models import Event
+from poppy.services.change_feed import CHANNEL, EventFeed, Subscription
+from poppy.services.event_handlers import (
+    create_event,
+    create_events_bulk,
+    mark_event_completed,
+)
+from poppy.services.utils import utcnow
+
+
+@pytest.fixture
+def delete_committed_events() -> Generator[None, None, None]:
+    """The feed only sees committed changes: delete the events committed by the test afterwards."""
+    with db_session_module.session_scope() as session:
+        last_id = session.execute(select(func.coalesce(func.max(Event.id), 0))).scalar_one()
+    yield
+    with db_session_module.session_scope() as session:
+        session.execute(delete(Event).where(Event.id > last_id))
+        session.commit()
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+async def take(subscription: Subscription, count: int) -> list[tuple[EventChangeKind, str]]:
+    changes = []
+    async with asyncio.timeout(5):
+        async for change in subscription.changes():
+            assert change is not None
+            changes.append((change.change, change.event.text))
+            if len(changes) == count:
+                return changes
+    return changes
+
+
+def write_events() -> None:
+    with db_session_module.session_scope() as session:
+        create_event(session, EventCreate(kind=EventKind.note, text="note", tags=["work"]))
+        action = create_event(session, EventCreate(kind=EventKind.action, text="action", tags=["work", "urgent"]))
+        mark_event_completed(session, str(action.id))
+        create_events_bulk(session, [EventCreate(kind=EventKind.action, text=f"bulk {i}", tags=["work"]) for i in range(2)])
+
+
+@pytest.mark.usefixtures("delete_committed_events")
+def test_feed_fans_out_committed_changes(postgres_url: str) -> None:
+    async def scenario() -> tuple[list[tuple[EventChangeKind, str]], ...]:
+        feed = EventFeed(postgres_url)
+        try:
+            everything = await feed.subscribe()
+            actions = await feed.subscribe(EventKind.action)
+            urgent = await feed.subscribe(tags=["work", "urgent"])
+            # Written with the sync services, like the CLI or another API worker would
+            await asyncio.to_thread(write_events)
+            return await take(everything, 5), await take(actions, 4), await take(urgent, 2)
+        finally:
+            await feed.close()
+
+    everything, actions, urgent = asyncio.run(scenario())
+    assert everything == [
+        ("created", "note"),
+        ("created", "action"),
+        ("completed", "action"),
+        ("created", "bulk 0"),
+        ("created", "bulk 1"),
+    ]
+    assert actions == everything[1:]
+    assert urgent == [("created", "action"), ("completed", "action")]
+
+
+def notify_garbage() -> None:
+    with db_session_module.session_scope() as session:
+        session.execute(text("SELECT pg_notify(:channel, 'not json')"), {"channel": CHANNEL})
+        session.commit()
+
+
+@pytest.mark.usefixtures("delete_committed_events")
+def test_feed_skips_batches_it_cannot_load(postgres_url: str) -> None:
+    async def scenario() -> list[tuple[EventChangeKind, str]]:
+        feed = EventFeed(postgres_url)
+        try:
+            subscription = await feed.subscribe(EventKind.note)
+            await asyncio.to_thread(notify_garbage)
+            # Past the batch window, so that the garbage is a batch of its own
+            await asyncio.sleep(0.2)
+            await asyncio.to_thread(write_events)
+            return await take(subscription, 1)
+        finally:
+            await feed.close()
+
+    assert asyncio.run(scenario()) == [("created", "note")]
+
+
+def fail(changes: list[EventChange]) -> None:
+    msg = f"Cannot publish {len(changes)} changes"
+    raise RuntimeError(msg)
+
+
+@pytest.mark.usefixtures("delete_committed_events")
+def test_next_subscription_restarts_a_stopped_feed(postgres_url: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    async def scenario() -> list[tuple[EventChangeKind, str]]:
+        feed = EventFeed(postgres_url)
+        try:
+            first = await feed.subscribe()
+            with monkeypatch.context() as patch:
+                patch.setattr(feed, "_publish", fail)
+                await asyncio.to_thread(write_events)
+                # Closed by the listener as it stops
+                async with asyncio.timeout(5):
+                    assert [change async for change in first.changes()] == []
+            second = await feed.subscribe(EventKind.note)
+            await asyncio.to_thread(write_events)
+            return await take(second, 1)
+        finally:
+            await feed.close()
+
+    assert asyncio.run(scenario()) == [("created", "note")]
+
+
+def test_lagging_subscriptions_are_closed() -> None:
+    now = utcnow()
+    event = EventRead(
+        id=1, created_at=now, kind=EventKind.note, text="note", why=None, source=None, tags=[], meta={}, due_at=None, completed_at=None
+    )
+
+    async def scenario() -> list[EventChange | None]:
+        subscription = Subscription(None, (), queue_size=2)
+        for _ in range(3):
+            subscription.put(EventChange(change=EventChangeKind.created, event=event))
+        assert subscription.closed
+        return [change async for change in subscription.changes()]
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+@pytest.mark.usefixtures("delete_committed_events")
+def test_stream_event_changes(test_client: TestClient) -> None:
+    feed: EventFeed = test_client.app.state.event_feed
+
+    def write_then_close() -> None:
+        try:
+            wait_until(lambda: len(feed.subscriptions) == 1)
+            # Receives the changes at the same time as the stream, which consumes them
+            probe = test_client.portal.call(feed.subscribe)
+            write_events()
+            wait_until(lambda: probe._queue.qsize() == 5)
+        finally:
+            # Ends the stream, the response is only returned by the test client once complete
+            test_client.portal.call(feed.close)
+
+    writer = threading.Thread(target=write_then_close)
+    writer.start()
+    response = test_client.get("/event/stream", params={"kind": "action", "tag": "urgent"})
+    writer.join()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = [message.split("\n") for message in response.text.strip().split("\n\n")]
+    assert [(name, json.loads(data.removeprefix("data: "))["text"]) for name, data in messages] == [
+        ("event: created", "action"),
+        ("event: completed", "action"),
+    ]
@@ -0,0 +1,109 @@
+"""Guard the start-up time of the CLI, which is paid by every command and by shell completion.
+
+The budgets are generous for CI machines, set POPPY_CLI_HELP_BUDGET_MS / POPPY_CLI_COMMAND_BUDGET_MS to tighten them.
+"""
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from poppy.core.settings import Settings, get_database_url
+
+HEAVY_MODULES = ("sqlalchemy", "pydantic", "psycopg")
+HELP_BUDGET_MS = float(os.environ.get("POPPY_CLI_HELP_BUDGET_MS", "400"))
+COMMAND_BUDGET_MS = float(os.environ.get("POPPY_CLI_COMMAND_BUDGET_MS", "2000"))
+IMPORTTIME_LINE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_cli_with_importtime(*args: str, env: dict[str, str] | None = None) -> tuple[subprocess.CompletedProcess[str], dict[str, tuple[int, int]]]:
+    """Run `poppy` in a fresh interpreter, returning the process and the (nesting depth, cumulative import time in us) per module."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from poppy.cli.main import app; app()", *args],
+        capture_output=True, text=True, timeout=60, check=False, env={**os.environ, **(env or {})},
+    )
+    imports = {}
+    for line in process.stderr.splitlines():
+        if match := IMPORTTIME_LINE.match(line):
+            imports[match.group(3)] = (len(match.group(2)) // 2, int(match.group(1)))
+    return process, imports
+
+
+def total_import_ms(imports: dict[str, tuple[int, int]]) -> float:
+    # The cumulative times of the top-level imports add up to the total
+    return sum(us for depth, us in imports.values() if depth == 0) / 1000
+
+
+def test_help_does_not_import_the_db_stack() -> None:
+    process, imports = run_cli_with_importtime("--help")
+    assert process.returncode == 0, process.stderr
+    assert "import" in process.stdout
+    loaded = {module.split(".")[0] for module in imports}
+    assert loaded.isdisjoint(HEAVY_MODULES)
+    assert total_import_ms(imports) < HELP_BUDGET_MS
+
+
+def test_command_runs_within_budget(postgres_url: str) -> None:
+    process, imports = run_cli_with_importtime("week", env={"DATABASE_URL": postgres_url})
+    assert process.returncode == 0, process.stderr
+    assert "sqlalchemy" in imports
+    assert total_import_ms(imports) < COMMAND_BUDGET_MS
+
+
+def test_get_database_url_explains_missing_setting() -> None:
+    assert get_database_url(Settings(_env_file=None, database_url="postgresql+psycopg://x")) == "postgresql+psycopg://x"
+    with pytest.raises(RuntimeError, match="DATABASE_URL is not set"):
+        get_database_url(Settings(_env_file=None, database_url=None))
+
+
+def test_cli_captures_events_in_sqlite_without_a_server(tmp_path: Path) -> None:
+    env = {"DATABASE_URL": f"sqlite:///{tmp_path / 'poppy.db'}"}
+    process, _ = run_cli_with_importtime("add", "--kind", "action", "call back", "--tags", "work", env=env)
+    assert process.returncode == 0, process.stderr
+    assert "Saved #1 [action] call back" in process.stdout
+    process, _ = run_cli_with_importtime("week", "--tag", "work", env=env)
+    assert process.returncode == 0, process.stderr
+    assert "[action]  call back" in process.stdout
+
+
+def test_cli_on_sqlite_imports_and_reports(tmp_path: Path) -> None:
+    env = {"DATABASE_URL": f"sqlite:///{tmp_path / 'poppy.db'}"}
+    lines = [
+        '{"kind": "note", "text": "old", "created_at": "2026-03-02T10:00:00+00:00"}',
+        '{"kind": "action", "text": "older", "created_at": "2026-02-27T10:00:00+00:00"}',
+    ]
+    (tmp_path / "events.ndjson").write_text("\n".join(lines))
+    process, _ = run_cli_with_importtime("import", str(tmp_path / "events.ndjson"), env=env)
+    assert process.returncode == 0, process.stderr
+    assert "Imported 2 events" in process.stdout
+
+    process, _ = run_cli_with_importtime("stats", "--period", "month", env=env)
+    assert process.returncode == 0, process.stderr
+    assert "2026-02-01" in process.stdout
+    assert "2026-03-01" in process.stdout
+    process, _ = run_cli_with_importtime("stats", env=env)
+    assert process.returncode == 0, process.stderr
+    assert "2026-02-23" in process.stdout
+    assert "2026-03-02" in process.stdout
+
+
+def test_cli_searches_sqlite_in_memory(tmp_path: Path) -> None:
+    env = {"DATABASE_URL": f"sqlite:///{tmp_path / 'poppy.db'}"}
+    run_cli_with_importtime("add", "--kind", "note", "tune postgres vacuum", env=env)
+    run_cli_with_importtime("add", "--kind", "note", "water the plants", env=env)
+    process, _ = run_cli_with_importtime("search", "postgres", env=env)
+    assert process.returncode == 0, process.stderr
+    assert "[note]  tune postgres vacuum" in process.stdout
+    assert "plants" not in process.stdout
+
+
+@pytest.mark.parametrize(
+    "command", [("partitions", "list"), ("rollup", "rebuild"), ("index", "meta", "priority"), ("week", "--where", "meta.priority>=2")]
+)
+def test_cli_explains_what_sqlite_cannot_do(tmp_path: Path, command: tuple[str, ...]) -> None:
+    process, _ = run_cli_with_importtime(*command, env={"DATABASE_URL": f"sqlite:///{tmp_path / 'poppy.db'}"})
+    assert process.returncode == 2
+    assert "requires PostgreSQL, DATABASE_URL points to a sqlite database." in process.stderr
+    assert "Traceback" not in process.stderr
@@ -1,3 +1,4 @@
+from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
@@ -6,7 +7,8 @@ from sqlalchemy.orm import Session
 
 import poppy.db.session as db_session_module
 from poppy.core.events import EventRead
-from poppy.db.models import EXPECTED_TABLES_IN_DB, Event
+from poppy.db.models import EXPECTED_TABLES_IN_DB, INTERNAL_EVENT_COLUMNS, Event
+from poppy.db.sqlite import create_sqlite_engine, create_sqlite_schema
 
 
 def test_mock_db_is_alive(db_session: Session) -> None:
@@ -30,7 +32,7 @@ def test_model_and_mock_db_events_table_match(engine: Engine) -> None:
 
 
 def test_model_and_pydantic_event_fields_match() -> None:
-    event_model_fields = set(Event.__table__.columns.keys())
+    event_model_fields = set(Event.__table__.columns.keys()) - INTERNAL_EVENT_COLUMNS
     pydantic_fields = set(EventRead.model_fields.keys())
     assert event_model_fields == pydantic_fields, (
         f"Mismatch in `{Event.__name__}` model and `EventRead` Pydantic model fields {event_model_fields=}, {pydantic_fields=}"
@@ -64,3 +66,22 @@ def test_get_db_connection_closes_session(monkeypatch: pytest.MonkeyPatch) -> No
     # Assert cleanup happened
     mock_session.close.assert_called_once()
 
+
+def test_sqlite_schema(tmp_path: Path) -> None:
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'poppy.db'}")
+    try:
+        inspector = inspect(engine)
+        assert set(inspector.get_table_names()) == EXPECTED_TABLES_IN_DB - {"alembic_version"}
+        assert {col["name"] for col in inspector.get_columns("events")} == set(Event.__table__.columns.keys()) - INTERNAL_EVENT_COLUMNS
+        assert {index["name"] for index in inspector.get_indexes("events")} == {
+            "ix_events_created_at_id",
+            "ix_events_pending_actions",
+            "ix_events_kind",
+            "ix_events_source",
+        }
+        # Created once, the next engines only read the schema version
+        assert not create_sqlite_schema(engine)
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+    finally:
+        engine.dispose()
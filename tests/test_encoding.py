@@ -0,0 +1,152 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from poppy.api.encoding import (
+    ContentCoding,
+    WireFormat,
+    negotiate_coding,
+    negotiate_format,
+    parse_quality_values,
+)
+from poppy.core.settings import get_settings
+
+
+@pytest.fixture
+def many_events(test_client: TestClient) -> list[dict]:
+    """Enough events for the week to be above the compression threshold."""
+    payloads = [{"kind": "note", "text": f"note number {i}", "tags": ["a", "b"], "meta": {"i": i}} for i in range(30)]
+    return test_client.post("/event/bulk", json=payloads).json()
+
+
+def test_parse_quality_values() -> None:
+    assert parse_quality_values("application/msgpack, application/json;q=0.5, */*;q=bad") == {
+        "application/msgpack": 1.0,
+        "application/json": 0.5,
+        "*/*": 0.0,
+    }
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        (None, WireFormat.json),
+        ("*/*", WireFormat.json),
+        ("application/json", WireFormat.json),
+        ("application/msgpack", WireFormat.msgpack),
+        ("application/x-msgpack, application/json;q=0.9", WireFormat.msgpack),
+        ("application/msgpack;q=0.5, application/json", WireFormat.json),
+        ("application/msgpack;q=0.5, */*;q=0.1", WireFormat.msgpack),
+    ],
+)
+def test_negotiate_format(accept: str | None, expected: WireFormat) -> None:
+    pytest.importorskip("msgpack")
+    assert negotiate_format(accept) == expected
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        (None, ContentCoding.identity),
+        ("br", ContentCoding.identity),
+        ("gzip, deflate", ContentCoding.gzip),
+        ("gzip, zstd", ContentCoding.zstd),
+        ("zstd;q=0.5, gzip", ContentCoding.gzip),
+        ("*", ContentCoding.zstd),
+        ("zstd;q=0, gzip;q=0", ContentCoding.identity),
+    ],
+)
+def test_negotiate_coding(accept_encoding: str | None, expected: ContentCoding) -> None:
+    pytest.importorskip("zstandard")
+    assert negotiate_coding(accept_encoding) == expected
+
+
+def test_week_as_msgpack(test_client: TestClient, many_events: list[dict]) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    response = test_client.get("/event/week", headers={"Accept": "application/msgpack", "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "Accept" in response.headers["vary"]
+    events = msgpack.unpackb(response.content, timestamp=3)
+    assert [event["id"] for event in events] == [event["id"] for event in many_events]
+    assert isinstance(events[0]["created_at"], datetime)
+    assert events[0]["created_at"].isoformat() == many_events[0]["created_at"].replace("Z", "+00:00")
+    assert events[0]["meta"] == {"i": 0}
+    # Another representation of the same events, with a validator of its own
+    json_response = test_client.get("/event/week")
+    assert response.headers["etag"] == json_response.headers["etag"].removesuffix('"') + '-msgpack"'
+    assert len(response.content) < len(json_response.content)
+    revalidated = test_client.get(
+        "/event/week", headers={"Accept": "application/msgpack", "If-None-Match": json_response.headers["etag"]}
+    )
+    assert revalidated.status_code == 200
+    assert revalidated.content == response.content
+
+
+@pytest.mark.usefixtures("many_events")
+@pytest.mark.parametrize("accept", ["application/json", "application/msgpack"])
+def test_not_modified_has_the_headers_of_the_compressed_response(test_client: TestClient, accept: str) -> None:
+    if accept == "application/msgpack":
+        pytest.importorskip("msgpack")
+    headers = {"Accept": accept, "Accept-Encoding": "gzip"}
+    response = test_client.get("/event/week", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    not_modified = test_client.get("/event/week", headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == response.headers["etag"]
+    assert not_modified.headers["vary"] == response.headers["vary"] == "Accept, Accept-Encoding"
+
+
+def test_page_as_msgpack(test_client: TestClient, many_events: list[dict]) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    response = test_client.get("/event", params={"limit": 10}, headers={"Accept": "application/msgpack"})
+    page = msgpack.unpackb(response.content, timestamp=3)
+    assert [event["id"] for event in page["items"]] == [event["id"] for event in many_events[:10]]
+    assert page["next_cursor"] == test_client.get("/event", params={"limit": 10}).json()["next_cursor"]
+
+
+def test_tagged_as_msgpack(test_client: TestClient, many_events: list[dict]) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    response = test_client.get("/event/tagged", params={"tag": "a", "limit": 5}, headers={"Accept": "application/msgpack"})
+    assert response.headers["content-type"] == "application/msgpack"
+    events = msgpack.unpackb(response.content, timestamp=3)
+    assert [event["id"] for event in events] == [event["id"] for event in many_events[:5]]
+    assert events[0]["tags"] == ["a", "b"]
+
+
+@pytest.mark.usefixtures("many_events")
+@pytest.mark.parametrize("coding", ["gzip", "zstd"])
+def test_large_responses_are_compressed(test_client: TestClient, coding: str) -> None:
+    if coding == "zstd":
+        pytest.importorskip("zstandard")
+    with test_client.stream("GET", "/event/week", headers={"Accept-Encoding": coding}) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == coding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) == len(raw)
+    assert len(raw) < len(test_client.get("/event/week", headers={"Accept-Encoding": "identity"}).content)
+
+
+def test_small_responses_are_not_compressed(test_client: TestClient) -> None:
+    response = test_client.get("/event/week", headers={"Accept-Encoding": "gzip"})
+    assert response.json() == []
+    assert "content-encoding" not in response.headers
+
+
+def test_compression_can_be_disabled(
+    test_client: TestClient, many_events: list[dict], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(get_settings(), "compression_enabled", False)
+    response = test_client.get("/event/week", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == len(many_events)
+
+
+def test_streamed_exports_are_compressed_as_they_go(test_client: TestClient, many_events: list[dict]) -> None:
+    response = test_client.get("/event/export", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [event["id"] for event in many_events]
@@ -3,21 +3,28 @@ from datetime import UTC, datetime, timedelta
 import pytest
 from sqlalchemy.orm import Session
 
-from poppy.core.events import EventCreate
+from poppy.core.events import EventCreate, EventKind, TagMatch
 from poppy.db.models import Event
 from poppy.services.event_handlers import (
+    complete_events,
     create_event,
+    create_events_bulk,
+    events_between_stmt,
     get_event_by_id,
+    get_events_version,
     list_events_between,
+    list_events_by_tags,
+    list_events_page,
     list_todo,
     list_todo_split_by_current_week,
     list_week,
     mark_event_completed,
+    update_events,
 )
 from poppy.services.utils import week_bounds
 
 
-def test_create_event(db_session: Session) -> None:
+def test_create_event(any_db_session: Session) -> None:
     # Tests the creation of an event in the database
     payload = EventCreate(
         kind="note",
@@ -28,10 +35,10 @@ def test_create_event(db_session: Session) -> None:
         meta={"key": "value"},
     )
 
-    created_event = create_event(db_session, payload)
+    created_event = create_event(any_db_session, payload)
     assert created_event.id is not None
 
-    fetched_event = db_session.get(Event, created_event.id)
+    fetched_event = any_db_session.get(Event, created_event.id)
     assert fetched_event is not None
     assert fetched_event.kind == payload.kind
     assert fetched_event.text == payload.text
@@ -42,6 +49,25 @@ def test_create_event(db_session: Session) -> None:
     assert fetched_event.created_at == created_event.created_at
 
 
+def test_create_events_bulk(any_db_session: Session) -> None:
+    payloads = [EventCreate(kind="note", text=f"bulk note {i}", tags=["bulk"], meta={"i": i}) for i in range(7)]
+
+    # A chunk size that does not divide the batch evenly exercises the last, partial chunk
+    created_events = create_events_bulk(any_db_session, payloads, chunk_size=3)
+    assert [ev.text for ev in created_events] == [p.text for p in payloads]
+    assert len({ev.id for ev in created_events}) == len(payloads)
+    assert all(ev.created_at is not None for ev in created_events)
+
+    fetched_event = any_db_session.get(Event, created_events[-1].id)
+    assert fetched_event is not None
+    assert fetched_event.tags == ["bulk"]
+    assert fetched_event.meta == {"i": 6}
+
+
+def test_create_events_bulk_empty(any_db_session: Session) -> None:
+    assert create_events_bulk(any_db_session, []) == []
+
+
 def test_event_create_validation() -> None:
     # Test that creating a meeting without due_at raises a ValueError
     with pytest.raises(ValueError, match="Meetings must have a due_at field set"):
@@ -55,64 +81,145 @@ def test_event_create_validation() -> None:
         )
 
 
-def test_get_event_by_id(db_session: Session) -> None:
+def test_get_event_by_id(any_db_session: Session) -> None:
     payload = EventCreate(
         kind="note",
         text="Event for get by ID test",
     )
-    created_event = create_event(db_session, payload)
+    created_event = create_event(any_db_session, payload)
 
-    fetched_event = get_event_by_id(db_session, created_event.id)
+    fetched_event = get_event_by_id(any_db_session, created_event.id)
     assert fetched_event is not None
     assert fetched_event.id == created_event.id
     assert fetched_event.text == created_event.text
 
     # when ID is not present
-    non_existent_event = get_event_by_id(db_session, 999999)
+    non_existent_event = get_event_by_id(any_db_session, 999999)
     assert non_existent_event is None
 
 
-def test_list_events_between(db_session: Session) -> None:
+def test_list_events_between(any_db_session: Session) -> None:
     now = datetime.now(UTC)
     # Insert three events by directly setting created_at so the test is deterministic
     e1 = Event(kind="note", text="old", created_at=now - timedelta(days=10), tags=[], meta={})
     e2 = Event(kind="action", text="in range 1", created_at=now - timedelta(days=2), tags=[], meta={})
     e3 = Event(kind="action", text="in range 2", created_at=now - timedelta(days=1), tags=[], meta={})
-    db_session.add_all([e1, e2, e3])
-    db_session.commit()
+    any_db_session.add_all([e1, e2, e3])
+    any_db_session.commit()
 
     start_time_for_two_events = now - timedelta(days=3)
-    expected_two_events = list_events_between(db_session, start=start_time_for_two_events, end=now)
+    expected_two_events = list_events_between(any_db_session, start=start_time_for_two_events, end=now)
     assert len(expected_two_events) == 2
     assert [e.id for e in expected_two_events] == [e2.id, e3.id]
 
     start_time_for_three_events = now - timedelta(days=11)
-    expected_three_events = list_events_between(db_session, start=start_time_for_three_events, end=now)
+    expected_three_events = list_events_between(any_db_session, start=start_time_for_three_events, end=now)
     assert len(expected_three_events) == 3
     assert [e.id for e in expected_three_events] == [e1.id, e2.id, e3.id]
 
     # No events in this range
     start_time = now - timedelta(minutes=5)
-    expected_empty_list = list_events_between(db_session, start=start_time, end=now)
+    expected_empty_list = list_events_between(any_db_session, start=start_time, end=now)
     assert len(expected_empty_list) == 0
 
 
-def test_list_week(db_session: Session) -> None:
+def test_list_events_page(any_db_session: Session) -> None:
+    now = datetime.now(UTC)
+    # Two events share a timestamp, so the id has to break the tie between pages
+    events = [
+        Event(kind="note", text=f"event {i}", created_at=now - timedelta(days=5 - i // 2), tags=[], meta={})
+        for i in range(5)
+    ]
+    any_db_session.add_all(events)
+    any_db_session.commit()
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = list_events_page(any_db_session, cursor, limit=2)
+        pages.append([ev.id for ev in page])
+        if cursor is None:
+            break
+    assert pages == [[events[0].id, events[1].id], [events[2].id, events[3].id], [events[4].id]]
+
+    # A page that is exactly full has no next page
+    page, cursor = list_events_page(any_db_session, limit=5)
+    assert len(page) == 5
+    assert cursor is None
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        list_events_page(any_db_session, "not-a-cursor")
+
+
+def test_list_events_page_filters(any_db_session: Session) -> None:
+    now = datetime.now(UTC)
+    action = Event(kind="action", text="tagged action", created_at=now - timedelta(days=2), source="cli", tags=["work"], meta={})
+    note = Event(kind="note", text="tagged note", created_at=now - timedelta(days=1), source="api", tags=["work", "home"], meta={})
+    old = Event(kind="note", text="old note", created_at=now - timedelta(days=30), source="api", tags=[], meta={})
+    any_db_session.add_all([action, note, old])
+    any_db_session.commit()
+
+    def ids(**filters: object) -> list[int]:
+        page, _ = list_events_page(any_db_session, **filters)
+        return [ev.id for ev in page]
+
+    assert ids(kind=EventKind.note) == [old.id, note.id]
+    assert ids(source="cli") == [action.id]
+    assert ids(tag="work") == [action.id, note.id]
+    assert ids(tag="home", kind=EventKind.note) == [note.id]
+    assert ids(start=now - timedelta(days=3), end=now - timedelta(days=1)) == [action.id]
+
+
+def test_list_events_by_tags(any_db_session: Session) -> None:
+    create_events_bulk(
+        any_db_session,
+        [
+            EventCreate(kind=EventKind.note, text="both", tags=["work", "home"]),
+            EventCreate(kind=EventKind.note, text="work", tags=["work"]),
+            EventCreate(kind=EventKind.note, text="home", tags=["home"]),
+        ],
+    )
+    create_event(any_db_session, EventCreate(kind=EventKind.note, text="untagged"))
+
+    def texts(tags: list[str], **options: object) -> list[str]:
+        return [ev.text for ev in list_events_by_tags(any_db_session, tags, **options)]
+
+    assert texts(["work"]) == ["both", "work"]
+    assert texts(["work", "home"]) == ["both"]
+    assert texts(["work", "home"], match=TagMatch.any) == ["both", "work", "home"]
+    assert texts(["work", "home"], match=TagMatch.any, limit=2) == ["both", "work"]
+    assert texts([]) == []
+
+
+def test_list_week_and_todo_filter_by_tags(any_db_session: Session) -> None:
+    create_events_bulk(
+        any_db_session,
+        [
+            EventCreate(kind=EventKind.action, text="work", tags=["work"], due_at=datetime.now(UTC)),
+            EventCreate(kind=EventKind.action, text="home", tags=["home"], due_at=datetime.now(UTC)),
+        ],
+    )
+    assert [ev.text for ev in list_week(any_db_session, tags=["work"])] == ["work"]
+    assert [ev.text for ev in list_todo(any_db_session, tags=["home"])] == ["home"]
+    assert list_todo(any_db_session, tags=["home", "work"]) == []
+
+
+def test_list_week(any_db_session: Session) -> None:
     start_of_week, end_of_week = week_bounds()
     # Insert events in different weeks, only e2 and e3 are in the expected week
     e1 = Event(kind="note", text="last week", created_at=start_of_week - timedelta(days=1), tags=[], meta={})
     e2 = Event(kind="action", text="this week 1", created_at=start_of_week + timedelta(days=1), tags=[], meta={})
     e3 = Event(kind="action", text="this week 2", created_at=start_of_week + timedelta(days=3), tags=[], meta={})
     e4 = Event(kind="idea", text="next week", created_at=end_of_week + timedelta(days=1), tags=[], meta={})
-    db_session.add_all([e1, e2, e3, e4])
-    db_session.commit()
+    any_db_session.add_all([e1, e2, e3, e4])
+    any_db_session.commit()
 
-    events_this_week = list_week(db_session)
+    events_this_week = list_week(any_db_session)
     assert len(events_this_week) == 2
     assert [e.id for e in events_this_week] == [e2.id, e3.id]
 
 
-def test_list_todo_ignores_non_actions(db_session: Session) -> None:
+def test_list_todo_ignores_non_actions(any_db_session: Session) -> None:
     now = datetime.now(UTC)
     action_event = Event(
         kind="action",
@@ -122,15 +229,15 @@ def test_list_todo_ignores_non_actions(db_session: Session) -> None:
     )
     note_event = Event(kind="note", text="just a note")
     idea_event = Event(kind="idea", text="just an idea")
-    db_session.add_all([action_event, note_event, idea_event])
-    db_session.commit()
+    any_db_session.add_all([action_event, note_event, idea_event])
+    any_db_session.commit()
 
     # This should pass regardless of pending_only value, since it's the only action
-    [todo_action] = list_todo(db_session, pending_only=False)
+    [todo_action] = list_todo(any_db_session, pending_only=False)
     assert todo_action.id == action_event.id
 
 
-def test_list_todo_pending_only(db_session: Session) -> None:
+def test_list_todo_pending_only(any_db_session: Session) -> None:
     now = datetime.now(UTC)
     pending_action = Event(
         kind="action",
@@ -150,14 +257,14 @@ def test_list_todo_pending_only(db_session: Session) -> None:
         due_at=None,
         completed_at=None
     )
-    db_session.add_all([pending_action, completed_action, no_due_action])
-    db_session.commit()
+    any_db_session.add_all([pending_action, completed_action, no_due_action])
+    any_db_session.commit()
 
-    [todo_action] = list_todo(db_session)
+    [todo_action] = list_todo(any_db_session)
     assert todo_action.id == pending_action.id
 
 
-def test_todo_split_by_current_week(db_session: Session) -> None:
+def test_todo_split_by_current_week(any_db_session: Session) -> None:
     start_of_week, end_of_week = week_bounds()
     this_week_action = Event(
         kind="action",
@@ -177,17 +284,17 @@ def test_todo_split_by_current_week(db_session: Session) -> None:
         kind="note",
         text="just a note - should be ignored",
     )
-    db_session.add_all([this_week_action, later_action, note])
-    db_session.commit()
+    any_db_session.add_all([this_week_action, later_action, note])
+    any_db_session.commit()
 
-    split_todo = list_todo_split_by_current_week(db_session)
+    split_todo = list_todo_split_by_current_week(any_db_session)
     assert len(split_todo["created_this_week"]) == 1
     assert split_todo["created_this_week"][0].id == this_week_action.id
     assert len(split_todo["older"]) == 1
     assert split_todo["older"][0].id == later_action.id
 
 
-def test_mark_event_completed(db_session: Session) -> None:
+def test_mark_event_completed(any_db_session: Session) -> None:
     now = datetime.now(UTC)
     action_event = Event(
         kind="action",
@@ -195,17 +302,84 @@ def test_mark_event_completed(db_session: Session) -> None:
         due_at=now + timedelta(days=2),
         completed_at=None
     )
-    db_session.add(action_event)
-    db_session.commit()
+    any_db_session.add(action_event)
+    any_db_session.commit()
 
     assert action_event.completed_at is None
 
-    completed_event = mark_event_completed(db_session, action_event.id)
+    completed_event = mark_event_completed(any_db_session, action_event.id)
     assert completed_event.completed_at is not None
 
-    fetched_event = get_event_by_id(db_session, action_event.id)
+    fetched_event = get_event_by_id(any_db_session, action_event.id)
     assert fetched_event.id == action_event.id
     assert fetched_event.completed_at == completed_event.completed_at
 
     with pytest.raises(ValueError, match="Event with ID 999999 not found"):
-        mark_event_completed(db_session, 999999)
+        mark_event_completed(any_db_session, 999999)
+
+
+def test_complete_events(any_db_session: Session) -> None:
+    first, second, done = create_events_bulk(
+        any_db_session, [EventCreate(kind=EventKind.action, text=f"action {i}") for i in range(3)]
+    )
+    earlier = datetime(2026, 3, 2, tzinfo=UTC)
+    complete_events(any_db_session, [done.id], earlier)
+
+    now = datetime.now(UTC)
+    rows = complete_events(any_db_session, [first.id, second.id, done.id, 999999], now)
+    # Missing and already completed events are left alone
+    assert sorted(row.id for row in rows) == [first.id, second.id]
+    assert {row.completed_at for row in rows} == {now}
+    assert get_event_by_id(any_db_session, done.id).completed_at == earlier
+    assert complete_events(any_db_session, []) == []
+
+
+def test_update_events(any_db_session: Session) -> None:
+    first, second = create_events_bulk(
+        any_db_session,
+        [
+            EventCreate(kind=EventKind.note, text="first", tags=["a", "old"], meta={"keep": 1, "drop": 2}),
+            EventCreate(kind=EventKind.note, text="second", tags=["b"]),
+        ],
+    )
+    rows = update_events(
+        any_db_session,
+        [first.id, second.id],
+        add_tags=["b", "sprint", "sprint"],
+        remove_tags=["old"],
+        meta={"sprint": 12},
+        unset_meta=["drop"],
+    )
+    assert {row.id: (row.tags, row.meta) for row in rows} == {
+        first.id: (["a", "b", "sprint"], {"keep": 1, "sprint": 12}),
+        second.id: (["b", "sprint"], {"sprint": 12}),
+    }
+
+    [row] = update_events(any_db_session, [first.id], meta={"keep": {"nested": True}})
+    assert row.meta == {"keep": {"nested": True}, "sprint": 12}
+    with pytest.raises(ValueError, match="Nothing to update"):
+        update_events(any_db_session, [first.id])
+
+
+def test_get_events_version(any_db_session: Session) -> None:
+    start_of_week, end_of_week = week_bounds()
+    stmt = events_between_stmt(start_of_week, end_of_week)
+    empty = get_events_version(any_db_session, stmt)
+    assert empty.last_modified is None
+
+    ev = Event(kind="note", text="this week", created_at=start_of_week + timedelta(days=1), tags=[], meta={})
+    any_db_session.add(ev)
+    any_db_session.commit()
+    created = get_events_version(any_db_session, stmt)
+    assert created.etag != empty.etag
+    assert created.last_modified == ev.created_at
+
+    # Events outside of the range do not change its version
+    any_db_session.add(Event(kind="note", text="last week", created_at=start_of_week - timedelta(days=1), tags=[], meta={}))
+    any_db_session.commit()
+    assert get_events_version(any_db_session, stmt) == created
+
+    # Every write gets a new transaction ID in production, a savepoint gets one in the test transaction
+    with any_db_session.begin_nested():
+        ev.text = "edited"
+    assert get_events_version(any_db_session, stmt).etag != created.etag
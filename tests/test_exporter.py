@@ -0,0 +1,73 @@
+import io
+import json
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from poppy.db.models import Event
+from poppy.services.exporter import ExportFormat, export_events, iter_event_row_chunks
+from poppy.services.importer import ImportFormat, import_events
+
+
+@pytest.fixture
+def three_events(db_session: Session) -> list[Event]:
+    now = datetime.now(UTC)
+    events = [
+        Event(kind="note", text="old", created_at=now - timedelta(days=10), tags=["a"], meta={"k": 1}),
+        Event(kind="action", text="recent", created_at=now - timedelta(days=2), tags=[], meta={}, due_at=now),
+        Event(kind="idea", text="newest", created_at=now - timedelta(days=1), tags=["a", "b"], meta={}),
+    ]
+    db_session.add_all(events)
+    db_session.commit()
+    return events
+
+
+def test_iter_event_row_chunks(db_session: Session, three_events: list[Event]) -> None:
+    chunks = list(iter_event_row_chunks(db_session, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert [row.id for chunk in chunks for row in chunk] == [ev.id for ev in three_events]
+
+    start = three_events[1].created_at
+    [chunk] = iter_event_row_chunks(db_session, start=start, end=three_events[2].created_at)
+    assert [row.text for row in chunk] == ["recent"]
+
+
+def test_export_ndjson(db_session: Session, three_events: list[Event]) -> None:
+    lines = b"".join(export_events(db_session, ExportFormat.ndjson, chunk_size=2)).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record["text"] for record in records] == ["old", "recent", "newest"]
+    assert records[0]["meta"] == {"k": 1}
+    assert datetime.fromisoformat(records[1]["due_at"]) == three_events[1].due_at
+
+
+def test_export_csv_can_be_imported_back(any_db_session: Session) -> None:
+    now = datetime.now(UTC)
+    any_db_session.add_all([
+        Event(kind="note", text="old, with a comma", created_at=now - timedelta(days=10), tags=["x;y", "z"], meta={"k": 1}),
+        Event(kind="action", text="done", created_at=now - timedelta(days=2), due_at=now, completed_at=now - timedelta(days=1)),
+        Event(kind="idea", text="newest", why="because", created_at=now - timedelta(days=1), tags=[], meta={}),
+    ])
+    any_db_session.commit()
+    exported = b"".join(export_events(any_db_session, ExportFormat.csv, chunk_size=2)).decode()
+    report = import_events(any_db_session, io.StringIO(exported), ImportFormat.csv)
+    assert report.failed == 0
+    assert report.imported == 3
+
+    rows = [row._asdict() for chunk in iter_event_row_chunks(any_db_session) for row in chunk]
+    originals, copies = rows[::2], rows[1::2]
+    for original, copy in zip(originals, copies, strict=True):
+        assert copy.pop("id") != original.pop("id")
+        assert copy == original
+    assert copies[0]["tags"] == ["x;y", "z"]
+    assert copies[1]["completed_at"] is not None
+
+
+def test_export_parquet(db_session: Session, three_events: list[Event]) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    exported = b"".join(export_events(db_session, ExportFormat.parquet, chunk_size=2))
+    parquet_file = pq.ParquetFile(io.BytesIO(exported))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column("text").to_pylist() == [ev.text for ev in three_events]
+    assert table.column("tags").to_pylist() == [["a"], [], ["a", "b"]]
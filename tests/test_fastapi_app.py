@@ -1,3 +1,5 @@
+import json
+
 from fastapi.testclient import TestClient
 
 from poppy.core.events import EventCreate
@@ -35,6 +37,26 @@ def test_create_event_missing_field(test_client: TestClient) -> None:
     assert response_data["detail"][0]["input"]["text"] == "Missing kind field"
 
 
+def test_create_events_bulk_success(test_client: TestClient) -> None:
+    """Test the bulk event creation endpoint."""
+    payloads = [EventCreate(kind="note", text=f"Bulk note {i}").model_dump(mode="json") for i in range(3)]
+    response = test_client.post("/event/bulk", json=payloads)
+    assert response.status_code == 201
+    response_data = response.json()
+    assert [event["text"] for event in response_data] == ["Bulk note 0", "Bulk note 1", "Bulk note 2"]
+    assert all("id" in event for event in response_data)
+
+
+def test_create_events_bulk_rejects_whole_batch_on_invalid_event(test_client: TestClient) -> None:
+    """A single invalid event fails validation before anything is written."""
+    payloads = [{"kind": "note", "text": "valid"}, {"kind": "meeting", "text": "no due date"}]
+    response = test_client.post("/event/bulk", json=payloads)
+    assert response.status_code == 422
+
+    response = test_client.get("/event/week")
+    assert response.json() == []
+
+
 def test_get_events_in_week_empty(test_client: TestClient) -> None:
     """Test retrieving events for the current week when no events exist."""
     response = test_client.get("/event/week")
@@ -61,3 +83,190 @@ def test_get_events_in_week_with_events(test_client: TestClient) -> None:
     assert isinstance(response_data, list)
     assert len(response_data) == 1  # At least one event should be present
     assert any(event["text"] == "Set Weekly meeting" for event in response_data)
+
+
+def test_list_events_pages(test_client: TestClient) -> None:
+    """Test following the cursor of the event listing until the last page."""
+    payloads = [EventCreate(kind="note", text=f"Paged note {i}").model_dump(mode="json") for i in range(5)]
+    test_client.post("/event/bulk", json=payloads)
+
+    texts, params = [], {"limit": 2}
+    while True:
+        response = test_client.get("/event", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        texts.extend(event["text"] for event in page["items"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert texts == [f"Paged note {i}" for i in range(5)]
+
+
+def test_list_events_invalid_parameters(test_client: TestClient) -> None:
+    """Invalid cursors and oversized pages are rejected."""
+    assert test_client.get("/event", params={"cursor": "garbage"}).status_code == 400
+    assert test_client.get("/event", params={"limit": 100_000}).status_code == 422
+
+
+def test_export_events_ndjson(test_client: TestClient) -> None:
+    """Test streaming the events as NDJSON."""
+    for text in ("first", "second"):
+        test_client.post("/event", json={"kind": "note", "text": text, "tags": ["x"]})
+
+    response = test_client.get("/event/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["text"] for line in lines] == ["first", "second"]
+    assert json.loads(lines[0])["tags"] == ["x"]
+
+
+def test_export_events_csv_empty(test_client: TestClient) -> None:
+    """An empty CSV export still has its header row."""
+    response = test_client.get("/event/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.text.splitlines() == ["id,created_at,kind,text,why,source,tags,meta,due_at,completed_at"]
+
+
+def test_metrics(test_client: TestClient) -> None:
+    """The pool metrics of both engines are exposed in the Prometheus text format."""
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'poppy_db_pool_checkouts_total{engine="sync"}' in response.text
+    assert 'poppy_db_pool_checkouts_total{engine="async"}' in response.text
+
+
+def test_get_events_in_week_conditional(test_client: TestClient) -> None:
+    """Polling the week with the last ETag is answered with 304 until an event changes."""
+    test_client.post("/event", json={"kind": "note", "text": "first"})
+    response = test_client.get("/event/week")
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert "last-modified" in response.headers
+
+    not_modified = test_client.get("/event/week", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    # Weak comparison, and lists of ETags
+    assert test_client.get("/event/week", headers={"If-None-Match": f'"other", {etag[2:]}'}).status_code == 304
+
+    test_client.post("/event", json={"kind": "note", "text": "second"})
+    response = test_client.get("/event/week", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [event["text"] for event in response.json()] == ["first", "second"]
+
+
+def test_list_events_page_conditional(test_client: TestClient) -> None:
+    """The pages are conditional too, and only change with the events they contain."""
+    test_client.post("/event/bulk", json=[{"kind": "note", "text": "first"}, {"kind": "note", "text": "second"}])
+    etag = test_client.get("/event", params={"limit": 1}).headers["etag"]
+    assert test_client.get("/event", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 304
+    # The first page already had a next page, a third event does not change it
+    test_client.post("/event", json={"kind": "note", "text": "third"})
+    assert test_client.get("/event", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 304
+    assert test_client.get("/event", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 200
+    assert test_client.get("/event", params={"cursor": "garbage"}, headers={"If-None-Match": "*"}).status_code == 400
+
+
+def test_lean_and_model_responses_send_the_same_json(test_client: TestClient) -> None:
+    """Rows serialized directly by the page route match the `EventRead` models sent by the week route."""
+    event = {"kind": "action", "text": "call", "tags": ["a"], "meta": {"k": [1]}, "due_at": "2030-01-01T10:00:00+02:00"}
+    test_client.post("/event", json=event)
+    page = test_client.get("/event")
+    assert page.headers["content-type"] == "application/json"
+    assert page.json()["items"] == test_client.get("/event/week").json()
+    assert page.json()["items"][0]["due_at"] == "2030-01-01T08:00:00Z"
+
+
+def test_search_events(test_client: TestClient) -> None:
+    """Search results are ranked and highlighted, and the query is required."""
+    test_client.post("/event/bulk", json=[
+        {"kind": "decision", "text": "Use Postgres", "tags": ["db"]},
+        {"kind": "note", "text": "Lunch", "why": "postgres talk"},
+    ])
+    response = test_client.get("/event/search", params={"q": "postgres"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["text"] for hit in hits] == ["Use Postgres", "Lunch"]
+    assert hits[0]["headline"] == "Use <b>Postgres</b>"
+    assert [hit["text"] for hit in test_client.get("/event/search", params={"q": "postgres", "tag": "db"}).json()] == ["Use Postgres"]
+    assert test_client.get("/event/search", params={"q": ""}).status_code == 422
+
+
+def test_stats(test_client: TestClient) -> None:
+    """Only the aggregates are sent, and the period is validated."""
+    test_client.post("/event/bulk", json=[{"kind": "note", "text": "a"}, {"kind": "action", "text": "b"}])
+    response = test_client.get("/stats", params={"period": "day"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["period"] == "day"
+    assert sorted((count["kind"], count["count"]) for count in stats["counts"]) == [("action", 1), ("note", 1)]
+    assert stats["actions"]["total"] == 1
+    assert test_client.get("/stats", params={"period": "decade"}).status_code == 422
+
+
+def test_weekly_rollups(test_client: TestClient) -> None:
+    test_client.post("/event/bulk", json=[{"kind": "note", "text": "a", "tags": ["x"]}, {"kind": "action", "text": "b"}])
+    response = test_client.get("/stats/weeks", params={"kind": "note"})
+    assert response.status_code == 200
+    [rollup] = response.json()
+    assert (rollup["kind"], rollup["event_count"], rollup["tag_counts"]) == ("note", 1, {"x": 1})
+
+
+def test_complete_events(test_client: TestClient) -> None:
+    created = test_client.post("/event/bulk", json=[{"kind": "action", "text": "a"}, {"kind": "action", "text": "b"}]).json()
+    ids = [event["id"] for event in created]
+    response = test_client.post("/event/complete", json={"ids": [*ids, 999999], "completed_at": "2026-03-02T09:00:00Z"})
+    assert response.status_code == 200
+    assert sorted((event["id"], event["completed_at"]) for event in response.json()) == [
+        (event_id, "2026-03-02T09:00:00Z") for event_id in ids
+    ]
+    assert test_client.post("/event/complete", json={"ids": ids}).json() == []
+    assert test_client.post("/event/complete", json={"ids": []}).status_code == 422
+
+
+def test_update_events_in_bulk(test_client: TestClient) -> None:
+    created = test_client.post("/event/bulk", json=[{"kind": "note", "text": "a", "tags": ["x"]}]).json()
+    response = test_client.patch(
+        "/event/bulk", json={"ids": [created[0]["id"]], "add_tags": ["y"], "remove_tags": ["x"], "meta": {"k": 1}}
+    )
+    assert response.status_code == 200
+    [event] = response.json()
+    assert (event["tags"], event["meta"]) == (["y"], {"k": 1})
+    assert test_client.patch("/event/bulk", json={"ids": [created[0]["id"]]}).status_code == 422
+
+
+def test_tags(test_client: TestClient) -> None:
+    test_client.post(
+        "/event/bulk",
+        json=[{"kind": "note", "text": "a", "tags": ["x", "y"]}, {"kind": "note", "text": "b", "tags": ["x"]}],
+    )
+    response = test_client.get("/tags")
+    assert response.status_code == 200
+    assert response.json() == [{"tag": "x", "count": 2}, {"tag": "y", "count": 1}]
+
+    tagged = test_client.get("/event/tagged", params={"tag": ["x", "y"]})
+    assert [event["text"] for event in tagged.json()] == ["a"]
+    tagged = test_client.get("/event/tagged", params={"tag": ["x", "y"], "match": "any"})
+    assert [event["text"] for event in tagged.json()] == ["a", "b"]
+    assert test_client.get("/event/tagged").status_code == 422
+
+
+def test_list_events_with_meta_filters(test_client: TestClient) -> None:
+    test_client.post(
+        "/event/bulk",
+        json=[
+            {"kind": "paper", "text": "a", "meta": {"priority": 3, "venue": {"city": "Paris"}}},
+            {"kind": "paper", "text": "b", "meta": {"priority": 1}},
+        ],
+    )
+    response = test_client.get("/event", params={"where": ["meta.priority>=1", "meta.venue.city=Paris"]})
+    assert response.status_code == 200
+    assert [event["text"] for event in response.json()["items"]] == ["a"]
+    response = test_client.get("/event", params={"where": "priority>=1"})
+    assert response.status_code == 400
+    assert "meta filter" in response.json()["detail"]
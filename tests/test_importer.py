@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import poppy.services.importer as importer_module
+from poppy.db.models import Event
+from poppy.services.importer import ImportFormat, ImportReport, LineError, import_events
+
+
+def test_import_ndjson(any_db_session: Session) -> None:
+    lines = [
+        json.dumps({"kind": "note", "text": "first", "tags": ["a", "b"], "meta": {"url": "https://x"}}),
+        "",
+        json.dumps({"kind": "action", "text": "second", "due_at": "2026-01-02T10:00:00+00:00", "created_at": "2025-12-30T08:00:00+00:00"}),
+        json.dumps({"kind": "note", "text": "third"}),
+    ]
+    batches: list[int] = []
+
+    report = import_events(
+        any_db_session, io.StringIO("\n".join(lines)), ImportFormat.ndjson, batch_size=2, source="test",
+        on_batch=lambda running_report: batches.append(running_report.imported),
+    )
+    assert report.imported == 3
+    assert report.failed == 0
+    assert batches == [2, 3]
+
+    events = any_db_session.execute(select(Event).order_by(Event.id)).scalars().all()
+    assert [ev.text for ev in events] == ["first", "second", "third"]
+    assert events[0].tags == ["a", "b"]
+    assert events[0].meta == {"url": "https://x"}
+    assert events[0].source == "test"
+    assert events[1].created_at.isoformat() == "2025-12-30T08:00:00+00:00"
+    assert events[1].due_at is not None
+
+
+def test_import_ndjson_reports_bad_lines(any_db_session: Session) -> None:
+    lines = [
+        "{not json",
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"kind": "meeting", "text": "no due date"}),
+        json.dumps({"kind": "note", "text": "ok", "source": "x" * 65}),
+        json.dumps({"kind": "note", "text": "fine"}),
+    ]
+    report = import_events(any_db_session, io.StringIO("\n".join(lines)), ImportFormat.ndjson)
+    assert report.imported == 1
+    assert report.failed == 4
+    assert [error.line_number for error in report.errors] == [1, 2, 3, 4]
+    assert "Invalid JSON" in report.errors[0].message
+    assert "Meetings must have a due_at field set" in report.errors[2].message
+    assert report.errors[3].message.startswith("source")
+
+
+def test_import_csv(any_db_session: Session) -> None:
+    content = (
+        "kind,text,why,tags,meta\n"
+        'idea,"an idea, with a comma",,x;y,\n'
+        "note,bad meta,,,{oops\n"
+        'decision,use postgres,it is fast,,"{""k"": 1}"\n'
+    )
+    report = import_events(any_db_session, io.StringIO(content), ImportFormat.csv)
+    assert report.imported == 2
+    assert [error.line_number for error in report.errors] == [3]
+
+    events = any_db_session.execute(select(Event).order_by(Event.id)).scalars().all()
+    assert [ev.text for ev in events] == ["an idea, with a comma", "use postgres"]
+    assert events[0].tags == ["x", "y"]
+    assert events[0].why is None
+    assert events[1].meta == {"k": 1}
+
+
+def test_import_report_caps_kept_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(importer_module, "MAX_REPORTED_ERRORS", 2)
+    report = ImportReport()
+    for line_number in range(5):
+        report.add_error(LineError(line_number, "bad"))
+    assert report.failed == 5
+    assert len(report.errors) == 2
@@ -0,0 +1,106 @@
+from collections.abc import Generator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import poppy.db.session as db_session_module
+from poppy.core.events import EventCreate, EventKind
+from poppy.services.event_handlers import create_event, list_events_page, list_todo
+from poppy.services.meta_filters import (
+    MetaFilter,
+    MetaOperator,
+    create_meta_index,
+    meta_index_name,
+    parse_meta_filter,
+)
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ("meta.url", MetaFilter(("url",), MetaOperator.exists)),
+        ("meta.venue.city = Paris", MetaFilter(("venue", "city"), MetaOperator.eq, "Paris")),
+        ("meta.priority>=2", MetaFilter(("priority",), MetaOperator.ge, 2)),
+        ("meta.done!=true", MetaFilter(("done",), MetaOperator.ne, value=True)),
+        ('meta.code="007"', MetaFilter(("code",), MetaOperator.eq, "007")),
+        ("meta.doi=10.1000/182", MetaFilter(("doi",), MetaOperator.eq, "10.1000/182")),
+        ("meta.score<0.5", MetaFilter(("score",), MetaOperator.lt, 0.5)),
+    ],
+)
+def test_parse_meta_filter(expression: str, expected: MetaFilter) -> None:
+    assert parse_meta_filter(expression) == expected
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["priority>=2", "meta.", "meta.pri-ority=1", "meta.url'; DROP TABLE events; --", "meta.priority>=", "meta.done>true", "meta.tags<[1]"],
+)
+def test_parse_meta_filter_rejects_invalid_filters(expression: str) -> None:
+    with pytest.raises(ValueError, match="meta filter"):
+        parse_meta_filter(expression)
+
+
+def test_meta_index_name() -> None:
+    assert meta_index_name("venue.city") == "ix_events_meta_venue__city"
+    # JSON keys are case-sensitive, `Priority` is not `priority`
+    names = {meta_index_name(key) for key in ("priority", "Priority", "PRIORITY")}
+    assert len(names) == 3
+    assert meta_index_name("venue.City") == "ix_events_meta_venue__city_efedfcde"
+    for key in ("venue city", "x" * 60, "priority>=2"):
+        with pytest.raises(ValueError, match="meta key"):
+            meta_index_name(key)
+
+
+def test_meta_filters_select_events(db_session: Session) -> None:
+    metas = {
+        "urgent": {"priority": 3, "venue": {"city": "Paris"}},
+        "normal": {"priority": 2, "url": "https://example.com"},
+        "low": {"priority": 1, "venue": {"city": "Lyon"}},
+        "odd": {"priority": "high"},
+        "bare": {},
+    }
+    for text_, meta in metas.items():
+        create_event(db_session, EventCreate(kind=EventKind.action, text=text_, meta=meta))
+
+    def texts(*expressions: str) -> list[str]:
+        events, _ = list_events_page(db_session, meta=expressions)
+        return [event.text for event in events]
+
+    assert texts("meta.priority>=2") == ["urgent", "normal"]
+    assert texts("meta.priority<3", "meta.venue.city") == ["low"]
+    assert texts("meta.venue.city=Paris") == ["urgent"]
+    assert texts("meta.venue.city!=Paris") == ["normal", "low", "odd", "bare"]
+    assert texts("meta.url") == ["normal"]
+    # Strings only compare with strings
+    assert texts("meta.priority>=a") == ["odd"]
+    assert [event.text for event in list_todo(db_session, pending_only=False, meta=["meta.priority=2"])] == ["normal"]
+    with pytest.raises(ValueError, match="meta filter"):
+        list_events_page(db_session, meta=["priority>=2"])
+
+
+@pytest.fixture
+def drop_priority_index() -> Generator[None, None, None]:
+    yield
+    with db_session_module.session_scope() as session:
+        session.execute(text("DROP INDEX IF EXISTS ix_events_meta_priority"))
+        session.commit()
+
+
+@pytest.mark.usefixtures("drop_priority_index")
+def test_create_meta_index_concurrently() -> None:
+    with db_session_module.session_scope() as session:
+        assert create_meta_index(session, "priority")
+        assert not create_meta_index(session, "priority")
+        valid, partitions = session.execute(
+            text(
+                "SELECT i.indisvalid, count(inh.inhrelid) FROM pg_index i "
+                "LEFT JOIN pg_inherits inh ON inh.inhparent = i.indexrelid "
+                "WHERE i.indexrelid = 'ix_events_meta_priority'::regclass GROUP BY i.indisvalid"
+            )
+        ).one()
+        partition_count = session.execute(
+            text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'events'::regclass")
+        ).scalar_one()
+    assert valid
+    assert partitions == partition_count
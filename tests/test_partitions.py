@@ -0,0 +1,78 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from poppy.db.models import Event
+from poppy.services.partitions import (
+    create_partition,
+    create_partitions_ahead,
+    detach_partitions,
+    list_partitions,
+    month_start,
+    partition_name,
+)
+from poppy.services.rollups import list_weekly_rollups
+
+MARCH = datetime(2020, 3, 1, tzinfo=UTC)
+
+
+def partition_of(session: Session, event_id: int) -> str:
+    return session.execute(text("SELECT tableoid::regclass::text FROM events WHERE id = :id"), {"id": event_id}).scalar_one()
+
+
+def test_month_start_and_partition_name() -> None:
+    moment = datetime(2020, 12, 31, 23, 30, tzinfo=UTC)
+    assert month_start(moment) == datetime(2020, 12, 1, tzinfo=UTC)
+    assert month_start(moment, 1) == datetime(2021, 1, 1, tzinfo=UTC)
+    assert month_start(moment, -12) == datetime(2019, 12, 1, tzinfo=UTC)
+    assert partition_name(moment) == "events_y2020m12"
+
+
+def test_create_partition_moves_events_from_the_default_partition(db_session: Session) -> None:
+    ev = Event(kind="note", text="old", tags=["archive"], meta={}, created_at=MARCH + timedelta(days=3))
+    db_session.add(ev)
+    db_session.commit()
+    assert partition_of(db_session, ev.id) == "events_default"
+    rollups = list_weekly_rollups(db_session)
+
+    assert create_partition(db_session, MARCH + timedelta(days=10))
+    assert not create_partition(db_session, MARCH)
+    assert partition_of(db_session, ev.id) == "events_y2020m03"
+    # Moving the events did not count them twice
+    assert list_weekly_rollups(db_session) == rollups
+
+    [partition] = [partition for partition in list_partitions(db_session) if partition.name == "events_y2020m03"]
+    assert (partition.start, partition.end) == (MARCH, datetime(2020, 4, 1, tzinfo=UTC))
+    assert list_partitions(db_session)[-1].is_default
+    indexes = db_session.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'events_y2020m03'")).scalars()
+    assert {"ix_events_y2020m03_created_at_id", "ix_events_y2020m03_pending_actions"} <= set(indexes)
+
+
+def test_create_partitions_ahead(db_session: Session) -> None:
+    assert create_partitions_ahead(db_session, 2, now=MARCH + timedelta(days=20)) == [
+        "events_y2020m03",
+        "events_y2020m04",
+        "events_y2020m05",
+    ]
+    assert create_partitions_ahead(db_session, 2, now=MARCH + timedelta(days=20)) == []
+
+
+def test_detach_partitions(db_session: Session) -> None:
+    create_partitions_ahead(db_session, 1, now=MARCH)
+    db_session.add_all([
+        Event(kind="note", text="march", tags=[], meta={}, created_at=MARCH),
+        Event(kind="note", text="april", tags=[], meta={}, created_at=MARCH + timedelta(days=40)),
+    ])
+    db_session.commit()
+    rollups = list_weekly_rollups(db_session)
+
+    assert detach_partitions(db_session, datetime(2020, 4, 15, tzinfo=UTC)) == ["events_y2020m03"]
+    assert db_session.execute(select(Event.text).where(Event.created_at < MARCH + timedelta(days=60))).scalars().all() == ["april"]
+    assert db_session.execute(text("SELECT text FROM events_archive.events_y2020m03")).scalars().all() == ["march"]
+    # The statistics still count the archived events
+    assert list_weekly_rollups(db_session) == rollups
+
+    assert detach_partitions(db_session, datetime(2020, 5, 1, tzinfo=UTC), drop=True) == ["events_y2020m04"]
+    assert db_session.execute(text("SELECT to_regclass('events_y2020m04')")).scalar() is None
+    assert db_session.execute(select(func.count()).select_from(Event).where(Event.created_at < MARCH + timedelta(days=60))).scalar() == 0
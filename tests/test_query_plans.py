@@ -0,0 +1,146 @@
+"""Guard the query plans of the services against regressions, e.g. a dropped index or a rewritten filter.
+
+The test tables are tiny, so sequential scans are disabled to make the planner show which index it can use.
+`events` is partitioned by month, so plans scan the copies of its indexes on each partition, e.g.
+`ix_events_y2026m03_created_at_id` for `ix_events_created_at_id`.
+"""
+import re
+from collections.abc import Callable, Generator
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+from poppy.core.events import TagMatch
+from poppy.db.models import Event
+from poppy.services.event_handlers import (
+    list_events_between,
+    list_events_by_tags,
+    list_events_page,
+    list_todo,
+)
+from poppy.services.meta_filters import create_meta_index, meta_conditions
+from poppy.services.partitions import create_partition
+from poppy.services.search import search_events
+from poppy.services.utils import encode_cursor
+
+
+def uses_index(plan: str, index_name: str) -> bool:
+    """Tell whether `plan` scans the index `index_name` of `events`, or its copy on a partition."""
+    suffix = index_name.removeprefix("ix_events_")
+    return re.search(rf"\bix_events_(?:y\d{{4}}m\d{{2}}_|default_)?{suffix}\b", plan) is not None
+
+
+def has_sort_step(plan: str) -> bool:
+    """Tell whether `plan` sorts rows, rather than merging the ordered index scans of the partitions."""
+    return re.search(r"\bSort  \(cost", plan) is not None
+
+
+def scanned_partitions(plan: str) -> set[str]:
+    """Return the partitions of `events` scanned by `plan`."""
+    return set(re.findall(r" on (events_\w+)", plan))
+
+
+@pytest.fixture
+def explain(db_session: Session) -> Generator[Callable[[Callable[[], Any]], str], None, None]:
+    """Run a service call and return the `EXPLAIN` output of the last statement it executed."""
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    connection = db_session.connection()
+    executed: list[tuple[str, Any]] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:  # noqa: ANN001, ARG001, PLR0917
+        executed.append((statement, parameters))
+
+    event.listen(connection, "before_cursor_execute", _record)
+
+    def _explain(call: Callable[[], Any]) -> str:
+        executed.clear()
+        call()
+        statement, parameters = executed[-1]
+        plan = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).scalars()
+        return "\n".join(plan)
+
+    yield _explain
+    event.remove(connection, "before_cursor_execute", _record)
+
+
+def test_list_events_between_uses_created_at_index(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    now = datetime.now(UTC)
+    plan = explain(lambda: list_events_between(db_session, now - timedelta(days=7), now))
+    assert uses_index(plan, "ix_events_created_at_id")
+    # The index order matches the ORDER BY, so no sort is needed
+    assert not has_sort_step(plan)
+
+
+def test_list_events_page_seeks_with_created_at_index(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    # On a large table the LIMIT makes an ordered index scan the cheapest plan, a tiny one needs a nudge
+    db_session.execute(text("SET LOCAL enable_bitmapscan = off"))
+    cursor = encode_cursor(datetime.now(UTC) - timedelta(days=30), 42)
+    plan = explain(lambda: list_events_page(db_session, cursor, limit=50))
+    assert uses_index(plan, "ix_events_created_at_id")
+    # The cursor is an index condition, not a filter applied to every row from the start
+    assert "Index Cond: (ROW(created_at, id) >" in plan
+    assert not has_sort_step(plan)
+
+
+def test_list_todo_pending_uses_partial_index(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    plan = explain(lambda: list_todo(db_session, pending_only=True))
+    assert uses_index(plan, "ix_events_pending_actions")
+    assert not has_sort_step(plan)
+
+
+@pytest.mark.parametrize(
+    ("condition", "index_name"),
+    [
+        (Event.tags.contains(["work"]), "ix_events_tags"),
+        (Event.tags.overlap(["work", "home"]), "ix_events_tags"),
+        (Event.meta.contains({"url": "https://example.com"}), "ix_events_meta"),
+    ],
+)
+def test_containment_queries_use_gin_indexes(
+    db_session: Session, explain: Callable[[Callable[[], Any]], str], condition: Any, index_name: str
+) -> None:
+    plan = explain(lambda: db_session.execute(select(Event.id).where(condition)).all())
+    assert uses_index(plan, index_name)
+
+
+@pytest.mark.parametrize("match", list(TagMatch))
+def test_list_events_by_tags_uses_tags_index(
+    db_session: Session, explain: Callable[[Callable[[], Any]], str], match: TagMatch
+) -> None:
+    plan = explain(lambda: list_events_by_tags(db_session, ["work", "home"], match=match))
+    assert uses_index(plan, "ix_events_tags")
+
+
+def test_search_uses_search_vector_index(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    plan = explain(lambda: search_events(db_session, "postgres storage"))
+    assert uses_index(plan, "ix_events_search_vector")
+
+
+def test_week_queries_scan_one_or_two_partitions(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    monday = datetime(2026, 3, 30, tzinfo=UTC)
+    create_partition(db_session, monday)
+    create_partition(db_session, monday + timedelta(days=7))
+    # A week within a month
+    plan = explain(lambda: list_events_between(db_session, monday - timedelta(days=7), monday))
+    assert scanned_partitions(plan) == {"events_y2026m03"}
+    # A week spanning two months
+    plan = explain(lambda: list_events_between(db_session, monday, monday + timedelta(days=7)))
+    assert scanned_partitions(plan) == {"events_y2026m03", "events_y2026m04"}
+
+
+@pytest.mark.parametrize("expression", ["meta.url=https://example.com", "meta.venue.city"])
+def test_meta_equality_and_existence_filters_use_gin_index(
+    db_session: Session, explain: Callable[[Callable[[], Any]], str], expression: str
+) -> None:
+    # Without the LIMIT of the pages, which makes an ordered scan of `ix_events_created_at_id` cheaper on a tiny table
+    plan = explain(lambda: db_session.execute(select(Event.id).where(*meta_conditions([expression]))).all())
+    assert uses_index(plan, "ix_events_meta")
+
+
+def test_meta_comparisons_use_expression_index(db_session: Session, explain: Callable[[Callable[[], Any]], str]) -> None:
+    create_meta_index(db_session, "priority", concurrently=False)
+    plan = explain(lambda: db_session.execute(select(Event.id).where(*meta_conditions(["meta.priority>=2"]))).all())
+    assert uses_index(plan, "ix_events_meta_priority")
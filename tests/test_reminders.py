@@ -0,0 +1,270 @@
+import io
+import json
+import threading
+from collections.abc import Generator
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import poppy.db.session as db_session_module
+from poppy.core.events import EventCreate, EventKind
+from poppy.core.reminders import Reminder
+from poppy.db.models import Event, EventReminder
+from poppy.services.event_handlers import create_event, mark_event_completed
+from poppy.services.notifiers import (
+    FileNotifier,
+    StdoutNotifier,
+    WebhookNotifier,
+    notifier_from_spec,
+)
+from poppy.services.reminders import (
+    DEFAULT_REMINDER_LEASE,
+    drain_due_reminders,
+    process_due_reminders,
+    retry_delay,
+)
+from poppy.services.utils import utcnow
+
+
+class CollectingNotifier:
+    def __init__(self, *, fail: bool = False) -> None:
+        self.fail = fail
+        self.reminders: list[Reminder] = []
+
+    def notify(self, reminder: Reminder) -> None:
+        if self.fail:
+            msg = "unreachable"
+            raise ConnectionError(msg)
+        self.reminders.append(reminder)
+
+
+def schedule(session: Session, text: str, due_in: timedelta = timedelta(hours=1)) -> Event:
+    return create_event(session, EventCreate(kind=EventKind.action, text=text, due_at=utcnow() + due_in))
+
+
+def reminders(session: Session) -> dict[int, EventReminder]:
+    session.expire_all()
+    return {reminder.event_id: reminder for reminder in session.execute(select(EventReminder)).scalars()}
+
+
+def test_triggers_keep_the_queue_up_to_date(db_session: Session) -> None:
+    action = schedule(db_session, "call back")
+    done = schedule(db_session, "already done")
+    create_event(db_session, EventCreate(kind=EventKind.note, text="no due date"))
+    overdue = schedule(db_session, "imported late", due_in=-timedelta(days=1))
+    assert set(reminders(db_session)) == {action.id, done.id}
+    assert reminders(db_session)[action.id].remind_at == action.due_at
+
+    mark_event_completed(db_session, str(done.id))
+    assert set(reminders(db_session)) == {action.id}
+
+    # Changing the due date reschedules, and a reopened event is reminded again
+    later = utcnow() + timedelta(days=2)
+    db_session.execute(update(Event).where(Event.id == action.id).values(due_at=later))
+    db_session.execute(update(Event).where(Event.id == done.id).values(completed_at=None))
+    assert {event_id: reminder.remind_at for event_id, reminder in reminders(db_session).items()} == {
+        action.id: later,
+        done.id: done.due_at,
+    }
+    assert overdue.id not in reminders(db_session)
+
+    db_session.execute(update(Event).where(Event.id == action.id).values(due_at=None))
+    db_session.execute(delete(Event).where(Event.id == done.id))
+    assert reminders(db_session) == {}
+
+
+def test_process_due_reminders_fires_and_deletes_them(db_session: Session) -> None:
+    soon = schedule(db_session, "soon", due_in=timedelta(minutes=5))
+    later = schedule(db_session, "later", due_in=timedelta(days=1))
+    notifier = CollectingNotifier()
+
+    report = process_due_reminders(db_session, [notifier], now=utcnow() + timedelta(hours=1))
+    assert (report.fired, report.retried, report.failed) == (1, 0, 0)
+    [reminder] = notifier.reminders
+    assert (reminder.event.id, reminder.event.text, reminder.attempts) == (soon.id, "soon", 0)
+    assert set(reminders(db_session)) == {later.id}
+
+
+def test_failed_reminders_are_retried_then_given_up(db_session: Session) -> None:
+    event = schedule(db_session, "flaky", due_in=timedelta(minutes=5))
+    now = utcnow() + timedelta(hours=1)
+
+    report = process_due_reminders(db_session, [CollectingNotifier(fail=True)], max_attempts=2, now=now)
+    assert report.retried == 1
+    reminder = reminders(db_session)[event.id]
+    assert (reminder.attempts, reminder.remind_at) == (1, now + retry_delay(1))
+    assert reminder.last_error == "ConnectionError: unreachable"
+    # Not due again before the backoff is over
+    assert process_due_reminders(db_session, [CollectingNotifier(fail=True)], max_attempts=2, now=now).claimed == 0
+
+    now += retry_delay(1)
+    report = process_due_reminders(db_session, [CollectingNotifier(fail=True)], max_attempts=2, now=now)
+    assert report.failed == 1
+    assert reminders(db_session)[event.id].failed_at == now
+    assert process_due_reminders(db_session, [CollectingNotifier()], now=now + timedelta(days=1)).claimed == 0
+
+
+def test_retry_delay_backs_off_exponentially() -> None:
+    assert [retry_delay(attempts) for attempts in (1, 2, 3)] == [timedelta(seconds=s) for s in (30, 60, 120)]
+    assert retry_delay(20) == timedelta(hours=1)
+
+
+@pytest.fixture
+def committed_reminders() -> Generator[list[int], None, None]:
+    """Events with reminders committed for real, to share them between connections, deleted afterwards."""
+    with db_session_module.session_scope() as session:
+        events = [schedule(session, f"shared {i}", due_in=timedelta(minutes=i + 1)) for i in range(5)]
+        session.commit()
+        event_ids = [event.id for event in events]
+    yield event_ids
+    with db_session_module.session_scope() as session:
+        session.execute(delete(Event).where(Event.id.in_(event_ids)))
+        session.execute(delete(EventReminder).where(EventReminder.event_id.in_(event_ids)))
+        session.commit()
+
+
+def test_workers_skip_the_reminders_claimed_by_others(committed_reminders: list[int]) -> None:
+    now = utcnow() + timedelta(hours=1)
+    first, second = CollectingNotifier(), CollectingNotifier()
+    with db_session_module.session_scope() as session:
+        # Claims the two earliest reminders and keeps them locked until the end of the block
+        claimed = session.execute(
+            select(EventReminder.event_id)
+            .where(EventReminder.event_id.in_(committed_reminders))
+            .order_by(EventReminder.remind_at)
+            .limit(2)
+            .with_for_update()
+        ).scalars().all()
+        with db_session_module.session_scope() as other:
+            process_due_reminders(other, [second], now=now)
+        session.rollback()
+
+    assert claimed == committed_reminders[:2]
+    assert [reminder.event.id for reminder in second.reminders] == committed_reminders[2:]
+    with db_session_module.session_scope() as session:
+        process_due_reminders(session, [first], now=now)
+    assert [reminder.event.id for reminder in first.reminders] == committed_reminders[:2]
+
+
+def test_drain_due_reminders_processes_every_batch(committed_reminders: list[int]) -> None:
+    notifier = CollectingNotifier()
+    # Nothing is due yet
+    assert drain_due_reminders(db_session_module.session_scope, [notifier], batch_size=2).claimed == 0
+    with db_session_module.session_scope() as session:
+        session.execute(update(EventReminder).where(EventReminder.event_id.in_(committed_reminders)).values(remind_at=utcnow()))
+        session.commit()
+    report = drain_due_reminders(db_session_module.session_scope, [notifier], batch_size=2)
+    assert report.fired == len(committed_reminders)
+    assert sorted(reminder.event.id for reminder in notifier.reminders) == committed_reminders
+
+
+def test_notifiers_run_after_the_claim_is_committed(committed_reminders: list[int]) -> None:
+    now = utcnow() + timedelta(hours=1)
+    leases: list[datetime] = []
+
+    class InspectingNotifier:
+        def notify(self, reminder: Reminder) -> None:
+            with db_session_module.session_scope() as other:
+                # Not locked anymore, NOWAIT would fail otherwise, but leased: other workers find nothing due
+                leased = other.execute(
+                    select(EventReminder).where(EventReminder.event_id == reminder.event.id).with_for_update(nowait=True)
+                ).scalar_one()
+                leases.append(leased.remind_at)
+                other.rollback()
+                assert process_due_reminders(other, [CollectingNotifier()], now=now).claimed == 0
+
+    with db_session_module.session_scope() as session:
+        report = process_due_reminders(session, [InspectingNotifier()], now=now)
+        assert report.fired == len(committed_reminders)
+        assert set(reminders(session)).isdisjoint(committed_reminders)
+    assert set(leases) == {now + DEFAULT_REMINDER_LEASE}
+
+
+def test_reminders_rescheduled_while_notified_are_kept(db_session: Session) -> None:
+    event = schedule(db_session, "moved", due_in=timedelta(minutes=5))
+    later = utcnow() + timedelta(days=3)
+
+    class ReschedulingNotifier:
+        def notify(self, reminder: Reminder) -> None:
+            db_session.execute(update(Event).where(Event.id == reminder.event.id).values(due_at=later))
+
+    report = process_due_reminders(db_session, [ReschedulingNotifier()], now=utcnow() + timedelta(hours=1))
+    assert report.fired == 1
+    assert reminders(db_session)[event.id].remind_at == later
+
+
+def test_orphaned_reminders_count_as_claimed(db_session: Session) -> None:
+    now = utcnow()
+    db_session.add(EventReminder(event_id=10**9, event_created_at=now, remind_at=now))
+    db_session.flush()
+    report = process_due_reminders(db_session, [CollectingNotifier()], batch_size=1, now=now)
+    assert (report.orphaned, report.claimed) == (1, 1)
+    assert reminders(db_session) == {}
+
+
+def make_reminder(now: datetime) -> Reminder:
+    event = {
+        "id": 7,
+        "created_at": now,
+        "kind": "action",
+        "text": "call back",
+        "why": None,
+        "source": None,
+        "tags": [],
+        "meta": {},
+        "due_at": now,
+        "completed_at": None,
+    }
+    return Reminder.model_validate({"event": event, "remind_at": now, "attempts": 0})
+
+
+def test_stdout_and_file_notifiers(tmp_path: Path) -> None:
+    reminder = make_reminder(utcnow())
+    stream = io.StringIO()
+    StdoutNotifier(stream).notify(reminder)
+    assert "#7  [action]  call back" in stream.getvalue()
+
+    path = tmp_path / "reminders.ndjson"
+    notifier = FileNotifier(path)
+    notifier.notify(reminder)
+    notifier.notify(reminder)
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["event"]["id"] for line in lines] == [7, 7]
+
+
+def test_webhook_notifier() -> None:
+    received: list[dict[str, object]] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204 if self.path == "/ok" else 500)
+            self.end_headers()
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        WebhookNotifier(f"{url}/ok").notify(make_reminder(utcnow()))
+        with pytest.raises(OSError, match="500"):
+            WebhookNotifier(f"{url}/broken").notify(make_reminder(utcnow()))
+    finally:
+        server.shutdown()
+    assert [payload["event"]["text"] for payload in received] == ["call back", "call back"]  # type: ignore[index]
+
+
+def test_notifier_from_spec() -> None:
+    assert isinstance(notifier_from_spec("stdout"), StdoutNotifier)
+    assert isinstance(notifier_from_spec("file:/tmp/reminders.ndjson"), FileNotifier)
+    assert isinstance(notifier_from_spec("webhook:https://example.com/hook"), WebhookNotifier)
+    for spec in ("email:me@example.com", "file:", "webhook:ftp://example.com"):
+        with pytest.raises(ValueError, match=r"notifier|Webhook"):
+            notifier_from_spec(spec)
@@ -0,0 +1,94 @@
+import io
+import json
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventCreate, EventKind
+from poppy.core.formats import ImportFormat
+from poppy.db.models import Event, EventWeeklyRollup
+from poppy.services.event_handlers import (
+    create_event,
+    create_events_bulk,
+    mark_event_completed,
+)
+from poppy.services.importer import import_events
+from poppy.services.rollups import (
+    align_to_weeks,
+    list_weekly_rollups,
+    rebuild_weekly_rollups,
+)
+from poppy.services.utils import week_bounds
+
+MONDAY = datetime(2026, 3, 2, tzinfo=UTC)
+
+
+def summary(session: Session) -> list[tuple[datetime, str, int, int, dict[str, int]]]:
+    return [
+        (rollup.week_start, rollup.kind, rollup.event_count, rollup.completed_count, rollup.tag_counts)
+        for rollup in list_weekly_rollups(session)
+    ]
+
+
+def test_align_to_weeks() -> None:
+    assert align_to_weeks(None, None) == (None, None)
+    assert align_to_weeks(MONDAY + timedelta(days=2), MONDAY + timedelta(days=8)) == (MONDAY, MONDAY + timedelta(days=14))
+    # Week starts are kept, naive datetimes are UTC ones
+    assert align_to_weeks(MONDAY, datetime(2026, 3, 9)) == (MONDAY, MONDAY + timedelta(days=7))  # noqa: DTZ001
+
+
+def test_rollups_follow_the_writes(db_session: Session) -> None:
+    this_week = week_bounds()[0]
+    note = create_event(db_session, EventCreate(kind=EventKind.note, text="note", tags=["a", "b"]))
+    action = create_event(db_session, EventCreate(kind=EventKind.action, text="action", tags=["a"]))
+    create_events_bulk(db_session, [EventCreate(kind=EventKind.note, text=f"bulk {i}", tags=["b"]) for i in range(3)])
+    assert summary(db_session) == [
+        (this_week, "action", 1, 0, {"a": 1}),
+        (this_week, "note", 4, 0, {"a": 1, "b": 4}),
+    ]
+
+    mark_event_completed(db_session, str(action.id))
+    # Edits which do not change the counts leave the rollups alone, tags which are not used anymore are dropped
+    db_session.execute(update(Event).where(Event.id == note.id).values(text="edited", tags=["c"]))
+    assert summary(db_session) == [
+        (this_week, "action", 1, 1, {"a": 1}),
+        (this_week, "note", 4, 0, {"b": 3, "c": 1}),
+    ]
+
+    # Moving an event to another week and kind
+    db_session.execute(update(Event).where(Event.id == note.id).values(kind="idea", created_at=MONDAY))
+    db_session.execute(delete(Event).where(Event.id == action.id))
+    assert summary(db_session) == [
+        (MONDAY, "idea", 1, 0, {"c": 1}),
+        (this_week, "note", 3, 0, {"b": 3}),
+    ]
+
+
+def test_rollups_count_imported_events(db_session: Session) -> None:
+    lines = [
+        json.dumps({"kind": "note", "text": f"line {i}", "tags": ["imported"], "created_at": (MONDAY + timedelta(days=i)).isoformat()})
+        for i in range(10)
+    ]
+    import_events(db_session, io.StringIO("\n".join(lines)), ImportFormat.ndjson, batch_size=4)
+    assert summary(db_session) == [
+        (MONDAY, "note", 7, 0, {"imported": 7}),
+        (MONDAY + timedelta(days=7), "note", 3, 0, {"imported": 3}),
+    ]
+
+
+def test_rebuild_weekly_rollups(db_session: Session) -> None:
+    db_session.add_all([
+        Event(kind="note", text="first", tags=["x"], meta={}, created_at=MONDAY),
+        Event(kind="action", text="second", tags=["x", "y"], meta={}, created_at=MONDAY, completed_at=MONDAY),
+        Event(kind="note", text="third", tags=[], meta={}, created_at=MONDAY + timedelta(days=7)),
+    ])
+    db_session.commit()
+    incremental = summary(db_session)
+
+    db_session.execute(update(EventWeeklyRollup).values(event_count=0, completed_count=0, tag_counts={}))
+    # Only the weeks in the range are rebuilt
+    assert rebuild_weekly_rollups(db_session, MONDAY + timedelta(days=3), MONDAY + timedelta(days=4)) == 2
+    assert summary(db_session) == incremental[:2]
+    assert rebuild_weekly_rollups(db_session) == 3
+    assert summary(db_session) == incremental
@@ -0,0 +1,72 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventKind, EventRead
+from poppy.db.models import Event
+from poppy.services.search import InMemorySearchIndex, search_events
+
+
+@pytest.fixture
+def searchable_events(db_session: Session) -> list[Event]:
+    now = datetime.now(UTC)
+    events = [
+        Event(kind="decision", text="Use Postgres for storage", why="it is fast and boring", tags=["db"], meta={}, created_at=now - timedelta(days=30)),
+        Event(kind="note", text="Meeting notes about storage costs", tags=["meetings"], meta={}, created_at=now - timedelta(days=2)),
+        Event(kind="idea", text="Benchmark the importer", why="storage might be slow", tags=["db", "perf"], meta={}, created_at=now - timedelta(days=1)),
+    ]
+    db_session.add_all(events)
+    db_session.commit()
+    return events
+
+
+def test_search_ranks_text_over_why_and_tags(db_session: Session, searchable_events: list[Event]) -> None:
+    decision, meeting, idea = searchable_events
+    hits = search_events(db_session, "storage")
+    assert {hit.id for hit in hits[:2]} == {decision.id, meeting.id}
+    # Only in `why`, ranked last
+    assert hits[-1].id == idea.id
+    assert hits[0].rank > hits[-1].rank
+    assert "<b>storage</b>" in hits[0].headline
+
+    # Words are stemmed, and tags are searched too
+    assert [hit.id for hit in search_events(db_session, "benchmarking")] == [idea.id]
+    assert [hit.id for hit in search_events(db_session, "meetings")] == [meeting.id]
+
+
+def test_search_syntax_and_filters(db_session: Session, searchable_events: list[Event]) -> None:
+    decision, meeting, idea = searchable_events
+    assert [hit.id for hit in search_events(db_session, '"postgres for storage"')] == [decision.id]
+    assert {hit.id for hit in search_events(db_session, "storage -meeting")} == {decision.id, idea.id}
+    assert {hit.id for hit in search_events(db_session, "postgres or benchmark")} == {decision.id, idea.id}
+
+    assert [hit.id for hit in search_events(db_session, "storage", kind=EventKind.note)] == [meeting.id]
+    assert [hit.id for hit in search_events(db_session, "storage", tags=["db", "perf"])] == [idea.id]
+    assert {hit.id for hit in search_events(db_session, "storage", start=meeting.created_at)} == {meeting.id, idea.id}
+    assert [hit.id for hit in search_events(db_session, "storage", end=meeting.created_at)] == [decision.id]
+    assert len(search_events(db_session, "storage", limit=1)) == 1
+    assert search_events(db_session, "the") == []
+
+
+def test_in_memory_search_index() -> None:
+    now = datetime.now(UTC)
+    events = [
+        EventRead(id=1, created_at=now, kind="note", text="Storage costs", why=None, source=None, tags=["db"], meta={}, due_at=None, completed_at=None),
+        EventRead(id=2, created_at=now, kind="idea", text="Faster import", why="storage is slow", source=None, tags=[], meta={}, due_at=None, completed_at=None),
+    ]
+    index = InMemorySearchIndex(events)
+    hits = index.search("storage", highlight=("[", "]"))
+    assert [hit.id for hit in hits] == [1, 2]
+    assert hits[0].headline == "[Storage] costs"
+    assert hits[1].headline == "Faster import | [storage] is slow"
+    assert [hit.id for hit in index.search("storage -slow")] == [1]
+    assert [hit.id for hit in index.search("DB")] == [1]
+    assert index.search("storage import")[0].id == 2
+    assert index.search("-storage") == []
+
+    index.remove(1)
+    assert len(index) == 1
+    assert [hit.id for hit in index.search("storage")] == [2]
+    index.add(events[1].model_copy(update={"text": "Renamed"}))
+    assert index.search("import") == []
@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Engine, create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from poppy.core.settings import Settings
+from poppy.db.metrics import render_prometheus
+from poppy.db.session import (
+    _set_statement_timeout_per_transaction,
+    engine_options,
+    init_async_db_engine_and_sessionmaker,
+)
+
+
+def test_settings_read_from_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DB_POOL_SIZE", "17")
+    monkeypatch.setenv("DB_PGBOUNCER", "true")
+    settings = Settings(_env_file=None)
+    assert settings.db_pool_size == 17
+    assert settings.db_pgbouncer is True
+    assert settings.db_pool_pre_ping is True
+
+
+def test_engine_options() -> None:
+    options = engine_options(Settings(_env_file=None, db_statement_timeout_ms=500), QueuePool)
+    assert options["connect_args"] == {"options": "-c statement_timeout=500"}
+
+    # PgBouncer mode never prepares statements, nor sends startup options
+    options = engine_options(Settings(_env_file=None, db_pgbouncer=True, db_statement_timeout_ms=500), QueuePool)
+    assert options["connect_args"] == {"prepare_threshold": None}
+
+
+def test_statement_timeout_is_applied(postgres_url: str) -> None:
+    for pgbouncer in (False, True):
+        settings = Settings(_env_file=None, db_statement_timeout_ms=1234, db_pgbouncer=pgbouncer)
+        engine = create_engine(postgres_url, **engine_options(settings, QueuePool))
+        if pgbouncer:
+            _set_statement_timeout_per_transaction(engine, 1234)
+        with engine.connect() as connection:
+            assert connection.execute(text("SHOW statement_timeout")).scalar() == "1234ms"
+        engine.dispose()
+
+
+def test_pool_metrics_record_checkouts_and_timeouts(postgres_url: str) -> None:
+    settings = Settings(_env_file=None, db_pool_size=1, db_max_overflow=0, db_pool_timeout=0.05)
+    engine: Engine = create_engine(postgres_url, **engine_options(settings, QueuePool))
+    with engine.connect(), pytest.raises(exc.TimeoutError), engine.connect():
+        pass
+
+    metrics = engine.pool.pool_metrics
+    assert metrics.checkouts == 1
+    assert metrics.checkout_timeouts == 1
+    assert metrics.checkout_seconds_max >= 0.05
+
+    # The metrics survive the pool being recreated
+    engine.dispose()
+    assert engine.pool.pool_metrics is metrics
+
+    rendered = render_prometheus({"test": engine.pool})
+    assert 'poppy_db_pool_checkouts_total{engine="test"} 1' in rendered
+    assert 'poppy_db_pool_checkout_timeouts_total{engine="test"} 1' in rendered
+    assert 'poppy_db_pool_size{engine="test"} 1' in rendered
+    assert "# TYPE poppy_db_pool_overflow gauge" in rendered
+
+
+def test_async_engine_refuses_sqlite(tmp_path: Path) -> None:
+    with pytest.raises(RuntimeError, match="The API requires PostgreSQL"):
+        init_async_db_engine_and_sessionmaker(database_url=f"sqlite:///{tmp_path / 'poppy.db'}")
@@ -0,0 +1,111 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from poppy.core.events import EventKind
+from poppy.core.stats import StatsPeriod
+from poppy.db.models import Event, EventWeeklyRollup
+from poppy.services.stats import (
+    count_events_per_period_and_kind,
+    count_tags,
+    get_action_stats,
+    get_event_stats,
+)
+
+MONDAY = datetime(2026, 3, 2, tzinfo=UTC)
+
+
+def add_history(session: Session) -> None:
+    def event(kind: str, created_at: datetime, **fields: datetime) -> Event:
+        return Event(kind=kind, text=kind, tags=[], meta={}, created_at=created_at, **fields)
+
+    session.add_all([
+        event("note", MONDAY),
+        event("note", MONDAY + timedelta(days=6, hours=23)),
+        event("idea", MONDAY + timedelta(days=1)),
+        event("note", MONDAY + timedelta(days=7)),
+        # Completed in 2 and 4 hours
+        event("action", MONDAY, due_at=MONDAY + timedelta(days=1), completed_at=MONDAY + timedelta(hours=2)),
+        event("action", MONDAY + timedelta(days=8), completed_at=MONDAY + timedelta(days=8, hours=4)),
+        # Pending, one is overdue
+        event("action", MONDAY + timedelta(days=8), due_at=MONDAY + timedelta(days=9)),
+        event("action", MONDAY + timedelta(days=8), due_at=MONDAY + timedelta(days=30)),
+        # Not pending, it has no due date
+        event("action", MONDAY + timedelta(days=9)),
+    ])
+    session.commit()
+
+
+@pytest.fixture
+def history(any_db_session: Session) -> None:
+    add_history(any_db_session)
+
+
+@pytest.mark.usefixtures("history")
+def test_count_events_per_period_and_kind(any_db_session: Session) -> None:
+    counts = count_events_per_period_and_kind(any_db_session, period=StatsPeriod.week)
+    assert [(count.period_start, count.kind, count.count) for count in counts] == [
+        (MONDAY, "action", 1),
+        (MONDAY, "idea", 1),
+        (MONDAY, "note", 2),
+        (MONDAY + timedelta(days=7), "action", 4),
+        (MONDAY + timedelta(days=7), "note", 1),
+    ]
+    counts = count_events_per_period_and_kind(any_db_session, MONDAY + timedelta(days=1), period=StatsPeriod.month)
+    assert [(count.period_start, count.kind, count.count) for count in counts] == [
+        (datetime(2026, 3, 1, tzinfo=UTC), "action", 4),
+        (datetime(2026, 3, 1, tzinfo=UTC), "idea", 1),
+        (datetime(2026, 3, 1, tzinfo=UTC), "note", 2),
+    ]
+
+
+@pytest.mark.usefixtures("history")
+def test_get_action_stats(any_db_session: Session) -> None:
+    actions = get_action_stats(any_db_session, now=MONDAY + timedelta(days=10))
+    assert (actions.total, actions.completed, actions.pending, actions.overdue) == (5, 2, 2, 1)
+    assert actions.completion_rate == pytest.approx(0.4)
+    assert actions.avg_seconds_to_complete == pytest.approx(3 * 3600)
+
+    empty = get_action_stats(any_db_session, end=MONDAY)
+    assert (empty.total, empty.completion_rate, empty.avg_seconds_to_complete) == (0, None, None)
+
+
+@pytest.mark.usefixtures("history")
+def test_get_event_stats(any_db_session: Session) -> None:
+    stats = get_event_stats(any_db_session, MONDAY, MONDAY + timedelta(days=7), period=StatsPeriod.year)
+    assert [(count.kind, count.count) for count in stats.counts] == [("action", 1), ("idea", 1), ("note", 2)]
+    assert stats.actions.total == 1
+
+
+def test_weekly_counts_are_read_from_the_rollups(db_session: Session) -> None:
+    add_history(db_session)
+    db_session.execute(
+        update(EventWeeklyRollup)
+        .where(EventWeeklyRollup.week_start == MONDAY, EventWeeklyRollup.kind == "idea")
+        .values(event_count=42)
+    )
+    counts = count_events_per_period_and_kind(db_session, MONDAY, MONDAY + timedelta(days=7))
+    assert [(count.kind, count.count) for count in counts] == [("action", 1), ("idea", 42), ("note", 2)]
+    # Ranges which do not cover whole weeks are counted from the events
+    counts = count_events_per_period_and_kind(db_session, MONDAY + timedelta(hours=1), MONDAY + timedelta(days=7))
+    assert [(count.kind, count.count) for count in counts] == [("idea", 1), ("note", 1)]
+
+
+def test_count_tags(any_db_session: Session) -> None:
+    any_db_session.add_all([
+        Event(kind="note", text="a", tags=["work", "urgent"], meta={}, created_at=MONDAY),
+        Event(kind="action", text="b", tags=["work"], meta={}, created_at=MONDAY + timedelta(days=1)),
+        Event(kind="note", text="c", tags=["home"], meta={}, created_at=MONDAY + timedelta(days=7)),
+        Event(kind="note", text="d", tags=[], meta={}, created_at=MONDAY),
+    ])
+    any_db_session.commit()
+
+    def counts(**filters: object) -> list[tuple[str, int]]:
+        return [(count.tag, count.count) for count in count_tags(any_db_session, **filters)]
+
+    assert counts() == [("work", 2), ("home", 1), ("urgent", 1)]
+    assert counts(limit=1) == [("work", 2)]
+    assert counts(kind=EventKind.note) == [("home", 1), ("urgent", 1), ("work", 1)]
+    assert counts(start=MONDAY + timedelta(days=7)) == [("home", 1)]
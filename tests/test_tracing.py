@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from poppy.api.tracing import parse_request_start
+from poppy.core.settings import get_settings
+from poppy.core.tracing import (
+    export_trace,
+    record_span,
+    server_timing,
+    span,
+    to_otlp_json,
+    tracing,
+)
+from poppy.db.models import Event
+
+
+@pytest.mark.parametrize(
+    ("value", "expected_ns"),
+    [
+        ("t=1700000000.5", 1_700_000_000_500_000_000),
+        ("1700000000500", 1_700_000_000_500_000_000),
+        ("t=1700000000500000", 1_700_000_000_500_000_000),
+        ("garbage", None),
+    ],
+)
+def test_parse_request_start(value: str, expected_ns: int | None) -> None:
+    assert parse_request_start(value) == expected_ns
+
+
+def test_spans_are_only_recorded_while_tracing() -> None:
+    record_span("db", 0, 1)
+    with tracing("GET /event") as trace:
+        record_span("db", 0, 2_000_000, statement="SELECT 1", rows=1)
+        record_span("db", 0, 1_000_000, statement="SELECT 2", rows=1)
+        with span("serialize"):
+            pass
+    assert [span_.name for span_ in trace.spans] == ["db", "db", "serialize"]
+    assert trace.totals()["db"] == (3.0, 2)
+    header = server_timing(trace)
+    assert header.startswith('db;dur=3.000;desc="2 queries", serialize;dur=')
+    assert ", total;dur=" in header
+
+
+def test_otlp_spans_are_children_of_a_root_span(tmp_path: Path) -> None:
+    trace_file = tmp_path / "traces.jsonl"
+    with tracing("GET /event", **{"http.method": "GET"}) as trace:
+        record_span("db", trace.start_ns, trace.start_ns + 1000, statement="SELECT 1", rows=1)
+    export_trace(trace, trace_file)
+    export_trace(trace, trace_file)
+    lines = trace_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["resourceSpans"][0]["resource"] == to_otlp_json(trace)["resourceSpans"][0]["resource"]
+    root, statement = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert root["name"] == "GET /event"
+    assert root["parentSpanId"] == ""
+    assert statement["parentSpanId"] == root["spanId"]
+    assert statement["traceId"] == root["traceId"] == trace.trace_id
+    assert {"key": "rows", "value": {"intValue": "1"}} in statement["attributes"]
+
+
+def test_statements_are_recorded_with_their_row_count(db_session: Session) -> None:
+    db_session.add_all([Event(kind="note", text="one"), Event(kind="note", text="two")])
+    db_session.commit()
+    with tracing("test") as trace:
+        assert len(db_session.scalars(select(Event)).all()) == 2
+    (statement,) = (span_ for span_ in trace.spans if span_.name == "db")
+    assert statement.attributes["statement"].startswith("SELECT events.id")
+    assert statement.attributes["rows"] == 2
+
+
+def test_api_sends_server_timing_and_writes_traces(
+    test_client: TestClient, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    response = test_client.get("/event/week")
+    assert "server-timing" not in response.headers
+
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(get_settings(), "tracing_enabled", True)
+    monkeypatch.setattr(get_settings(), "trace_file", trace_file)
+    test_client.post("/event", json={"kind": "note", "text": "traced"})
+    response = test_client.get("/event/week", headers={"X-Request-Start": "t=1700000000.0"})
+    assert response.status_code == 200
+    metrics = {metric.split(";")[0] for metric in response.headers["server-timing"].split(", ")}
+    assert {"queue", "db", "load", "serialize", "total"} <= metrics
+
+    (_, week) = (json.loads(line) for line in trace_file.read_text().splitlines())
+    root = week["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert root["name"] == "GET /event/week"
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+
+
+def test_cli_profile_prints_the_statements(tmp_path: Path) -> None:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'poppy.db'}"}
+    process = subprocess.run(
+        [sys.executable, "-c", "from poppy.cli.main import app; app()", "--profile", "week"],
+        capture_output=True, text=True, timeout=60, check=False, env=env,
+    )
+    assert process.returncode == 0, process.stderr
+    assert "Profile of poppy week:" in process.stderr
+    assert "SELECT events.id" in process.stderr
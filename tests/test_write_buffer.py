@@ -0,0 +1,144 @@
+import asyncio
+import gc
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import poppy.db.session as db_session_module
+import poppy.services.write_buffer as write_buffer_module
+from poppy.api.app import app
+from poppy.core.events import EventCreate
+from poppy.core.settings import WriteDurability
+from poppy.core.tracing import tracing
+from poppy.services.write_buffer import WriteBuffer, write_batch
+
+T = TypeVar("T")
+AsyncRunner = Callable[[Callable[[AsyncSession], Awaitable[T]]], T]
+
+
+def counting_scope(session: AsyncSession, batches: list[int]) -> Callable[[], Any]:
+    """Open `session` for each batch, counting the batches, and roll it back like a closed session on errors."""
+    @asynccontextmanager
+    async def scope() -> AsyncGenerator[AsyncSession, None]:
+        batches.append(1)
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
+    return scope
+
+
+def note(text: str, **fields: Any) -> EventCreate:
+    return EventCreate(kind="note", text=text, **fields)
+
+
+def test_concurrent_events_share_batches(run_with_async_session: AsyncRunner[Any]) -> None:
+    batches: list[int] = []
+
+    async def scenario(session: AsyncSession) -> list[Any]:
+        buffer = WriteBuffer(counting_scope(session, batches), max_delay=0.5, max_batch=10)
+        rows = await asyncio.gather(*(buffer.submit(note(f"note {i}")) for i in range(25)))
+        await buffer.close()
+        return rows
+
+    rows = run_with_async_session(scenario)
+    assert [row.text for row in rows] == [f"note {i}" for i in range(25)]
+    assert len({row.id for row in rows}) == 25
+    assert len(batches) == 3
+
+
+def test_a_lone_event_waits_at_most_max_delay(run_with_async_session: AsyncRunner[Any]) -> None:
+    async def scenario(session: AsyncSession) -> float:
+        buffer = WriteBuffer(counting_scope(session, []), max_delay=0.01, max_batch=1000)
+        started = asyncio.get_running_loop().time()
+        await buffer.submit(note("alone"))
+        elapsed = asyncio.get_running_loop().time() - started
+        await buffer.close()
+        return elapsed
+
+    assert run_with_async_session(scenario) < 1
+
+
+def test_a_bad_event_only_fails_its_own_request(run_with_async_session: AsyncRunner[Any]) -> None:
+    batches: list[int] = []
+
+    async def scenario(session: AsyncSession) -> list[Any]:
+        buffer = WriteBuffer(counting_scope(session, batches), max_delay=0.5, max_batch=10)
+        # Longer than the `source` column
+        payloads = [note("fine"), note("too long", source="x" * 100), note("fine too")]
+        results = await asyncio.gather(*(buffer.submit(payload) for payload in payloads), return_exceptions=True)
+        await buffer.close()
+        return results
+
+    fine, failed, fine_too = run_with_async_session(scenario)
+    assert (fine.text, fine_too.text) == ("fine", "fine too")
+    assert isinstance(failed, Exception)
+    # The batch, then each of its events
+    assert len(batches) == 4
+
+
+def test_the_error_of_a_cancelled_request_is_logged(
+    run_with_async_session: AsyncRunner[Any], caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Disabled by the logging configuration of the migrations
+    monkeypatch.setattr(write_buffer_module.logger, "disabled", False)
+
+    async def scenario(session: AsyncSession) -> list[dict[str, Any]]:
+        unhandled: list[dict[str, Any]] = []
+        asyncio.get_running_loop().set_exception_handler(lambda _, context: unhandled.append(context))
+        buffer = WriteBuffer(counting_scope(session, []), max_delay=0.05)
+        request = asyncio.create_task(buffer.submit(note("too long", source="x" * 100)))
+        await asyncio.sleep(0)
+        request.cancel()
+        await buffer.close()
+        # Lets the done callbacks run, then collects the future of the event like once the request is gone
+        await asyncio.sleep(0)
+        del request
+        gc.collect()
+        return unhandled
+
+    assert run_with_async_session(scenario) == []
+    assert "Could not write a buffered event whose request was cancelled" in caplog.text
+
+
+def test_closed_buffer_refuses_events(run_with_async_session: AsyncRunner[Any]) -> None:
+    async def scenario(session: AsyncSession) -> None:
+        buffer = WriteBuffer(counting_scope(session, []))
+        await buffer.close()
+        with pytest.raises(RuntimeError, match="closed"):
+            await buffer.submit(note("late"))
+
+    run_with_async_session(scenario)
+
+
+@pytest.mark.parametrize("durability", list(WriteDurability))
+def test_relaxed_durability_turns_off_synchronous_commit(db_session: Session, durability: WriteDurability) -> None:
+    with tracing("test") as trace:
+        rows = write_batch(db_session, [note("one"), note("two")], durability)
+    statements = [span.attributes["statement"] for span in trace.spans if span.name == "db"]
+    assert any("synchronous_commit" in statement for statement in statements) == (durability == WriteDurability.relaxed)
+    assert [row.text for row in rows] == ["one", "two"]
+
+
+def test_api_creates_events_through_the_write_buffer(test_client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Writes in the isolated session of the test client
+    session_scope = asynccontextmanager(app.dependency_overrides[db_session_module.get_async_db_connection])
+    buffer = WriteBuffer(session_scope, max_delay=0.01)
+    monkeypatch.setattr(app.state, "write_buffer", buffer)
+
+    response = test_client.post("/event", json={"kind": "idea", "text": "buffered", "tags": ["fast"]})
+    assert response.status_code == 201
+    created = response.json()
+    assert (created["kind"], created["text"], created["tags"]) == ("idea", "buffered", ["fast"])
+    assert buffer.pending == 0
+    test_client.portal.call(buffer.close)
+
+    week = test_client.get("/event/week").json()
+    assert [event["id"] for event in week] == [created["id"]]